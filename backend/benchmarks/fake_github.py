@@ -0,0 +1,170 @@
+"""
+In-process stand-in for the parts of the GitHub REST API the service uses.
+
+FakeGitHub serves a synthetic repository of any size, plus one pull request
+touching a configurable share of its files, through an httpx transport. It
+can add per-request latency and enforce a rate limit with the same
+X-RateLimit-* headers and 403 responses as GitHub, so fetch benchmarks see
+realistic pacing without touching the network.
+"""
+
+import io
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import tarfile
+from typing import Dict, List, Optional
+
+import httpx
+
+OWNER = "bench"
+REPO = "synthetic"
+PR_NUMBER = 1
+# GitHub lists at most this many files for a pull request
+PR_FILES_LIMIT = 3000
+
+def synthetic_source(index: int, lines: int) -> str:
+    """Python-looking module of roughly `lines` lines, unique per index"""
+    body = [f'"""Synthetic module {index} generated for benchmarks."""', "", "import os", "import json", ""]
+    function = 0
+    while len(body) < lines:
+        body.extend([
+            f"def handler_{index}_{function}(payload, retries=3):",
+            f'    """Process payload number {function} of module {index}."""',
+            "    result = []",
+            "    for item in payload.get('items', []):",
+            "        if item is None:",
+            "            continue",
+            f"        result.append(json.dumps(item) + str({function}))",
+            "    return result",
+            "",
+        ])
+        function += 1
+    return "\n".join(body[:lines]) + "\n"
+
+def blob_sha(content: bytes) -> str:
+    """Git's object id for a blob"""
+    return hashlib.sha1(b"blob " + str(len(content)).encode() + b"\0" + content).hexdigest()
+
+class FakeGitHub:
+    def __init__(self, files: int, lines_per_file: int = 60, pr_share: float = 0.2,
+                 latency_seconds: float = 0.0, rate_limit: int = 0, rate_window_seconds: float = 1.0):
+        """
+        Repository of `files` files; the pull request modifies pr_share of them.
+        rate_limit > 0 allows that many requests per rate_window_seconds.
+        """
+        self.latency_seconds = latency_seconds
+        self.rate_limit = rate_limit
+        self.rate_window_seconds = rate_window_seconds
+        self.requests = 0
+        self._window_start = time.time()
+        self._window_used = 0
+
+        self.contents: Dict[str, bytes] = {}
+        for index in range(files):
+            path = f"pkg{index // 50}/module_{index}.py"
+            self.contents[path] = synthetic_source(index, lines_per_file).encode("utf-8")
+        self.shas = {path: blob_sha(content) for path, content in self.contents.items()}
+        self.by_sha = {sha: self.contents[path] for path, sha in self.shas.items()}
+        self.head_sha = hashlib.sha1("".join(sorted(self.shas.values())).encode()).hexdigest()
+
+        pr_paths = list(self.contents)[:max(1, int(files * pr_share))][:PR_FILES_LIMIT]
+        self.pr_files = [self._pr_file(path, i) for i, path in enumerate(pr_paths)]
+        self._tarball: Optional[bytes] = None
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _pr_file(self, path: str, index: int) -> Dict[str, object]:
+        added = index % 10 == 0
+        lines = self.contents[path].decode("utf-8").splitlines()
+        if added:
+            patch = f"@@ -0,0 +1,{len(lines)} @@\n" + "\n".join("+" + line for line in lines)
+        else:
+            start = 6 + (index % 20)
+            patch = (f"@@ -{start},3 +{start},4 @@\n {lines[start - 1]}\n-    result = None\n"
+                     f"+    result = []\n+    seen = set()\n {lines[start]}")
+        return {
+            "filename": path,
+            "status": "added" if added else "modified",
+            "sha": self.shas[path],
+            "patch": patch,
+        }
+
+    def _tarball_bytes(self) -> bytes:
+        if self._tarball is None:
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+                for path, content in self.contents.items():
+                    info = tarfile.TarInfo(f"{OWNER}-{REPO}-{self.head_sha[:7]}/{path}")
+                    info.size = len(content)
+                    tar.addfile(info, io.BytesIO(content))
+            self._tarball = archive.getvalue()
+        return self._tarball
+
+    def _rate_headers(self) -> Dict[str, str]:
+        if not self.rate_limit:
+            return {}
+        return {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(self.rate_limit - self._window_used, 0)),
+            "X-RateLimit-Reset": str(self._window_start + self.rate_window_seconds),
+        }
+
+    def _json(self, request: httpx.Request, payload, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        body = json.dumps(payload).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers = {**(headers or {}), **self._rate_headers(), "ETag": etag, "Content-Type": "application/json"}
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, content=body, headers=headers)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+
+        if self.rate_limit:
+            now = time.time()
+            if now - self._window_start >= self.rate_window_seconds:
+                self._window_start, self._window_used = now, 0
+            if self._window_used >= self.rate_limit:
+                return httpx.Response(403, headers=self._rate_headers(),
+                                      json={"message": "API rate limit exceeded"})
+            self._window_used += 1
+
+        prefix = f"/repos/{OWNER}/{REPO}"
+        path = request.url.path
+        if path == prefix:
+            return self._json(request, {"default_branch": "main", "full_name": f"{OWNER}/{REPO}"})
+        if path.startswith(f"{prefix}/commits/"):
+            return httpx.Response(200, text=self.head_sha, headers=self._rate_headers())
+        if path == f"{prefix}/pulls/{PR_NUMBER}":
+            return self._json(request, {"number": PR_NUMBER, "head": {"sha": self.head_sha}})
+        if path == f"{prefix}/pulls/{PR_NUMBER}/files":
+            return self._pr_files_page(request)
+        if path.startswith(f"{prefix}/git/trees/"):
+            tree = [{"path": p, "type": "blob", "sha": sha, "size": len(self.contents[p])}
+                    for p, sha in self.shas.items()]
+            return self._json(request, {"sha": self.head_sha, "tree": tree, "truncated": False})
+        if path.startswith(f"{prefix}/git/blobs/"):
+            content = self.by_sha.get(path.rsplit("/", 1)[-1])
+            if content is None:
+                return httpx.Response(404, json={"message": "Not Found"})
+            return self._json(request, {"size": len(content), "encoding": "base64",
+                                        "content": base64.b64encode(content).decode("ascii")})
+        if path.startswith(f"{prefix}/tarball/"):
+            return httpx.Response(200, content=self._tarball_bytes(), headers=self._rate_headers())
+        return httpx.Response(404, json={"message": "Not Found"})
+
+    def _pr_files_page(self, request: httpx.Request) -> httpx.Response:
+        per_page = int(request.url.params.get("per_page", 30))
+        page = int(request.url.params.get("page", 1))
+        files: List[Dict[str, object]] = self.pr_files[(page - 1) * per_page:page * per_page]
+        headers = {}
+        if page * per_page < len(self.pr_files):
+            next_url = request.url.copy_merge_params({"page": page + 1, "per_page": per_page})
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return self._json(request, files, headers)
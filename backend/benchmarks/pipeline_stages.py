@@ -0,0 +1,123 @@
+"""
+Time spent in each stage of the review pipeline.
+
+Reviews run through review_pipeline.ReviewPipeline against FakeGitHub and the
+offline LLM backend, and the per-stage times each run records are reported
+as p50/p95. parse runs inside call, so its time is also part of call's.
+
+With --stage the stages before it run once to set up a review, and only that
+stage is then repeated, e.g. to see what prompt building costs without the
+GitHub round trips around it.
+
+Usage (from backend/):
+    python benchmarks/pipeline_stages.py --files 1000
+    python benchmarks/pipeline_stages.py --files 1000 --stage prompt --iterations 20
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub, OWNER, REPO, PR_NUMBER
+from run import percentile
+from blob_cache import BlobCache
+from github_service import GithubService
+from llm_backends import OfflineBackend
+from llm_service import LLMService
+from review_pipeline import ReviewPipeline, ReviewRun, STAGES
+from review_parser import ReviewStreamParser
+from models import ReviewSettings
+
+# The stages a review runs, in order; parse runs inside call
+REVIEW_ORDER = [name for name in STAGES if name != "parse"]
+
+def _pipeline(fake: FakeGitHub, files: int, llm_latency: float) -> ReviewPipeline:
+    github_service = GithubService("bench-token", transport=fake.transport(), max_repo_files=files)
+    llm_service = LLMService(backend=OfflineBackend(llm_latency))
+    llm_service.review_cache = None
+    return ReviewPipeline(github_service, llm_service)
+
+def _new_run(repo: bool) -> ReviewRun:
+    url = f"https://github.com/{OWNER}/{REPO}" + ("" if repo else f"/pull/{PR_NUMBER}")
+    return ReviewRun(url, ReviewSettings(max_issues=10))
+
+def _summary(name: str, seconds: List[float]) -> Dict[str, Any]:
+    return {
+        "stage": name,
+        "runs": len(seconds),
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 0.95) * 1000, 3),
+    }
+
+async def _full_reviews(pipeline: ReviewPipeline, iterations: int, repo: bool) -> List[Dict[str, Any]]:
+    timings = []
+    for _ in range(iterations):
+        # Download file contents on every run
+        pipeline.github_service.blob_cache = BlobCache(256 * 1024 * 1024)
+        run = _new_run(repo)
+        await pipeline.review(run)
+        timings.append(run.timings)
+    return [_summary(name, [timing.get(name, 0.0) for timing in timings]) for name in STAGES]
+
+async def _one_stage(pipeline: ReviewPipeline, stage: str, iterations: int, repo: bool) -> List[Dict[str, Any]]:
+    run = _new_run(repo)
+    answers = []
+    parse = pipeline.stages["parse"]
+
+    def recording_parse(run, response, batch, parser):
+        answers.append((response, batch))
+        return parse(run, response, batch, parser)
+
+    pipeline.stages["parse"] = recording_parse
+    async with pipeline.github_service.api_client() as run.client:
+        # Set the review up to the stage, or through call to have answers to parse
+        setup = REVIEW_ORDER[:REVIEW_ORDER.index("call") + 1 if stage == "parse" else REVIEW_ORDER.index(stage)]
+        try:
+            for name in setup:
+                await pipeline.run_stage(name, run)
+        finally:
+            pipeline.stages["parse"] = parse
+        samples = []
+        for _ in range(iterations):
+            pipeline.github_service.blob_cache = BlobCache(256 * 1024 * 1024)
+            run.timings = {}
+            if stage == "parse":
+                # A parser reads one answer; the setup review was not streamed, so a new one starts the same
+                for response, batch in answers:
+                    await pipeline.run_stage("parse", run, response, batch, ReviewStreamParser())
+            else:
+                await pipeline.run_stage(stage, run)
+            samples.append(run.timings[stage])
+    return [_summary(stage, samples)]
+
+def run(files: int = 100, iterations: int = 5, stage: Optional[str] = None, repo: bool = False,
+        github_latency: float = 0.0, llm_latency: float = 0.0) -> List[Dict[str, Any]]:
+    """Per-stage p50/p95 of `iterations` reviews, or of `stage` alone repeated `iterations` times"""
+    pipeline = _pipeline(FakeGitHub(files, latency_seconds=github_latency), files, llm_latency)
+    if stage is None:
+        return asyncio.run(_full_reviews(pipeline, iterations, repo))
+    return asyncio.run(_one_stage(pipeline, stage, iterations, repo))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time each stage of the review pipeline")
+    parser.add_argument("--files", type=int, default=100, help="Files in the fake repository")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--stage", choices=STAGES, help="Time this stage alone")
+    parser.add_argument("--repo", action="store_true", help="Review the whole repository instead of the pull request")
+    parser.add_argument("--github-latency", type=float, default=0.0, help="Seconds added to each GitHub response")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds before each LLM answer")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    for result in run(args.files, args.iterations, args.stage, args.repo, args.github_latency, args.llm_latency):
+        print(f"{result['stage']:<12} p50 {result['p50_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
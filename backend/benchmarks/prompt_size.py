@@ -0,0 +1,145 @@
+"""
+Prompt size of the compact encoding compared with the earlier indented JSON dump.
+
+Reviews are built from a reference corpus: this repository's own backend
+sources as a whole-repository review, and FakeGitHub's pull request in each
+review mode. For every review the prompt is rendered both ways, before any
+batching, and the token estimate used for budgets (chunking.estimate_tokens)
+is reported with the share saved.
+
+Whole-repository reviews do not get smaller: every line of a whole file
+carries its line number, which costs more than the escaped newlines and
+quotes of the JSON dump, so the backend sources come out slightly larger.
+Pull request reviews, sent mostly as diffs and excerpts, do get smaller.
+
+Usage (from backend/):
+    python benchmarks/prompt_size.py
+"""
+
+import os
+import sys
+import json
+import glob
+import asyncio
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub, OWNER, REPO, PR_NUMBER
+from chunking import estimate_tokens
+from github_service import GithubService
+from llm_backends import OfflineBackend
+from llm_service import LLMService
+from models import CodeChange, ReviewMode, ReviewSettings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def legacy_prompt(code_content: Dict[str, Any], settings: ReviewSettings) -> str:
+    """The prompt as it was built before the compact encoding, for comparison"""
+    tone_instructions = {
+        "strict": "Be thorough and critical in your review. Focus on identifying all issues and potential improvements.",
+        "mentor": "Be constructive and educational. Explain issues clearly and provide guidance on how to improve the code.",
+        "neutral": "Provide a balanced review focusing on significant issues while acknowledging good practices."
+    }
+    return f"""
+        You are an expert code reviewer with deep knowledge of software engineering best practices, security, and performance optimization.
+
+        REVIEW TONE: {tone_instructions[settings.tone.value]}
+
+        TASK: Perform a detailed code review of the following files and return a structured analysis.
+        {"Only the changed hunks are shown for pull request files, with excerpts of the surrounding code in 'context'. Focus on the changes; line numbers refer to the new version of each file." if settings.review_mode == ReviewMode.DIFF else ""}
+        {"Pull request files are shown as their diff, the changed functions and classes in 'symbols', the code they call in 'dependencies' and the imports they use; other changed lines appear in 'context'. Focus on the changes; line numbers refer to the new version of each file." if settings.review_mode == ReviewMode.SYMBOLS else ""}
+
+        FILES TO REVIEW:
+        ```
+        {json.dumps(code_content, indent=2)}
+        ```
+
+        INSTRUCTIONS:
+
+        1. Identify up to {settings.max_issues} issues or areas for improvement in the code.
+        2. For each issue, provide:
+           - A clear title describing the issue
+           - The file path and line numbers where the issue occurs
+           - A detailed description of why it's problematic
+           - A specific suggestion for how to fix it
+           - An example of improved code when applicable
+           - Appropriate labels from: security, style, refactor, test_coverage, performance, documentation, bug
+
+        3. {"Suggest test cases for components that lack testing." if settings.include_test_suggestions else ""}
+
+        4. {"Provide a high-level summary of the changes that would be understandable by non-technical stakeholders." if settings.include_summary else ""}
+
+        FORMAT YOUR RESPONSE AS A JSON OBJECT with the following structure:
+        {{
+            "issues": [
+                {{
+                    "title": "Issue title",
+                    "file_path": "path/to/file.ext",
+                    "line_numbers": [23, 24],
+                    "description": "Detailed explanation of the issue",
+                    "suggestion": "How to fix it",
+                    "code_example": "Example code fix",
+                    "labels": ["security", "refactor"]
+                }}
+            ],
+            "test_suggestions": [
+                {{
+                    "file_path": "path/to/file.ext",
+                    "test_description": "What should be tested",
+                    "test_case_example": "Example test code"
+                }}
+            ],
+            "summary": "High-level summary for non-technical stakeholders",
+            "suggested_labels": ["security", "refactor"]
+        }}
+        """
+
+def backend_sources() -> List[CodeChange]:
+    """This repository's backend modules, reviewed as a whole repository"""
+    changes = []
+    for path in sorted(glob.glob(os.path.join(BACKEND_DIR, "*.py"))):
+        with open(path, encoding="utf-8") as f:
+            changes.append(CodeChange(file_path=os.path.basename(path), content=f.read()))
+    return changes
+
+def measure(name: str, code_changes: List[CodeChange], settings: ReviewSettings) -> Dict[str, Any]:
+    llm_service = LLMService(backend=OfflineBackend())
+    code_content = llm_service._prepare_code_content(code_changes, settings)
+    before = estimate_tokens(legacy_prompt(code_content, settings))
+    after = estimate_tokens(llm_service._create_analysis_prompt(code_content, settings))
+    return {
+        "review": name,
+        "files": len(code_content),
+        "legacy_tokens": before,
+        "compact_tokens": after,
+        "tokens_saved": before - after,
+        "saved_percent": round(100.0 * (before - after) / before, 1),
+    }
+
+def run(pr_files: int = 100) -> List[Dict[str, Any]]:
+    fake = FakeGitHub(pr_files, pr_share=1.0)
+    github_service = GithubService("bench-token", transport=fake.transport())
+    pr_changes = asyncio.run(github_service.get_pr_changes_async(OWNER, REPO, PR_NUMBER))
+    results = [measure("backend sources (repository)", backend_sources(), ReviewSettings())]
+    for mode in ReviewMode:
+        results.append(measure(f"synthetic PR ({mode.value})", pr_changes, ReviewSettings(review_mode=mode)))
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare prompt sizes of the compact and the legacy encoding")
+    parser.add_argument("--pr-files", type=int, default=100, help="Files in the synthetic pull request")
+    args = parser.parse_args(argv)
+    logging.disable(logging.INFO)
+
+    for result in run(args.pr_files):
+        print(f"{result['review']:<30} {result['files']:>5} files  legacy {result['legacy_tokens']:>8}  "
+              f"compact {result['compact_tokens']:>8}  saved {result['tokens_saved']:>7} "
+              f"({result['saved_percent']:.1f}%)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+End-to-end benchmarks for the review pipeline.
+
+Every scenario runs against local stand-ins: FakeGitHub for the GitHub API
+and the offline LLM backend for the model, both with optional latency and
+rate limits. For each scenario and repository size the harness reports
+p50/p95/p99 latency, requests per second and peak traced memory, and writes
+the results as JSON tagged with the current commit. Passing --compare with
+an earlier results file flags scenarios that got slower.
+
+Usage (from backend/):
+    python benchmarks/run.py --files 10,100,1000 --output results.json
+    python benchmarks/run.py --compare results.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub, OWNER, REPO, PR_NUMBER
+from blob_cache import BlobCache
+from github_service import GithubService
+from llm_backends import OfflineBackend
+from llm_service import LLMService
+from issue_ranking import rank_issues
+from models import Issue, IssueLabel, ReviewSettings
+from review_pipeline import ReviewPipeline
+
+SCENARIOS = ["pr_fetch", "repo_fetch", "analyze", "review_endpoint", "rank_issues"]
+# Candidate issues per file in the rank_issues scenario
+ISSUES_PER_FILE = 10
+
+class BenchmarkConfig:
+    def __init__(self, iterations: int = 5, concurrency: int = 4, github_latency: float = 0.0,
+                 rate_limit: int = 0, llm_latency: float = 0.0, llm_tokens_per_second: float = 0.0):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.github_latency = github_latency
+        self.rate_limit = rate_limit
+        self.llm_latency = llm_latency
+        self.llm_tokens_per_second = llm_tokens_per_second
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def _github_service(fake: FakeGitHub, files: int) -> GithubService:
+    # A fresh blob cache per run so every iteration pays for its downloads
+    return GithubService("bench-token", transport=fake.transport(), max_repo_files=files,
+                         blob_cache=BlobCache(256 * 1024 * 1024))
+
+def _llm_service(config: BenchmarkConfig) -> LLMService:
+    llm_service = LLMService(backend=OfflineBackend(config.llm_latency, config.llm_tokens_per_second))
+    llm_service.review_cache = None
+    return llm_service
+
+def candidate_issues(files: int) -> List[Issue]:
+    """Issues as merged batches report them: every finding twice, the repeat worded differently"""
+    kinds = [("Unvalidated input reaches query", IssueLabel.SECURITY), ("Possible None dereference", IssueLabel.BUG),
+             ("Repeated lookup inside loop", IssueLabel.PERFORMANCE), ("Missing docstring", IssueLabel.DOCUMENTATION),
+             ("Long function should be split", IssueLabel.REFACTOR)]
+    issues = []
+    for number in range(files):
+        for index in range(ISSUES_PER_FILE // 2):
+            title, label = kinds[index % len(kinds)]
+            line = 10 + index * 20
+            issues.append(Issue(title=title, file_path=f"src/module_{number}.py", line_numbers=[line], description="d",
+                                labels=[label], severity="high" if index % 2 else "medium"))
+            issues.append(Issue(title=f"{title} here", file_path=f"src/module_{number}.py",
+                                line_numbers=[line + 1], description="d", labels=[label]))
+    return issues
+
+def build_scenario(name: str, files: int, config: BenchmarkConfig):
+    """Return (fake GitHub, async callable performing one operation) for a scenario"""
+    fake = FakeGitHub(files, latency_seconds=config.github_latency, rate_limit=config.rate_limit)
+
+    if name == "pr_fetch":
+        async def operation():
+            await _github_service(fake, files).get_pr_changes_async(OWNER, REPO, PR_NUMBER)
+        return fake, operation
+
+    if name == "repo_fetch":
+        async def operation():
+            await _github_service(fake, files).get_repo_files_async(OWNER, REPO)
+        return fake, operation
+
+    if name == "analyze":
+        # Prompt building, batching, parsing and merging for a fetched repository
+        changes = asyncio.run(_github_service(fake, files).get_repo_files_async(OWNER, REPO))
+        llm_service = _llm_service(config)
+        settings = ReviewSettings(max_issues=10)
+
+        async def operation():
+            await llm_service.analyze_code_async(changes, settings)
+        return fake, operation
+
+    if name == "review_endpoint":
+        import main
+        main.github_service = _github_service(fake, files)
+        main.llm_service = _llm_service(config)
+        main.review_pipeline = ReviewPipeline(main.github_service, main.llm_service)
+        body = {"url": f"https://github.com/{OWNER}/{REPO}/pull/{PR_NUMBER}"}
+
+        async def operation():
+            # New blob cache each request so the endpoint fetches file contents every time
+            main.github_service.blob_cache = BlobCache(256 * 1024 * 1024)
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                response = await client.post("/review", json=body, timeout=None)
+                response.raise_for_status()
+        return fake, operation
+
+    if name == "rank_issues":
+        # Deduplication and ranking alone, run on every batch of a review
+        issues = candidate_issues(files)
+
+        async def operation():
+            rank_issues(issues, 10)
+        return fake, operation
+
+    raise ValueError(f"Unknown scenario: {name}")
+
+async def _timed_runs(operation: Callable[[], Awaitable[None]], iterations: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await operation()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    return {"latencies": latencies, "wall": time.perf_counter() - start}
+
+async def _peak_memory(operation: Callable[[], Awaitable[None]]) -> int:
+    # Tracing slows everything down, so memory is measured on a separate run
+    tracemalloc.start()
+    try:
+        await operation()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_scenario(name: str, files: int, config: BenchmarkConfig) -> Dict[str, Any]:
+    fake, operation = build_scenario(name, files, config)
+    requests_before = fake.requests
+
+    async def measure():
+        # One warm-up run pays for imports and one-time setup
+        await operation()
+        timed = await _timed_runs(operation, config.iterations, config.concurrency)
+        peak = await _peak_memory(operation)
+        return timed, peak
+
+    timed, peak = asyncio.run(measure())
+    latencies = timed["latencies"]
+    return {
+        "scenario": name,
+        "files": files,
+        "iterations": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "requests_per_second": round(len(latencies) / timed["wall"], 3),
+        "peak_memory_mb": round(peak / (1024 * 1024), 3),
+        "github_requests_per_run": round((fake.requests - requests_before) / (len(latencies) + 2), 1),
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Describe every scenario whose p50 or p95 grew by more than threshold (a fraction) over the baseline"""
+    previous = {(entry["scenario"], entry["files"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get((entry["scenario"], entry["files"]))
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if before[metric] > 0 and entry[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    f"{entry['scenario']} ({entry['files']} files): {metric} "
+                    f"{before[metric]:.1f} -> {entry[metric]:.1f} ms"
+                )
+    return regressions
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the code review pipeline against local stand-ins")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--files", default="10,100,1000", help="Comma-separated repository sizes (files)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--github-latency", type=float, default=0.0, help="Seconds added to every GitHub request")
+    parser.add_argument("--rate-limit", type=int, default=0, help="GitHub requests allowed per second (0 = unlimited)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds before each LLM answer")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="Simulated LLM output speed")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args(argv)
+
+    # Per-request INFO logs would dominate the timings
+    logging.disable(logging.INFO)
+
+    config = BenchmarkConfig(args.iterations, args.concurrency, args.github_latency, args.rate_limit,
+                             args.llm_latency, args.llm_tokens_per_second)
+    results = []
+    for name in args.scenarios.split(","):
+        for files in (int(size) for size in args.files.split(",")):
+            result = run_scenario(name.strip(), files, config)
+            results.append(result)
+            print(f"{result['scenario']:<16} {files:>6} files  p50 {result['p50_ms']:>9.1f} ms  "
+                  f"p95 {result['p95_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms  "
+                  f"{result['requests_per_second']:>8.2f} req/s  peak {result['peak_memory_mb']:>7.1f} MB")
+
+    report = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "config": config.as_dict(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Content-addressed cache for file contents fetched from GitHub.
+
+Git blob SHAs identify file contents exactly, so a cached blob never goes
+stale. The cache has an in-memory LRU tier and an optional on-disk tier;
+both are bounded by size and evict the least recently used blobs first.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class BlobCache:
+    def __init__(self, max_memory_bytes: int = 64 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, max_disk_bytes: int = 512 * 1024 * 1024):
+        """Create a cache holding up to max_memory_bytes in memory and max_disk_bytes under disk_dir"""
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            logger.info(f"Blob cache using {self.disk_dir} ({self._disk_bytes} bytes on disk)")
+
+    @classmethod
+    def from_env(cls) -> "BlobCache":
+        """Build a cache sized by BLOB_CACHE_MEMORY_MB, BLOB_CACHE_DIR and BLOB_CACHE_DISK_MB"""
+        return cls(
+            max_memory_bytes=int(os.getenv("BLOB_CACHE_MEMORY_MB", 64)) * 1024 * 1024,
+            disk_dir=os.getenv("BLOB_CACHE_DIR") or None,
+            max_disk_bytes=int(os.getenv("BLOB_CACHE_DISK_MB", 512)) * 1024 * 1024,
+        )
+
+    def get(self, sha: str) -> Optional[str]:
+        """Return the cached content for a blob SHA, or None on a miss"""
+        with self._lock:
+            content = self._memory.get(sha)
+            if content is not None:
+                self._memory.move_to_end(sha)
+                self._counters["memory_hits"] += 1
+                return content
+
+        content = self._read_disk(sha)
+        with self._lock:
+            if content is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(sha, content)
+        return content
+
+    def put(self, sha: str, content: str):
+        """Store the content of a blob SHA in every enabled tier"""
+        with self._lock:
+            self._remember(sha, content)
+        self._write_disk(sha, content)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current tier sizes, for sizing the cache"""
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _remember(self, sha: str, content: str):
+        """Insert into the memory tier and evict least recently used blobs; caller holds the lock"""
+        size = len(content.encode("utf-8"))
+        if size > self.max_memory_bytes:
+            return
+        if sha in self._memory:
+            self._memory.move_to_end(sha)
+            return
+        self._memory[sha] = content
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.encode("utf-8"))
+
+    def _disk_path(self, sha: str) -> str:
+        return os.path.join(self.disk_dir, sha[:2], sha)
+
+    def _disk_entries(self):
+        """Yield (path, size, mtime) for every blob stored on disk"""
+        for shard in os.scandir(self.disk_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _read_disk(self, sha: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(sha)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            # Bump the modification time so eviction treats this blob as recently used
+            os.utime(path)
+            return content
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Error reading cached blob {sha}: {e}")
+            return None
+
+    def _write_disk(self, sha: str, content: str):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(sha)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += os.path.getsize(path)
+                over_limit = self._disk_bytes > self.max_disk_bytes
+            if over_limit:
+                self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Error writing cached blob {sha}: {e}")
+
+    def _evict_disk(self):
+        """Delete the least recently used blobs until the disk tier is back under its limit"""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
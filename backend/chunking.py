@@ -0,0 +1,96 @@
+"""
+Token-budgeted chunking for large reviews.
+
+Prepared files are packed into batches that each fit in one LLM prompt.
+Files that are too large for a batch on their own are split by lines.
+The batches are analyzed in parallel and the per-batch reviews are merged
+back into one ReviewResponse, with duplicate findings collapsed and the
+issues ranked (see issue_ranking).
+"""
+
+import math
+from typing import Any, Callable, Dict, List
+
+from issue_ranking import rank_issues
+from models import ReviewResponse, IssueLabel
+
+# Rough average for source code with OpenAI tokenizers; errs on the side of more tokens
+CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(text: str) -> int:
+    """Estimate how many tokens a piece of text costs without calling a tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def pack_files(files: Dict[str, Dict[str, Any]], budget: int,
+               measure: Callable[[str, Dict[str, Any]], int]) -> List[Dict[str, Dict[str, Any]]]:
+    """
+    Pack prepared file entries into batches whose measured size stays within
+    budget tokens, keeping the original file order so related files stay together
+    """
+    batches: List[Dict[str, Dict[str, Any]]] = []
+    current: Dict[str, Dict[str, Any]] = {}
+    used = 0
+
+    for path, entry in files.items():
+        for part in _split_entry(path, entry, budget, measure):
+            size = measure(path, part)
+            # A path can appear only once per batch, so parts of one file never share a batch
+            if current and (used + size > budget or path in current):
+                batches.append(current)
+                current, used = {}, 0
+            current[path] = part
+            used += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+def _split_entry(path: str, entry: Dict[str, Any], budget: int,
+                 measure: Callable[[str, Dict[str, Any]], int]) -> List[Dict[str, Any]]:
+    """Split one file entry into line ranges that each fit the budget"""
+    size = measure(path, entry)
+    content = entry.get("content", "")
+    if size <= budget or not content:
+        return [entry]
+
+    lines = content.splitlines(keepends=True)
+    parts_needed = math.ceil(size / budget)
+    lines_per_part = max(1, math.ceil(len(lines) / parts_needed))
+
+    parts = []
+    for start in range(0, len(lines), lines_per_part):
+        part = {key: value for key, value in entry.items() if key != "diff" or start == 0}
+        part["content"] = "".join(lines[start:start + lines_per_part])
+        part["first_line"] = start + 1
+        parts.append(part)
+    return parts
+
+def merge_reviews(reviews: List[ReviewResponse], max_issues: int) -> ReviewResponse:
+    """
+    Combine per-batch reviews into one. Issues are taken from each batch in turn,
+    so equally ranked issues of later batches are not starved by the global
+    max_issues cap, then deduplicated and ranked.
+    """
+    interleaved = []
+    queues = [list(review.issues) for review in reviews]
+    while any(queues):
+        for queue in queues:
+            if queue:
+                interleaved.append(queue.pop(0))
+    issues = rank_issues(interleaved, max_issues)
+
+    suggested_labels: List[IssueLabel] = []
+    for review in reviews:
+        for label in review.suggested_labels:
+            if label not in suggested_labels:
+                suggested_labels.append(label)
+
+    summaries = [review.summary for review in reviews if review.summary]
+    return ReviewResponse(
+        issues=issues,
+        test_suggestions=[suggestion for review in reviews for suggestion in review.test_suggestions],
+        summary="\n\n".join(summaries),
+        suggested_labels=suggested_labels,
+        total_files_analyzed=sum(review.total_files_analyzed for review in reviews),
+        analysis_time_seconds=0.0
+    )
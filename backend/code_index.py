@@ -0,0 +1,230 @@
+"""
+Structural index of source files for symbol-focused reviews.
+
+Supported languages (Python, through `ast`) are parsed into symbols
+(functions, methods and classes with their line spans), imports with the
+names they bind, call edges and name references. In symbols review mode the
+prompt then carries, for each pull request file, the changed symbols, the
+definitions in the same file that the changed code calls and the imports it
+uses, instead of the whole file.
+
+Indexes are cached by blob SHA, so a file is parsed once however many
+reviews include it.
+"""
+
+import os
+import ast
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from diff_context import merge_ranges, parse_hunks
+from metrics import record_cache_lookup
+
+# Changed symbols longer than this are shown as hunk excerpts instead of whole
+MAX_SYMBOL_LINES = 150
+# Called definitions longer than this are represented by their signature
+MAX_DEPENDENCY_LINES = 40
+MAX_DEPENDENCIES = 10
+
+class Symbol(NamedTuple):
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    header_end: int
+
+class Import(NamedTuple):
+    start_line: int
+    end_line: int
+    names: Tuple[str, ...]
+
+class Call(NamedTuple):
+    line: int
+    caller: Optional[str]
+    callee: str
+
+class FileIndex(NamedTuple):
+    symbols: Tuple[Symbol, ...]
+    imports: Tuple[Import, ...]
+    calls: Tuple[Call, ...]
+    references: Tuple[Tuple[int, str], ...]
+
+class _PythonIndexer(ast.NodeVisitor):
+    def __init__(self):
+        self.symbols: List[Symbol] = []
+        self.imports: List[Import] = []
+        self.calls: List[Call] = []
+        self.references: List[Tuple[int, str]] = []
+        self._scope: List[str] = []
+
+    def _define(self, node, kind: str):
+        name = ".".join(self._scope + [node.name])
+        start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        header_end = max(node.body[0].lineno - 1, node.lineno)
+        self.symbols.append(Symbol(name, kind, start, node.end_lineno, header_end))
+        self._scope.append(node.name)
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self._define(node, "function")
+
+    def visit_AsyncFunctionDef(self, node):
+        self._define(node, "function")
+
+    def visit_ClassDef(self, node):
+        self._define(node, "class")
+
+    def visit_Import(self, node):
+        names = tuple((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        self.imports.append(Import(node.lineno, node.end_lineno, names))
+
+    def visit_ImportFrom(self, node):
+        names = tuple(alias.asname or alias.name for alias in node.names)
+        self.imports.append(Import(node.lineno, node.end_lineno, names))
+
+    def visit_Call(self, node):
+        callee = node.func.id if isinstance(node.func, ast.Name) else getattr(node.func, "attr", None)
+        if callee:
+            self.calls.append(Call(node.lineno, ".".join(self._scope) or None, callee))
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        self.references.append((node.lineno, node.id))
+
+def index_python(content: str) -> Optional[FileIndex]:
+    """Index a Python module, or return None when it does not parse"""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+    indexer = _PythonIndexer()
+    indexer.visit(tree)
+    return FileIndex(tuple(indexer.symbols), tuple(indexer.imports), tuple(indexer.calls), tuple(indexer.references))
+
+# File extension -> indexer; other languages are reviewed without an index
+INDEXERS = {
+    ".py": index_python,
+}
+
+def index_file(file_path: str, content: str) -> Optional[FileIndex]:
+    indexer = INDEXERS.get(os.path.splitext(file_path)[1])
+    return indexer(content) if indexer else None
+
+class CodeIndex:
+    def __init__(self, max_entries: int = 2000):
+        """Cache the indexes of up to max_entries blobs"""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Optional[FileIndex]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "CodeIndex":
+        return cls(int(os.getenv("CODE_INDEX_MAX_ENTRIES", 2000)))
+
+    def get(self, file_path: str, content: str, sha: Optional[str] = None) -> Optional[FileIndex]:
+        """Index of a file, parsed only the first time its blob is seen; None for unsupported or broken files"""
+        extension = os.path.splitext(file_path)[1]
+        if extension not in INDEXERS:
+            return None
+        if not sha:
+            return index_file(file_path, content)
+
+        # The same blob can be indexed differently under another extension
+        key = (sha, extension)
+        with self._lock:
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+                index = self._entries[key]
+        record_cache_lookup("code_index", hit)
+        if hit:
+            return index
+
+        index = index_file(file_path, content)
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+def symbol_context(index: FileIndex, content: str, diff: str, context_lines: int = 3) -> Dict[str, Any]:
+    """
+    Excerpts of a changed file for the prompt: the innermost symbols touched by
+    each hunk ("symbols"), changed lines outside any symbol or inside very long
+    ones ("context"), same-file definitions the shown code calls
+    ("dependencies") and the imports it uses ("imports")
+    """
+    lines = content.splitlines()
+    if not lines:
+        return {}
+
+    changed: Dict[str, Symbol] = {}
+    context_ranges: List[Tuple[int, int]] = []
+    for first, last in parse_hunks(diff):
+        overlapping = [s for s in index.symbols if s.start_line <= last and s.end_line >= first]
+        # Innermost: no other overlapping symbol nested inside
+        innermost = [s for s in overlapping if not any(
+            o is not s and s.start_line <= o.start_line and o.end_line <= s.end_line for o in overlapping
+        )]
+        covered = set()
+        for symbol in innermost:
+            if symbol.end_line - symbol.start_line + 1 <= MAX_SYMBOL_LINES:
+                changed[symbol.name] = symbol
+                covered.update(range(symbol.start_line, symbol.end_line + 1))
+            else:
+                context_ranges.append((symbol.start_line, symbol.header_end))
+        uncovered = [line for line in range(first, last + 1) if line not in covered]
+        if uncovered:
+            context_ranges.append((max(min(uncovered) - context_lines, 1),
+                                   min(max(uncovered) + context_lines, len(lines))))
+
+    symbol_spans = [(s.start_line, s.end_line) for s in changed.values()]
+    context_ranges = [r for r in merge_ranges(context_ranges)
+                      if not any(start <= r[0] and r[1] <= end for start, end in symbol_spans)]
+    shown = merge_ranges(symbol_spans + context_ranges)
+
+    def is_shown(line: int, spans: List[Tuple[int, int]]) -> bool:
+        return any(start <= line <= end for start, end in spans)
+
+    # Direct dependencies: definitions in this file called from the shown code
+    by_name: Dict[str, List[Symbol]] = {}
+    for symbol in index.symbols:
+        by_name.setdefault(symbol.name.rsplit(".", 1)[-1], []).append(symbol)
+    dependencies: Dict[str, Symbol] = {}
+    for call in index.calls:
+        if not is_shown(call.line, shown):
+            continue
+        for symbol in by_name.get(call.callee, []):
+            if len(dependencies) < MAX_DEPENDENCIES and not is_shown(symbol.start_line, shown):
+                dependencies.setdefault(symbol.name, symbol)
+
+    dependency_spans = []
+    for symbol in dependencies.values():
+        if symbol.end_line - symbol.start_line + 1 <= MAX_DEPENDENCY_LINES:
+            dependency_spans.append((symbol.start_line, symbol.end_line))
+        else:
+            dependency_spans.append((symbol.start_line, symbol.header_end))
+
+    used = {name for line, name in index.references if is_shown(line, shown + dependency_spans)}
+    used.update(call.callee for call in index.calls if is_shown(call.line, shown + dependency_spans))
+    imports = [imp for imp in index.imports if used.intersection(imp.names)]
+
+    context = {
+        "symbols": [_excerpt(lines, s.start_line, s.end_line, name=s.name, kind=s.kind)
+                    for s in sorted(changed.values(), key=lambda s: s.start_line)],
+    }
+    if context_ranges:
+        context["context"] = [_excerpt(lines, start, end) for start, end in context_ranges]
+    if dependencies:
+        context["dependencies"] = [
+            _excerpt(lines, start, end, name=s.name, kind=s.kind)
+            for s, (start, end) in sorted(zip(dependencies.values(), dependency_spans), key=lambda item: item[1])
+        ]
+    if imports:
+        context["imports"] = "\n".join("\n".join(lines[imp.start_line - 1:imp.end_line]) for imp in imports)
+    return context
+
+def _excerpt(lines: List[str], start: int, end: int, **fields: str) -> Dict[str, Any]:
+    return {**fields, "start_line": start, "end_line": end, "code": "\n".join(lines[start - 1:end])}
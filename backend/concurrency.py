@@ -0,0 +1,30 @@
+"""
+Concurrency limits shared by the API front-ends.
+
+Each event loop gets its own limiter, so MAX_CONCURRENT_REVIEWS caps the
+number of reviews a single worker runs at once, and hosts that run more
+than one loop (test clients, benchmarks) each get a limiter of their own. Requests beyond the cap wait
+for a free slot instead of competing for GitHub and LLM capacity.
+
+On shutdown a worker gives in-flight requests, running review jobs and
+webhook reviews up to SHUTDOWN_DRAIN_SECONDS to finish before it exits.
+"""
+
+import os
+import asyncio
+import weakref
+
+MAX_CONCURRENT_REVIEWS = int(os.getenv("MAX_CONCURRENT_REVIEWS", 4))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", 30))
+
+# A semaphore is bound to the event loop it first waits in, so each loop gets its own
+_review_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+    weakref.WeakKeyDictionary()
+
+def review_semaphore() -> asyncio.Semaphore:
+    """Return the review limiter of the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    semaphore = _review_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _review_semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_REVIEWS)
+    return semaphore
@@ -0,0 +1,113 @@
+"""
+Hunk-focused context extraction for pull request reviews.
+
+Instead of sending whole files, diff mode sends each file's patch plus
+excerpts of the new file around every hunk: a configurable number of
+context lines, widened to the enclosing function or class when one can be
+found. Python files are resolved with `ast`; other languages fall back to
+a definition-header heuristic.
+"""
+
+import re
+import ast
+from typing import Any, Dict, List, Optional, Tuple
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+# Lines that usually open a function, method or class in C-like and scripting languages
+DEFINITION_HEADER = re.compile(
+    r"^\s*(?:export\s+)?(?:default\s+)?(?:public\s+|private\s+|protected\s+|static\s+|async\s+)*"
+    r"(?:def|class|function|func|fn|interface|struct|impl|module|sub)\b"
+)
+
+# Enclosing definitions longer than this are represented by their header line only
+MAX_ENCLOSING_LINES = 80
+
+def parse_hunks(diff: str) -> List[Tuple[int, int]]:
+    """Return the (first, last) new-file line range touched by each hunk of a unified diff"""
+    ranges = []
+    for line in diff.splitlines():
+        match = HUNK_HEADER.match(line)
+        if match:
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            ranges.append((start, max(start + count - 1, start)))
+    return ranges
+
+def extract_hunk_context(file_path: str, content: str, diff: str, context_lines: int = 3) -> List[Dict[str, Any]]:
+    """
+    Build new-file excerpts covering every hunk, each widened by context_lines
+    and by the enclosing definition, with overlapping excerpts merged
+    """
+    lines = content.splitlines()
+    if not lines:
+        return []
+
+    definitions = _python_definitions(content) if file_path.endswith(".py") else None
+    ranges = []
+    for first, last in parse_hunks(diff):
+        start, end = max(first - context_lines, 1), min(last + context_lines, len(lines))
+        enclosing = (_enclosing_python(definitions, first, last) if definitions is not None
+                     else _enclosing_by_header(lines, first))
+        header = None
+        if enclosing:
+            enclosing_start, enclosing_end = enclosing
+            if enclosing_end - enclosing_start + 1 <= MAX_ENCLOSING_LINES:
+                start, end = min(start, enclosing_start), max(end, min(enclosing_end, len(lines)))
+            elif enclosing_start < start:
+                header = enclosing_start
+        if header:
+            ranges.append((header, header))
+        ranges.append((start, end))
+
+    excerpts = []
+    for start, end in merge_ranges(ranges):
+        excerpts.append({
+            "start_line": start,
+            "end_line": end,
+            "code": "\n".join(lines[start - 1:end])
+        })
+    return excerpts
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Combine overlapping or adjacent line ranges"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _python_definitions(content: str) -> Optional[List[Tuple[int, int]]]:
+    """Line spans of every function and class in a Python module, or None if it does not parse"""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+    return [
+        (node.lineno, node.end_lineno)
+        for node in ast.walk(tree)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+    ]
+
+def _enclosing_python(definitions: List[Tuple[int, int]], first: int, last: int) -> Optional[Tuple[int, int]]:
+    """Innermost definition containing the whole hunk"""
+    containing = [span for span in definitions if span[0] <= first and span[1] >= last]
+    return min(containing, key=lambda span: span[1] - span[0]) if containing else None
+
+def _enclosing_by_header(lines: List[str], first: int) -> Optional[Tuple[int, int]]:
+    """
+    Nearest definition header above the hunk that is indented less than the
+    hunk's first line; the span ends at the hunk since the real end is unknown
+    """
+    index = min(first, len(lines)) - 1
+    target_indent = _indent(lines[index])
+    for i in range(index, -1, -1):
+        line = lines[i]
+        if DEFINITION_HEADER.match(line) and (_indent(line) < target_indent or i == index):
+            return (i + 1, first)
+    return None
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
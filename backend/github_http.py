@@ -0,0 +1,163 @@
+"""
+HTTP helpers for the GitHub REST API.
+
+ETagCache remembers validators for GET responses so repeated requests can be
+sent conditionally; GitHub answers unchanged resources with 304 Not Modified,
+which does not count against the rate limit. RateLimitScheduler reads the
+X-RateLimit-* and Retry-After headers and paces requests instead of letting a
+review fail once the quota runs low. ObjectCache keeps repository metadata,
+pull request heads and label sets for a short time so consecutive reviews of
+the same repository do not fetch them again.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class RateLimitExceeded(Exception):
+    """Raised when waiting out a GitHub rate limit would take longer than allowed"""
+
+class ETagCache:
+    def __init__(self, max_entries: int = 2048):
+        """Keep validators and bodies for up to max_entries GET responses"""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, bytes, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def key(self, request: httpx.Request) -> str:
+        """Cache key covering the URL and the representation asked for"""
+        return f"{request.headers.get('Accept', '')} {request.url}"
+
+    def lookup(self, key: str) -> Optional[Tuple[str, bytes, Dict[str, str]]]:
+        """Return the stored (etag, body, headers) for a request key"""
+        with self._lock:
+            return self._entries.get(key)
+
+    def store(self, key: str, response: httpx.Response):
+        """Remember a successful response that carries an ETag"""
+        etag = response.headers.get("ETag")
+        if not etag:
+            return
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() in ("content-type", "link")}
+        with self._lock:
+            self._entries[key] = (etag, response.content, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def replay(self, entry: Tuple[str, bytes, Dict[str, str]], response: httpx.Response) -> httpx.Response:
+        """Turn a 304 Not Modified into the cached 200 response it stands for"""
+        etag, content, headers = entry
+        with self._lock:
+            self.not_modified += 1
+        return httpx.Response(200, headers={**headers, "ETag": etag}, content=content,
+                              request=response.request)
+
+class ObjectCache:
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        """Keep up to max_entries GitHub objects, each for ttl seconds"""
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the object stored under key, unless it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RateLimitScheduler:
+    def __init__(self, reserve: int = 100, max_wait: float = 300.0):
+        """
+        Pace requests once fewer than `reserve` calls remain in the window, and
+        give up only if a single wait would exceed `max_wait` seconds
+        """
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.paused_until = 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        """Wait until it is reasonable to send the next request"""
+        delay = self._delay()
+        if delay <= 0:
+            return
+        if delay > self.max_wait:
+            raise RateLimitExceeded(f"GitHub rate limit resets in {delay:.0f}s, longer than {self.max_wait:.0f}s")
+        logger.warning(f"Pacing GitHub requests: waiting {delay:.2f}s ({self.remaining} calls left)")
+        await asyncio.sleep(delay)
+
+    def update(self, response: httpx.Response):
+        """Record the quota GitHub reports in the response headers"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset is not None:
+            self.reset_at = float(reset)
+
+    def backoff(self, response: httpx.Response) -> Optional[float]:
+        """
+        If the response is a primary or secondary rate-limit rejection, schedule
+        a pause and return its length; otherwise return None
+        """
+        if response.status_code not in (403, 429):
+            return None
+        now = time.time()
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            delay = float(retry_after)
+        elif response.headers.get("X-RateLimit-Remaining") == "0" and self.reset_at:
+            delay = self.reset_at - now
+        elif response.status_code == 429 or "secondary rate limit" in response.text.lower():
+            # GitHub asks clients to wait at least a minute when no header is given
+            delay = 60.0
+        else:
+            return None
+        delay = max(delay, 0.0)
+        self.paused_until = max(self.paused_until, now + delay)
+        return delay
+
+    def _delay(self) -> float:
+        now = time.time()
+        if self.paused_until > now:
+            return self.paused_until - now
+        if self.remaining is None or self.reset_at is None or self.remaining > self.reserve:
+            return 0.0
+        window = max(self.reset_at - now, 0.0)
+        if self.remaining <= 0:
+            return window
+        # Hand out evenly spaced slots over the rest of the window so concurrent
+        # fetches queue behind each other instead of all firing after one sleep
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + window / self.remaining
+        return slot - now
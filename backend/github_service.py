@@ -1,19 +1,94 @@
+import io
+import os
 import re
+import time
 import base64
+import asyncio
 import logging
-from typing import Dict, List, Optional, Any
+import tarfile
+from urllib.parse import quote
+from typing import Dict, List, Optional, Any, Callable, Awaitable, Tuple, Union
+import httpx
 from github import Github, GithubException
-from models import IssueLabel, Issue, CodeChange
+from models import IssueLabel, Issue, CodeChange, SkippedFile
+from mcp_config import MCP_SERVER_CONFIG
+from blob_cache import BlobCache
+from github_http import ETagCache, ObjectCache, RateLimitScheduler
+from path_filter import PathFilter, looks_binary, path_filter_from_env
+from metrics import FILE_FETCH_SECONDS, GITHUB_REQUESTS, github_endpoint, record_cache_lookup, stage
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+# Git file mode of symbolic links, whose blob is only the link target
+SYMLINK_MODE = "120000"
+
+# Fetched file contents, or why a file could not be reviewed
+FileContent = Union[str, SkippedFile]
+
+def code_change(file_path: str, content: FileContent, **fields: Any) -> CodeChange:
+    """Build a CodeChange, marking files that were skipped instead of embedding placeholder text"""
+    if isinstance(content, SkippedFile):
+        # The size the skip was decided on wins over the one from the listing
+        size = fields.pop("size", None)
+        return CodeChange(file_path=file_path, content="", skip_reason=content.reason,
+                          size=content.size if content.size is not None else size, **fields)
+    return CodeChange(file_path=file_path, content=content, **fields)
+
+def pr_file_size(file: Dict[str, Any]) -> Optional[int]:
+    """
+    Bytes of a pull request file's new version that its patch shows (added and
+    context lines, each line's marker standing in for its newline): the whole
+    file when it was added, a lower bound otherwise. None when GitHub sent no
+    patch.
+    """
+    patch = file.get("patch")
+    if not patch:
+        return None
+    return sum(len(line.encode("utf-8")) for line in patch.splitlines() if line[:1] in ("+", " "))
+
+def is_binary_pr_file(file: Dict[str, Any]) -> bool:
+    """GitHub omits the patch of binary files, so an added or modified file without patch or changed lines is binary"""
+    return file["status"] in ("added", "modified") and not file.get("patch") and file.get("changes") == 0
+
 class GithubService:
-    def __init__(self, github_token: str):
+    def __init__(self, github_token: str, max_concurrency: Optional[int] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_repo_files: Optional[int] = None, tarball_threshold: Optional[int] = None,
+                 blob_cache: Optional[BlobCache] = None,
+                 rate_limiter: Optional[RateLimitScheduler] = None,
+                 path_filter: Optional[PathFilter] = None):
         """Initialize GitHub service with authentication token"""
         logger.info("Initializing GitHub service")
         self.github = Github(github_token)
+        self.github_token = github_token
+        # Upper bound on simultaneous file downloads within a single review
+        self.max_concurrency = max_concurrency or int(os.getenv("GITHUB_FETCH_CONCURRENCY", 8))
+        # Cap on files pulled from a whole-repository review
+        self.max_repo_files = max_repo_files or MCP_SERVER_CONFIG["github"]["max_files_per_repo"]
+        # Above this many files one tarball download is cheaper than a request per blob
+        self.tarball_threshold = tarball_threshold or int(os.getenv("GITHUB_TARBALL_THRESHOLD", 100))
+        # File contents keyed by blob SHA, shared across reviews
+        self.blob_cache = blob_cache or BlobCache.from_env()
+        # Validators for conditional requests; 304 replies do not use up the quota
+        self.etag_cache = ETagCache(int(os.getenv("GITHUB_ETAG_CACHE_SIZE", 2048)))
+        # One scheduler per token, shared by every review this service runs
+        self.rate_limiter = rate_limiter or RateLimitScheduler(
+            reserve=int(os.getenv("GITHUB_RATE_LIMIT_RESERVE", 100)),
+            max_wait=float(os.getenv("GITHUB_RATE_LIMIT_MAX_WAIT", 300)),
+        )
+        # Which files are reviewed, extended per repository by its .gitattributes
+        self.path_filter = path_filter or path_filter_from_env()
+        self.repo_rules_ttl = float(os.getenv("REPO_RULES_TTL_SECONDS", 300))
+        self._repo_filters = ObjectCache(self.repo_rules_ttl)
+        # Repository metadata and label sets change rarely; PR heads move on every push
+        self.repo_objects = ObjectCache(float(os.getenv("GITHUB_REPO_CACHE_TTL_SECONDS", 300)))
+        self.pull_requests = ObjectCache(float(os.getenv("GITHUB_PR_CACHE_TTL_SECONDS", 10)))
+        self.max_retries = 3
+        # Allows tests and benchmarks to swap in a local transport
+        self._transport = transport
     
     def parse_github_url(self, url: str) -> Dict[str, Any]:
         """
@@ -23,6 +98,10 @@ class GithubService:
         - https://github.com/owner/repo
         - https://github.com/owner/repo/pull/123
         """
+        with stage("url_parse"):
+            return self._parse_github_url(url)
+    
+    def _parse_github_url(self, url: str) -> Dict[str, Any]:
         logger.info(f"Parsing GitHub URL: {url}")
         # PR URL pattern
         pr_pattern = r"https://github\.com/([^/]+)/([^/]+)/pull/(\d+)"
@@ -56,28 +135,25 @@ class GithubService:
     
     def get_pr_changes(self, owner: str, repo_name: str, pr_number: int) -> List[CodeChange]:
         """Get all file changes from a specific pull request"""
+        return asyncio.run(self.get_pr_changes_async(owner, repo_name, pr_number))
+    
+    def get_repo_files(self, owner: str, repo_name: str, file_paths: Optional[List[str]] = None) -> List[CodeChange]:
+        """Get files from a repository, optionally filtering by file paths"""
+        return asyncio.run(self.get_repo_files_async(owner, repo_name, file_paths))
+    
+    async def get_head_sha_async(self, owner: str, repo_name: str, pr_number: Optional[int] = None) -> str:
+        """Get the commit SHA a review looks at: the PR head, or the default branch tip"""
+        async with self.api_client() as client:
+            return await self.head_sha(client, owner, repo_name, pr_number)
+    
+    async def get_pr_changes_async(self, owner: str, repo_name: str, pr_number: int) -> List[CodeChange]:
+        """Get all file changes from a specific pull request, fetching file contents concurrently"""
         try:
             logger.info(f"Getting PR changes for {owner}/{repo_name} PR #{pr_number}")
-            repo = self.github.get_repo(f"{owner}/{repo_name}")
-            pull_request = repo.get_pull(pr_number)
-            
-            changes = []
-            for file in pull_request.get_files():
-                logger.info(f"Processing file: {file.filename}")
-                if self._is_reviewable_file(file.filename):
-                    try:
-                        content = self._get_file_content(repo, file.filename, pull_request.head.sha)
-                        changes.append(CodeChange(
-                            file_path=file.filename,
-                            content=content,
-                            diff=file.patch if file.patch else "",
-                            is_new=file.status == "added"
-                        ))
-                    except Exception as e:
-                        logger.error(f"Error processing file {file.filename}: {e}")
-                else:
-                    logger.info(f"Skipping non-reviewable file: {file.filename}")
-            
+            async with self.api_client() as client:
+                listing = await self.list_files(client, owner, repo_name, pr_number)
+                files, skipped = self.filter_files(listing)
+                changes = await self.fetch_files(client, owner, repo_name, listing, files, skipped)
             logger.info(f"Found {len(changes)} reviewable files in PR")
             return changes
             
@@ -85,93 +161,478 @@ class GithubService:
             logger.error(f"Error getting PR changes: {str(e)}")
             raise
     
-    def get_repo_files(self, owner: str, repo_name: str, file_paths: Optional[List[str]] = None) -> List[CodeChange]:
-        """Get files from a repository, optionally filtering by file paths"""
+    async def get_repo_files_async(self, owner: str, repo_name: str, file_paths: Optional[List[str]] = None) -> List[CodeChange]:
+        """Get files from a repository, fetching file contents concurrently"""
         try:
             logger.info(f"Getting files from repo: {owner}/{repo_name}")
-            repo = self.github.get_repo(f"{owner}/{repo_name}")
-            
-            changes = []
-            
-            if file_paths:
-                logger.info(f"Using specific file paths: {file_paths}")
-                for path in file_paths:
-                    try:
-                        if self._is_reviewable_file(path):
-                            content = self._get_file_content(repo, path)
-                            changes.append(CodeChange(
-                                file_path=path,
-                                content=content,
-                                diff="",
-                                is_new=False
-                            ))
-                    except Exception as e:
-                        logger.error(f"Error processing file {path}: {e}")
-            else:
-                logger.info("Getting all files from repository")
-                contents = repo.get_contents("")
-                scanned_files = 0
-                max_files = 50  # Limit to prevent API abuse
-                
-                while contents and scanned_files < max_files:
-                    file_content = contents.pop(0)
-                    if file_content.type == "dir":
-                        try:
-                            contents.extend(repo.get_contents(file_content.path))
-                        except Exception as e:
-                            logger.error(f"Error accessing directory {file_content.path}: {e}")
-                    else:
-                        scanned_files += 1
-                        if self._is_reviewable_file(file_content.path):
-                            try:
-                                content = self._get_file_content_safe(repo, file_content.path)
-                                changes.append(CodeChange(
-                                    file_path=file_content.path,
-                                    content=content,
-                                    diff="",
-                                    is_new=False
-                                ))
-                            except Exception as e:
-                                logger.error(f"Error processing file {file_content.path}: {e}")
-                
-                logger.info(f"Scanned {scanned_files} files, found {len(changes)} reviewable files")
-            
+            async with self.api_client() as client:
+                listing = await self.list_files(client, owner, repo_name, file_paths=file_paths)
+                entries, skipped = self.filter_files(listing, file_paths)
+                changes = await self.fetch_files(client, owner, repo_name, listing, entries, skipped)
+            logger.info(f"Found {len(changes)} reviewable files in repository")
             return changes
             
         except Exception as e:
             logger.error(f"Error getting repo files: {str(e)}")
             raise
     
+    async def list_files(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                         pr_number: Optional[int] = None, file_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        List what a review starts from: a pull request's changed files, or the
+        files of the repository at its default branch tip, only `file_paths`
+        when given. The listing carries the path filter extended by the
+        repository's .gitattributes ("path_filter") and, for repositories, the
+        commit it was taken at ("sha").
+        """
+        if pr_number is not None:
+            files, path_filter = await asyncio.gather(
+                self._get_paginated(client, f"/repos/{owner}/{repo_name}/pulls/{pr_number}/files"),
+                self._repo_path_filter(client, owner, repo_name)
+            )
+            return {"pr_number": pr_number, "sha": None, "entries": files, "path_filter": path_filter}
+        
+        if file_paths:
+            # A few files are looked up directly rather than listing the whole tree
+            with stage("tree_listing"):
+                commit_sha = await self._default_branch_commit(client, owner, repo_name)
+                entries, path_filter = await asyncio.gather(
+                    self._gather_bounded(
+                        lambda path: self._path_entry(client, owner, repo_name, commit_sha, path), file_paths
+                    ),
+                    self._repo_path_filter(client, owner, repo_name)
+                )
+            return {"pr_number": None, "sha": commit_sha, "entries": entries, "path_filter": path_filter}
+        
+        with stage("tree_listing"):
+            tree = await self._list_repo_tree(client, owner, repo_name)
+        path_filter = await self._repo_path_filter(client, owner, repo_name, tree["entries"])
+        return {"pr_number": None, "sha": tree["sha"], "entries": tree["entries"], "path_filter": path_filter}
+    
+    def filter_files(self, listing: Dict[str, Any],
+                     file_paths: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[SkippedFile]]:
+        """
+        Choose the listed files to download, optionally only file_paths of a
+        repository, and report those skipped without downloading them
+        """
+        path_filter: PathFilter = listing["path_filter"]
+        if listing["pr_number"] is not None:
+            # The listing has no file sizes; the patch gives one for added files and a lower bound otherwise
+            files, skipped = [], []
+            for file in listing["entries"]:
+                size = pr_file_size(file) if file["status"] != "removed" else None
+                reason = path_filter.skip_reason(file["filename"], size)
+                if reason == "too_large":
+                    logger.warning(f"Skipping large file: {file['filename']} (at least {size} bytes)")
+                    skipped.append(SkippedFile(file_path=file["filename"], reason=reason, size=size))
+                elif reason is None:
+                    files.append(file)
+                else:
+                    logger.info(f"Skipping non-reviewable file: {file['filename']}")
+            return files, skipped
+        
+        if file_paths:
+            logger.info(f"Using specific file paths: {file_paths}")
+            by_path = {entry["path"]: entry for entry in listing["entries"]}
+            entries = [by_path.get(path, {"path": path, "sha": None}) for path in file_paths]
+        else:
+            logger.info("Getting all files from repository")
+            entries = listing["entries"]
+        # Sizes and modes come from the tree listing, so oversized files and links are never downloaded
+        reviewable, skipped = [], []
+        for entry in entries:
+            reason = path_filter.skip_reason(entry["path"], entry.get("size"))
+            if reason == "too_large" or (reason is None and entry.get("mode") == SYMLINK_MODE):
+                skipped.append(SkippedFile(file_path=entry["path"], reason=reason or "symlink",
+                                           size=entry.get("size")))
+            elif reason is None:
+                reviewable.append(entry)
+        return (reviewable if file_paths else reviewable[:self.max_repo_files]), skipped
+    
+    async def fetch_files(self, client: httpx.AsyncClient, owner: str, repo_name: str, listing: Dict[str, Any],
+                          entries: List[Dict[str, Any]], skipped: List[SkippedFile]) -> List[CodeChange]:
+        """Download the contents of the chosen files and return them, with the skipped ones, as CodeChanges"""
+        path_filter: PathFilter = listing["path_filter"]
+        # Files skipped from the listing were never downloaded, but the listing knows their blobs
+        if listing["pr_number"] is not None:
+            shas = {file["filename"]: file.get("sha") for file in listing["entries"]}
+        else:
+            shas = {entry["path"]: entry.get("sha") for entry in listing["entries"]}
+        skipped_changes = [code_change(skip.file_path, skip, diff="", is_new=False, sha=shas.get(skip.file_path))
+                           for skip in skipped]
+        
+        if listing["pr_number"] is not None:
+            # Removed files have nothing left to review at the head commit; binary files are known from the listing
+            present = [file for file in entries if file["status"] != "removed" and not is_binary_pr_file(file)]
+            with stage("file_fetch"):
+                fetched = iter(await self._gather_bounded(
+                    lambda file: self._get_blob_content_async(client, owner, repo_name, file["filename"], file["sha"],
+                                                              path_filter),
+                    present
+                ))
+            contents = [
+                "" if file["status"] == "removed"
+                else SkippedFile(file_path=file["filename"], reason="binary") if is_binary_pr_file(file)
+                else next(fetched)
+                for file in entries
+            ]
+            return [
+                code_change(
+                    file["filename"],
+                    content,
+                    diff=file.get("patch") or "",
+                    is_new=file["status"] == "added",
+                    sha=file.get("sha")
+                )
+                for file, content in zip(entries, contents)
+            ] + skipped_changes
+        
+        with stage("file_fetch"):
+            contents = await self._fetch_tree_contents(client, owner, repo_name, listing["sha"], entries, path_filter)
+        return [
+            code_change(entry["path"], content, diff="", is_new=False, sha=entry["sha"], size=entry.get("size"))
+            for entry, content in zip(entries, contents)
+        ] + skipped_changes
+    
+    async def _default_branch_commit(self, client: httpx.AsyncClient, owner: str, repo_name: str) -> str:
+        """The commit at the tip of the default branch, which a repository review is pinned to"""
+        repo = await self._get_repo(client, owner, repo_name)
+        return await self._resolve_commit_sha(client, owner, repo_name, repo["default_branch"])
+    
+    async def _list_repo_tree(self, client: httpx.AsyncClient, owner: str, repo_name: str) -> Dict[str, Any]:
+        """List every file in the repository, with one recursive Git Trees API call when GitHub allows"""
+        # Pin the listing and any later downloads to one commit
+        commit_sha = await self._default_branch_commit(client, owner, repo_name)
+        entries = await self._list_tree_blobs(client, owner, repo_name, commit_sha)
+        logger.info(f"Listed {len(entries)} files in {owner}/{repo_name}@{commit_sha}")
+        return {"sha": commit_sha, "entries": entries}
+    
+    async def _list_tree_blobs(self, client: httpx.AsyncClient, owner: str, repo_name: str, tree_sha: str,
+                               prefix: str = "") -> List[Dict[str, Any]]:
+        """
+        Every file below a tree, with paths from the repository root. GitHub
+        truncates recursive listings of very large trees; such a tree is listed
+        one level at a time instead, and a single level too large to list fails
+        the review rather than silently leaving files out.
+        """
+        url = f"/repos/{owner}/{repo_name}/git/trees/{tree_sha}"
+        tree = await self._get_json(client, url, {"recursive": "1"})
+        if not tree.get("truncated"):
+            return [dict(entry, path=prefix + entry["path"]) for entry in tree["tree"] if entry["type"] == "blob"]
+        
+        logger.warning(f"Recursive listing of {owner}/{repo_name}:{prefix or '/'} was truncated; listing it by directory")
+        level = await self._get_json(client, url)
+        if level.get("truncated"):
+            raise ValueError(f"Directory {prefix or '/'} of {owner}/{repo_name} has too many entries to list")
+        blobs = [dict(entry, path=prefix + entry["path"]) for entry in level["tree"] if entry["type"] == "blob"]
+        subtrees = [entry for entry in level["tree"] if entry["type"] == "tree"]
+        nested = await self._gather_bounded(
+            lambda entry: self._list_tree_blobs(client, owner, repo_name, entry["sha"], prefix + entry["path"] + "/"),
+            subtrees
+        )
+        return blobs + [blob for listing in nested for blob in listing]
+    
+    async def _path_entry(self, client: httpx.AsyncClient, owner: str, repo_name: str, commit_sha: str,
+                          path: str) -> Dict[str, Any]:
+        """
+        The tree entry of one file at a commit, from the Contents API; a path
+        that is missing or not a file gets no sha and is reported as not found.
+        The content that comes with the answer goes into the blob cache.
+        """
+        response = await self._send(client, f"/repos/{owner}/{repo_name}/contents/{quote(path)}",
+                                    {"ref": commit_sha})
+        if response.status_code == 404:
+            return {"path": path, "sha": None}
+        response.raise_for_status()
+        content = response.json()
+        if not isinstance(content, dict) or content.get("type") not in ("file", "symlink"):
+            return {"path": path, "sha": None}
+        if content["type"] == "file" and content.get("encoding") == "base64" and self.blob_cache.get(content["sha"]) is None:
+            text = self._decode_api_content(path, content)
+            if isinstance(text, str):
+                self.blob_cache.put(content["sha"], text)
+        mode = SYMLINK_MODE if content["type"] == "symlink" else "100644"
+        return {"path": path, "type": "blob", "mode": mode, "sha": content["sha"], "size": content.get("size")}
+    
+    async def _repo_path_filter(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                                tree_entries: Optional[List[Dict[str, Any]]] = None) -> PathFilter:
+        """
+        The path filter extended by the repository's root .gitattributes. With a
+        tree listing the file is read from it (and the blob cache); otherwise the
+        default branch's copy is fetched and kept for repo_rules_ttl seconds.
+        """
+        if tree_entries is not None:
+            entry = next((entry for entry in tree_entries if entry["path"] == ".gitattributes"), None)
+            if entry is None:
+                return self.path_filter
+            text = await self._get_blob_content_async(client, owner, repo_name, entry["path"], entry["sha"])
+            return self.path_filter.with_gitattributes(text) if isinstance(text, str) else self.path_filter
+        
+        key = (owner, repo_name)
+        cached = self._repo_filters.get(key)
+        if cached is not None:
+            return cached
+        
+        path_filter = self.path_filter
+        try:
+            response = await self._send(client, f"/repos/{owner}/{repo_name}/contents/.gitattributes")
+            text = self._decode_api_content(".gitattributes", response.json()) if response.status_code == 200 else None
+            if isinstance(text, str):
+                path_filter = path_filter.with_gitattributes(text)
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read .gitattributes of {owner}/{repo_name}: {str(e)}")
+        
+        self._repo_filters.put(key, path_filter)
+        return path_filter
+    
+    async def _get_repo(self, client: httpx.AsyncClient, owner: str, repo_name: str) -> Dict[str, Any]:
+        """Repository metadata, such as the default branch, kept across reviews"""
+        key = (owner, repo_name)
+        repo = self.repo_objects.get(key)
+        record_cache_lookup("github_object", repo is not None)
+        if repo is None:
+            repo = await self._get_json(client, f"/repos/{owner}/{repo_name}")
+            self.repo_objects.put(key, repo)
+        return repo
+    
+    async def _get_pull_request(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                                pr_number: int) -> Dict[str, Any]:
+        """A pull request and its head, kept only briefly since every push moves the head"""
+        key = (owner, repo_name, pr_number)
+        pull_request = self.pull_requests.get(key)
+        record_cache_lookup("github_object", pull_request is not None)
+        if pull_request is None:
+            pull_request = await self._get_json(client, f"/repos/{owner}/{repo_name}/pulls/{pr_number}")
+            self.pull_requests.put(key, pull_request)
+        return pull_request
+    
+    def forget_pull_request(self, owner: str, repo_name: str, pr_number: int):
+        """Drop a cached pull request head, e.g. when a webhook reports a push"""
+        self.pull_requests.forget((owner, repo_name, pr_number))
+    
+    async def head_sha(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                       pr_number: Optional[int] = None) -> str:
+        """get_head_sha_async on an open client"""
+        if pr_number is not None:
+            pull_request = await self._get_pull_request(client, owner, repo_name, pr_number)
+            return pull_request["head"]["sha"]
+        repo = await self._get_repo(client, owner, repo_name)
+        return await self._resolve_commit_sha(client, owner, repo_name, repo["default_branch"])
+    
+    async def _resolve_commit_sha(self, client: httpx.AsyncClient, owner: str, repo_name: str, ref: str) -> str:
+        """Resolve a branch, tag or SHA to the commit SHA it points at"""
+        response = await self._send(client, f"/repos/{owner}/{repo_name}/commits/{quote(ref)}",
+                                    headers={"Accept": "application/vnd.github.sha"})
+        response.raise_for_status()
+        return response.text.strip()
+    
+    async def _fetch_tree_contents(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                                   commit_sha: str, entries: List[Dict[str, Any]],
+                                   path_filter: Optional[PathFilter] = None) -> List[FileContent]:
+        """Fetch the contents of tree entries, by blob or from a single tarball for large sets"""
+        contents = [self.blob_cache.get(entry["sha"]) if entry["sha"] else None for entry in entries]
+        missing = [entry for entry, content in zip(entries, contents) if content is None and entry["sha"]]
+        for entry, content in zip(entries, contents):
+            if entry["sha"]:
+                record_cache_lookup("blob", content is not None)
+        logger.info(f"Blob cache served {len(entries) - len(missing)} of {len(entries)} files")
+        
+        if len(missing) > self.tarball_threshold:
+            fetched = await self._fetch_tarball_contents(client, owner, repo_name, commit_sha, missing, path_filter)
+        else:
+            fetched = await self._gather_bounded(
+                lambda entry: self._download_blob(client, owner, repo_name, entry["path"], entry["sha"], path_filter),
+                missing
+            )
+        
+        fetched = iter(fetched)
+        return [
+            content if content is not None
+            else next(fetched) if entry["sha"]
+            else SkippedFile(file_path=entry["path"], reason="not_found")
+            for entry, content in zip(entries, contents)
+        ]
+    
+    async def _fetch_tarball_contents(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                                      ref: str, entries: List[Dict[str, Any]],
+                                      path_filter: Optional[PathFilter] = None) -> List[FileContent]:
+        """Download the repository tarball once and unpack the requested files in memory"""
+        logger.info(f"Downloading tarball for {owner}/{repo_name}@{ref} ({len(entries)} files)")
+        archive = io.BytesIO()
+        await self.rate_limiter.acquire()
+        request = client.build_request("GET", f"/repos/{owner}/{repo_name}/tarball/{quote(ref)}")
+        response = await client.send(request, stream=True, follow_redirects=True)
+        GITHUB_REQUESTS.labels(github_endpoint(request.url.path), str(response.status_code)).inc()
+        try:
+            self.rate_limiter.update(response)
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                archive.write(chunk)
+        finally:
+            await response.aclose()
+        archive.seek(0)
+        
+        wanted = {entry["path"]: entry for entry in entries}
+        # Decompression is CPU bound, keep it off the event loop
+        found = await asyncio.to_thread(self._read_tarball_members, archive, wanted)
+        
+        contents = []
+        for entry in entries:
+            data = found.get(entry["path"])
+            if data is None:
+                contents.append(SkippedFile(file_path=entry["path"], reason="not_found"))
+            else:
+                contents.append(self._decode_bytes(entry["path"], data, path_filter))
+                if isinstance(contents[-1], str):
+                    self.blob_cache.put(entry["sha"], contents[-1])
+        return contents
+    
+    def _read_tarball_members(self, archive: io.BytesIO, wanted: Dict[str, Any]) -> Dict[str, bytes]:
+        """Extract the wanted files from a GitHub tarball, whose entries sit under one top-level directory"""
+        found = {}
+        with tarfile.open(fileobj=archive, mode="r:gz") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                path = member.name.split("/", 1)[-1]
+                if path in wanted:
+                    found[path] = tar.extractfile(member).read()
+        return found
+    
+    async def _gather_bounded(self, fetch: Callable[[Any], Awaitable[Any]], items: List[Any]) -> List[Any]:
+        """Run fetch for every item with at most max_concurrency in flight, preserving order"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def run(item):
+            async with semaphore:
+                return await fetch(item)
+        
+        return await asyncio.gather(*(run(item) for item in items))
+    
+    def api_client(self) -> httpx.AsyncClient:
+        """Create an HTTP client for the GitHub REST API sized to the fetch concurrency"""
+        headers = {"Accept": "application/vnd.github+json"}
+        if self.github_token:
+            headers["Authorization"] = f"Bearer {self.github_token}"
+        return httpx.AsyncClient(
+            base_url=GITHUB_API_URL,
+            headers=headers,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+            transport=self._transport,
+        )
+    
+    async def _send(self, client: httpx.AsyncClient, url: str, params: Optional[Dict[str, Any]] = None,
+                    headers: Optional[Dict[str, str]] = None, conditional: bool = True) -> httpx.Response:
+        """
+        GET a GitHub API URL through the rate-limit scheduler, revalidating with
+        If-None-Match when an earlier response for the same URL is cached
+        """
+        request = client.build_request("GET", url, params=params, headers=headers)
+        key = self.etag_cache.key(request)
+        cached = self.etag_cache.lookup(key) if conditional else None
+        if cached:
+            request.headers["If-None-Match"] = cached[0]
+        
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            response = await client.send(request)
+            GITHUB_REQUESTS.labels(github_endpoint(request.url.path), str(response.status_code)).inc()
+            self.rate_limiter.update(response)
+            delay = self.rate_limiter.backoff(response)
+            if delay is None or attempt == self.max_retries:
+                break
+            logger.warning(f"GitHub rate limit hit for {url}, retrying in {delay:.1f}s")
+        
+        if cached:
+            record_cache_lookup("etag", response.status_code == 304)
+        if response.status_code == 304 and cached:
+            return self.etag_cache.replay(cached, response)
+        if conditional and response.status_code == 200:
+            self.etag_cache.store(key, response)
+        return response
+    
+    async def _get_json(self, client: httpx.AsyncClient, url: str, params: Optional[Dict[str, Any]] = None,
+                        conditional: bool = True) -> Any:
+        """GET a GitHub API resource and return the decoded JSON body"""
+        response = await self._send(client, url, params, conditional=conditional)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _get_paginated(self, client: httpx.AsyncClient, url: str) -> List[Any]:
+        """GET every page of a GitHub list endpoint by following the Link headers"""
+        items = []
+        params = {"per_page": 100}
+        while url:
+            response = await self._send(client, url, params)
+            response.raise_for_status()
+            items.extend(response.json())
+            # The "next" link already carries the query string
+            url = response.links.get("next", {}).get("url")
+            params = None
+        return items
+    
     def apply_labels(self, owner: str, repo_name: str, pr_number: int, issues: List[Issue]):
         """Apply labels to a PR based on detected issues"""
+        with stage("label_application"):
+            self._apply_labels(owner, repo_name, pr_number, issues)
+    
+    def _apply_labels(self, owner: str, repo_name: str, pr_number: int, issues: List[Issue]):
         try:
             logger.info(f"Applying labels to PR #{pr_number}")
-            repo = self.github.get_repo(f"{owner}/{repo_name}")
-            pr = repo.get_pull(pr_number)
+            repo = self._repo_object(owner, repo_name)
             
             # Extract unique labels from issues
             labels = set()
             for issue in issues:
                 for label in issue.labels:
                     labels.add(label)
+            if not labels:
+                return
             
-            # Create labels if they don't exist
+            # Create labels if they don't exist, checked against one listing of the repository's labels
+            existing = self._repo_label_names(owner, repo_name, repo)
             for label in labels:
-                try:
-                    label_name = label.name.lower()
-                    try:
-                        repo.get_label(label_name)
-                    except:
-                        self._create_label(repo, label)
-                    
-                    # Add label to PR
-                    pr.add_to_labels(label_name)
-                    logger.info(f"Added label {label_name} to PR")
-                except Exception as e:
-                    logger.error(f"Error adding label {label}: {str(e)}")
+                label_name = label.name.lower()
+                if label_name not in existing:
+                    self._create_label(repo, label)
+                    existing.add(label_name)
+            
+            # Add every label to the PR in one request
+            label_names = sorted(label.name.lower() for label in labels)
+            self._pull_object(owner, repo_name, pr_number, repo).add_to_labels(*label_names)
+            logger.info(f"Added labels {', '.join(label_names)} to PR")
         except Exception as e:
             logger.error(f"Error applying labels: {str(e)}")
     
+    def _repo_object(self, owner: str, repo_name: str):
+        """A lazy PyGithub repository, which costs no request until it is used"""
+        key = ("repository", owner, repo_name)
+        repo = self.repo_objects.get(key)
+        if repo is None:
+            repo = self.github.get_repo(f"{owner}/{repo_name}", lazy=True)
+            self.repo_objects.put(key, repo)
+        return repo
+    
+    def _pull_object(self, owner: str, repo_name: str, pr_number: int, repo):
+        """A PyGithub pull request; labelling only needs its URL, so it is kept as long as repository objects"""
+        key = ("pull", owner, repo_name, pr_number)
+        pull_request = self.repo_objects.get(key)
+        if pull_request is None:
+            pull_request = repo.get_pull(pr_number)
+            self.repo_objects.put(key, pull_request)
+        return pull_request
+    
+    def _repo_label_names(self, owner: str, repo_name: str, repo) -> set:
+        """Lower-cased names of the repository's labels, listed once and kept across reviews"""
+        key = ("labels", owner, repo_name)
+        names = self.repo_objects.get(key)
+        record_cache_lookup("github_object", names is not None)
+        if names is None:
+            names = {label.name.lower() for label in repo.get_labels()}
+            self.repo_objects.put(key, names)
+        return names
+    
     def _create_label(self, repo, label_name: IssueLabel):
         """Create a new label in the repository if it doesn't exist"""
         logger.info(f"Creating label: {label_name}")
@@ -184,7 +645,6 @@ class GithubService:
                 IssueLabel.PERFORMANCE: "ffb8c6",   # pink
                 IssueLabel.DOCUMENTATION: "0e8a16", # green
                 IssueLabel.BUG: "d93f0b",           # orange
-                IssueLabel.ERROR: "ff0000",         # bright red
             }
             
             color = colors.get(label_name, "cccccc")  # default gray
@@ -193,74 +653,65 @@ class GithubService:
         except Exception as e:
             logger.error(f"Error creating label {label_name}: {str(e)}")
     
-    def _get_file_content_safe(self, repo, file_path: str, ref: str = None) -> str:
-        """Safe wrapper around _get_file_content with additional error handling"""
+    async def _get_blob_content_async(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                                      file_path: str, sha: str,
+                                      path_filter: Optional[PathFilter] = None) -> FileContent:
+        """Get the content of a file from its Git blob SHA, using the blob cache when possible"""
+        cached = self.blob_cache.get(sha)
+        record_cache_lookup("blob", cached is not None)
+        if cached is not None:
+            logger.info(f"Blob cache hit for file: {file_path}")
+            return cached
+        return await self._download_blob(client, owner, repo_name, file_path, sha, path_filter)
+    
+    async def _download_blob(self, client: httpx.AsyncClient, owner: str, repo_name: str,
+                             file_path: str, sha: str, path_filter: Optional[PathFilter] = None) -> FileContent:
+        """Download and decode a Git blob, storing text in the blob cache"""
         try:
-            return self._get_file_content(repo, file_path, ref)
+            logger.info(f"Getting blob for file: {file_path}")
+            start = time.perf_counter()
+            # Blobs are immutable and already cached by SHA, so skip the validator cache
+            blob = await self._get_json(client, f"/repos/{owner}/{repo_name}/git/blobs/{sha}", conditional=False)
+            FILE_FETCH_SECONDS.observe(time.perf_counter() - start)
+            content = self._decode_api_content(file_path, blob, path_filter)
+            if isinstance(content, str):
+                self.blob_cache.put(sha, content)
+            return content
         except Exception as e:
-            logger.error(f"Error in _get_file_content_safe for {file_path}: {str(e)}")
-            return f"[Error reading file: {file_path}]"
+            logger.error(f"Error retrieving file content: {str(e)}")
+            return SkippedFile(file_path=file_path, reason="unavailable")
     
-    def _get_file_content(self, repo, file_path: str, ref: str = None) -> str:
-        """Get the content of a file from a repository"""
+    def _decode_api_content(self, file_path: str, content: Dict[str, Any],
+                            path_filter: Optional[PathFilter] = None) -> FileContent:
+        """Turn a base64 contents or blob API payload into text, sized by the repository's path filter"""
+        max_size = (path_filter or self.path_filter).max_file_size
+        if max_size is not None and content["size"] > max_size:
+            logger.warning(f"Skipping large file: {file_path} ({content['size']} bytes)")
+            return SkippedFile(file_path=file_path, reason="too_large", size=content["size"])
+        
         try:
-            logger.info(f"Getting content for file: {file_path}")
-            content = repo.get_contents(file_path, ref=ref)
-            
-            # Skip binary files and very large files
-            if content.size > 500000:  # Skip files larger than 500KB
-                logger.warning(f"Skipping large file: {file_path} ({content.size} bytes)")
-                return f"[File too large to analyze: {file_path} ({content.size} bytes)]"
-            
-            # First decode from base64
-            try:
-                decoded_content = base64.b64decode(content.content)
-                
-                # Try to detect if this is a text file by attempting to decode as utf-8
-                try:
-                    return decoded_content.decode('utf-8')
-                except UnicodeDecodeError:
-                    logger.warning(f"Unable to decode file as UTF-8: {file_path}")
-                    # Try with error handling
-                    try:
-                        return decoded_content.decode('utf-8', errors='replace')
-                    except:
-                        # If all else fails, return a placeholder
-                        logger.warning(f"File appears to be binary: {file_path}")
-                        return f"[Binary file not displayed: {file_path}]"
-            except Exception as e:
-                logger.error(f"Error decoding base64 content: {str(e)}")
-                return f"[Error decoding content: {str(e)}]"
-                
+            decoded_content = base64.b64decode(content["content"])
         except Exception as e:
-            logger.error(f"Error retrieving file content: {str(e)}")
-            return f"[Error retrieving file: {str(e)}]"
+            logger.error(f"Error decoding base64 content: {str(e)}")
+            return SkippedFile(file_path=file_path, reason="unavailable", size=content["size"])
+        return self._decode_bytes(file_path, decoded_content, path_filter)
+    
+    def _decode_bytes(self, file_path: str, data: bytes, path_filter: Optional[PathFilter] = None) -> FileContent:
+        """Decode file bytes as text, or skip files that are too large or binary"""
+        max_size = (path_filter or self.path_filter).max_file_size
+        if max_size is not None and len(data) > max_size:
+            logger.warning(f"Skipping large file: {file_path} ({len(data)} bytes)")
+            return SkippedFile(file_path=file_path, reason="too_large", size=len(data))
+        if looks_binary(data):
+            logger.info(f"Skipping binary file: {file_path}")
+            return SkippedFile(file_path=file_path, reason="binary", size=len(data))
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            # Text in another encoding; keep what decodes
+            logger.warning(f"Unable to decode file as UTF-8: {file_path}")
+            return data.decode('utf-8', errors='replace')
     
     def _is_reviewable_file(self, file_path: str) -> bool:
-        """Check if a file should be included in code review"""
-        logger.debug(f"Checking if file is reviewable: {file_path}")
-        
-        # Skip binary files, images, etc.
-        skip_extensions = ['.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.pdf', 
-                           '.zip', '.tar', '.gz', '.pyc', '.min.js', '.min.css',
-                           '.woff', '.woff2', '.ttf', '.eot', '.mp3', '.mp4', '.mov',
-                           '.avi', '.exe', '.dll', '.so', '.dylib', '.class', '.jar']
-        
-        # Skip certain directories
-        skip_directories = ['node_modules/', 'venv/', 'dist/', 'build/', '.git/',
-                           '__pycache__/', '.idea/', '.vscode/']
-        
-        # Check file extension
-        file_ext = '.' + file_path.split('.')[-1].lower() if '.' in file_path else ''
-        if file_ext in skip_extensions:
-            logger.debug(f"Skipping file with extension {file_ext}: {file_path}")
-            return False
-        
-        # Check directories
-        for directory in skip_directories:
-            if directory in file_path:
-                logger.debug(f"Skipping file in directory {directory}: {file_path}")
-                return False
-        
-        # Assume it's reviewable if it passed all checks
-        return True
+        """Check if a file should be included in code review by the default rules"""
+        return self.path_filter.is_reviewable(file_path)
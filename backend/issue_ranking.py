@@ -0,0 +1,164 @@
+"""
+Deduplication and ranking of review issues.
+
+Split, retried and incrementally re-run reviews report the same finding
+more than once, worded a little differently each time. Issues are clustered
+when they are in the same file and either touch nearby lines with similar
+titles, or (when line numbers are missing) have near-identical titles. Each
+cluster is reported once, with the labels and lines of all its members, and
+clusters are ranked by severity, label weight and how often the finding was
+reported before the max_issues cap is applied.
+
+Candidate clusters are looked up through per-file indexes of line numbers
+and title words, so adding an issue compares it with a handful of clusters
+rather than with every issue seen so far.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+from models import Issue, IssueLabel
+
+SEVERITY_WEIGHTS = {"critical": 4, "high": 3, "medium": 2, "low": 1, "info": 0}
+# Issues without a severity rank as medium
+DEFAULT_SEVERITY_WEIGHT = SEVERITY_WEIGHTS["medium"]
+
+LABEL_WEIGHTS = {
+    IssueLabel.SECURITY: 5,
+    IssueLabel.BUG: 4,
+    IssueLabel.PERFORMANCE: 3,
+    IssueLabel.TEST_COVERAGE: 2,
+    IssueLabel.REFACTOR: 2,
+    IssueLabel.DOCUMENTATION: 1,
+    IssueLabel.STYLE: 1,
+}
+
+# Lines this close together count as the same place
+LINE_TOLERANCE = 2
+# Title word overlap (Jaccard) needed for issues at the same place, and for issues without lines
+SAME_PLACE_SIMILARITY = 0.3
+TITLE_ONLY_SIMILARITY = 0.6
+
+STOPWORDS = frozenset({"a", "an", "the", "of", "in", "on", "for", "to", "and", "or", "is", "be", "with", "not", "no"})
+_WORD = re.compile(r"[a-z0-9]+")
+
+@lru_cache(maxsize=4096)
+def title_words(title: str) -> frozenset:
+    """Normalized words of a title, ignoring stopwords and plural endings"""
+    words = set()
+    for word in _WORD.findall(title.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return frozenset(words)
+
+def similarity(first: frozenset, second: frozenset) -> float:
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+def issue_score(issue: Issue) -> int:
+    severity = SEVERITY_WEIGHTS.get(issue.severity or "", DEFAULT_SEVERITY_WEIGHT)
+    label = max((LABEL_WEIGHTS.get(label, 0) for label in issue.labels), default=0)
+    return severity * 10 + label
+
+class IssueCluster:
+    __slots__ = ("issue", "words", "lines", "labels", "count", "score", "order")
+
+    def __init__(self, issue: Issue, words: frozenset, order: int):
+        self.issue = issue
+        self.words = words
+        self.lines: Set[int] = set(issue.line_numbers)
+        self.labels: List[IssueLabel] = list(issue.labels)
+        self.count = 1
+        self.score = issue_score(issue)
+        self.order = order
+
+    def add(self, issue: Issue) -> Set[int]:
+        """Merge a duplicate into the cluster; returns the lines it adds"""
+        self.count += 1
+        new_lines = set(issue.line_numbers) - self.lines
+        self.lines |= new_lines
+        for label in issue.labels:
+            if label not in self.labels:
+                self.labels.append(label)
+        score = issue_score(issue)
+        # The best-ranked wording represents the cluster
+        if score > self.score:
+            self.issue, self.score = issue, score
+        return new_lines
+
+    def merged(self) -> Issue:
+        return self.issue.model_copy(update={"line_numbers": sorted(self.lines), "labels": self.labels})
+
+class IssueClusters:
+    def __init__(self):
+        """Issues grouped into clusters of near-duplicates, in the order their first member arrived"""
+        self.clusters: List[IssueCluster] = []
+        self._by_line: Dict[str, Dict[int, List[IssueCluster]]] = {}
+        self._by_word: Dict[str, Dict[str, List[IssueCluster]]] = {}
+
+    def add(self, issue: Issue) -> bool:
+        """Add an issue; returns True when it is a new finding rather than a duplicate"""
+        words = title_words(issue.title)
+        cluster = self._find(issue, words)
+        if cluster is not None:
+            self._index(cluster, cluster.add(issue), ())
+            return False
+
+        cluster = IssueCluster(issue, words, len(self.clusters))
+        self.clusters.append(cluster)
+        self._index(cluster, cluster.lines, words)
+        return True
+
+    def ranked(self, max_issues: Optional[int] = None) -> List[Issue]:
+        """One issue per cluster, best first, cut at max_issues"""
+        order = sorted(self.clusters, key=lambda cluster: (-cluster.score, -cluster.count, cluster.order))
+        if max_issues is not None:
+            order = order[:max(max_issues, 0)]
+        return [cluster.merged() for cluster in order]
+
+    def _find(self, issue: Issue, words: frozenset) -> Optional[IssueCluster]:
+        path = issue.file_path
+        best, best_similarity = None, 0.0
+        if issue.line_numbers:
+            by_line = self._by_line.get(path, {})
+            candidates = {id(c): c for line in issue.line_numbers
+                          for near in range(line - LINE_TOLERANCE, line + LINE_TOLERANCE + 1)
+                          for c in by_line.get(near, ())}
+            for candidate in candidates.values():
+                value = similarity(words, candidate.words)
+                if value >= SAME_PLACE_SIMILARITY and value > best_similarity:
+                    best, best_similarity = candidate, value
+        if best is None:
+            by_word = self._by_word.get(path, {})
+            candidates = {id(c): c for word in words for c in by_word.get(word, ())}
+            for candidate in candidates.values():
+                # Issues at different places are different findings, however alike their titles
+                if issue.line_numbers and candidate.lines:
+                    continue
+                value = similarity(words, candidate.words)
+                if value >= TITLE_ONLY_SIMILARITY and value > best_similarity:
+                    best, best_similarity = candidate, value
+        return best
+
+    def _index(self, cluster: IssueCluster, lines: Iterable[int], words: Iterable[str]):
+        path = cluster.issue.file_path
+        # Lines are indexed as given and looked up with LINE_TOLERANCE on either side
+        by_line = self._by_line.setdefault(path, {})
+        for line in lines:
+            by_line.setdefault(line, []).append(cluster)
+        by_word = self._by_word.setdefault(path, {})
+        for word in words:
+            by_word.setdefault(word, []).append(cluster)
+
+def rank_issues(issues: Iterable[Issue], max_issues: Optional[int] = None) -> List[Issue]:
+    """Collapse near-duplicate issues and return the best max_issues of them"""
+    clusters = IssueClusters()
+    for issue in issues:
+        clusters.add(issue)
+    return clusters.ranked(max_issues)
@@ -0,0 +1,519 @@
+"""
+Asynchronous review jobs.
+
+Instead of holding a request open for the whole review, clients submit a
+ReviewJobRequest and receive a job id straight away. Jobs wait in a priority
+queue and are run by a fixed pool of worker tasks; clients poll the job or
+are notified through a callback URL when it finishes. Submitting the same
+review (same URL, commit SHA, files and settings) while an earlier job is
+queued, running or completed returns that job instead of queuing another.
+
+Job state lives in a JobStore: MemoryJobStore keeps it in-process and
+SQLiteJobStore persists it so queued jobs survive a restart and can be
+shared by several worker processes; a worker claims a job before running it,
+so each job runs once however many workers queued it. A claim is a lease the
+running worker renews every few seconds; only a job whose lease ran out, e.g.
+because its worker died, is taken back and queued again. Every worker polls
+the store, so jobs submitted through another process are picked up without
+a restart.
+
+Callback URLs must use https and point at a public host: the host is
+checked when the job is submitted and its addresses again right before the
+POST, so a callback cannot be aimed at the service's own network.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import ipaddress
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Set
+from urllib.parse import urlsplit
+
+import httpx
+
+from models import JobStatus, ReviewJob, ReviewJobRequest, ReviewResponse
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED = (JobStatus.QUEUED, JobStatus.RUNNING)
+
+def job_dedup_key(request: ReviewJobRequest, head_sha: Optional[str], tenant_id: Optional[str] = None) -> Optional[str]:
+    """
+    Identify a review by what it looks at and how, or return None when the
+    commit is unknown and two submissions cannot be told apart
+    """
+    if not head_sha:
+        return None
+    material = {
+        "url": str(request.url),
+        "head_sha": head_sha,
+        "tenant_id": tenant_id,
+        "file_paths": sorted(request.file_paths) if request.file_paths else None,
+        "settings": request.settings.model_dump(mode="json"),
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+def check_callback_url(url: str) -> str:
+    """
+    Return the host of a callback URL, or raise ValueError unless it uses https
+    and does not name a local or private host
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").rstrip(".").lower()
+    if parts.scheme != "https":
+        raise ValueError("callback_url must use https")
+    if not host:
+        raise ValueError("callback_url has no host")
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError(f"callback_url host {host} is not public")
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        # A host name; its addresses are checked before each callback
+        return host
+    if not address.is_global:
+        raise ValueError(f"callback_url host {host} is not public")
+    return host
+
+async def resolve_host(host: str, port: int) -> List[str]:
+    """The addresses a host name resolves to"""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [info[4][0] for info in infos]
+
+async def check_callback_addresses(url: str):
+    """Raise ValueError unless the callback URL is valid and every address of its host is public"""
+    host = check_callback_url(url)
+    port = urlsplit(url).port or 443
+    addresses = await resolve_host(host, port)
+    private = [address for address in addresses if not ipaddress.ip_address(address.split("%")[0]).is_global]
+    if not addresses or private:
+        raise ValueError(f"callback_url host {host} resolves to non-public addresses {private}")
+
+class JobStore:
+    """Interface for job storage"""
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        raise NotImplementedError
+
+    def save(self, job: ReviewJob):
+        raise NotImplementedError
+
+    def find(self, dedup_key: str) -> Optional[ReviewJob]:
+        """Most recent job with this key that has not failed"""
+        raise NotImplementedError
+
+    def unfinished(self) -> List[ReviewJob]:
+        """Jobs that were queued or running, oldest first"""
+        raise NotImplementedError
+
+    def claim(self, job_id: str, worker_id: str, now: float) -> Optional[ReviewJob]:
+        """Mark a queued job running on worker_id and return it, or None if it is not queued (any more)"""
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker_id: str, now: float) -> bool:
+        """Renew worker_id's claim on a running job; False if the worker no longer holds it"""
+        raise NotImplementedError
+
+    def requeue(self, job_id: str, worker_id: Optional[str] = None,
+                stale_before: Optional[float] = None) -> Optional[ReviewJob]:
+        """
+        Put a running job back in the queued state and return it, if it is still
+        held by worker_id (when given) and its claim was last renewed before
+        stale_before (when given); otherwise return None
+        """
+        raise NotImplementedError
+
+def _lease_renewed_at(job: ReviewJob) -> float:
+    # Jobs claimed before heartbeats were recorded only have their start time
+    return job.heartbeat_at or job.started_at or 0.0
+
+def _can_requeue(job: Optional[ReviewJob], worker_id: Optional[str], stale_before: Optional[float]) -> bool:
+    if job is None or job.status != JobStatus.RUNNING:
+        return False
+    if worker_id is not None and job.worker_id != worker_id:
+        return False
+    return stale_before is None or _lease_renewed_at(job) < stale_before
+
+def _mark_queued(job: ReviewJob):
+    job.status = JobStatus.QUEUED
+    job.started_at = None
+    job.worker_id = None
+    job.heartbeat_at = None
+
+class MemoryJobStore(JobStore):
+    def __init__(self, max_entries: int = 1000):
+        """Keep up to max_entries jobs in-process, dropping the oldest finished ones first"""
+        self.max_entries = max_entries
+        self._jobs: "OrderedDict[str, ReviewJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def save(self, job: ReviewJob):
+        with self._lock:
+            self._jobs[job.id] = job
+            if len(self._jobs) > self.max_entries:
+                finished = [job_id for job_id, stored in self._jobs.items() if stored.status not in UNFINISHED]
+                for job_id in finished[:len(self._jobs) - self.max_entries]:
+                    del self._jobs[job_id]
+
+    def find(self, dedup_key: str) -> Optional[ReviewJob]:
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.dedup_key == dedup_key and job.status != JobStatus.FAILED:
+                    return job
+        return None
+
+    def unfinished(self) -> List[ReviewJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status in UNFINISHED]
+
+    def claim(self, job_id: str, worker_id: str, now: float) -> Optional[ReviewJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.QUEUED:
+                return None
+            job.status = JobStatus.RUNNING
+            job.started_at = now
+            job.worker_id = worker_id
+            job.heartbeat_at = now
+            return job
+
+    def heartbeat(self, job_id: str, worker_id: str, now: float) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.RUNNING or job.worker_id != worker_id:
+                return False
+            job.heartbeat_at = now
+            return True
+
+    def requeue(self, job_id: str, worker_id: Optional[str] = None,
+                stale_before: Optional[float] = None) -> Optional[ReviewJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not _can_requeue(job, worker_id, stale_before):
+                return None
+            _mark_queued(job)
+            return job
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str, max_entries: int = 1000):
+        """Job store kept in a SQLite file so queued jobs survive a restart"""
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, dedup_key TEXT, status TEXT NOT NULL, "
+                "created_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_dedup_key ON jobs (dedup_key)")
+            # The claim is kept in columns too, so it can be checked and changed in one statement
+            for column in ("worker_id TEXT", "heartbeat_at REAL"):
+                try:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    # Added when the store was first opened by this version
+                    pass
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return ReviewJob.model_validate_json(row[0]) if row else None
+
+    def save(self, job: ReviewJob):
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (id, dedup_key, status, created_at, worker_id, heartbeat_at, value) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.dedup_key, job.status.value, job.created_at, job.worker_id, job.heartbeat_at,
+                 job.model_dump_json())
+            )
+            db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND id NOT IN "
+                "(SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (JobStatus.COMPLETED.value, JobStatus.FAILED.value, self.max_entries)
+            )
+
+    def find(self, dedup_key: str) -> Optional[ReviewJob]:
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM jobs WHERE dedup_key = ? AND status != ? ORDER BY created_at DESC LIMIT 1",
+                (dedup_key, JobStatus.FAILED.value)
+            ).fetchone()
+        return ReviewJob.model_validate_json(row[0]) if row else None
+
+    def unfinished(self) -> List[ReviewJob]:
+        with self._lock, self._connect() as db:
+            rows = db.execute(
+                "SELECT value FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+            ).fetchall()
+        return [ReviewJob.model_validate_json(row[0]) for row in rows]
+
+    def claim(self, job_id: str, worker_id: str, now: float) -> Optional[ReviewJob]:
+        # The status check and update happen in one statement, so two processes cannot both claim a job
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value FROM jobs WHERE id = ? AND status = ?",
+                             (job_id, JobStatus.QUEUED.value)).fetchone()
+            if row is None:
+                return None
+            job = ReviewJob.model_validate_json(row[0])
+            job.status = JobStatus.RUNNING
+            job.started_at = now
+            job.worker_id = worker_id
+            job.heartbeat_at = now
+            claimed = db.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, heartbeat_at = ?, value = ? WHERE id = ? AND status = ?",
+                (job.status.value, worker_id, now, job.model_dump_json(), job_id, JobStatus.QUEUED.value)
+            ).rowcount
+        return job if claimed else None
+
+    def heartbeat(self, job_id: str, worker_id: str, now: float) -> bool:
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value FROM jobs WHERE id = ? AND status = ? AND worker_id = ?",
+                             (job_id, JobStatus.RUNNING.value, worker_id)).fetchone()
+            if row is None:
+                return False
+            job = ReviewJob.model_validate_json(row[0])
+            job.heartbeat_at = now
+            return db.execute(
+                "UPDATE jobs SET heartbeat_at = ?, value = ? WHERE id = ? AND status = ? AND worker_id = ?",
+                (now, job.model_dump_json(), job_id, JobStatus.RUNNING.value, worker_id)
+            ).rowcount > 0
+
+    def requeue(self, job_id: str, worker_id: Optional[str] = None,
+                stale_before: Optional[float] = None) -> Optional[ReviewJob]:
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value, worker_id, heartbeat_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = ReviewJob.model_validate_json(row[0])
+            if not _can_requeue(job, worker_id, stale_before):
+                return None
+            _mark_queued(job)
+            # Only if the claim is unchanged since it was read, i.e. its worker did not renew it meanwhile
+            requeued = db.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, heartbeat_at = NULL, value = ? "
+                "WHERE id = ? AND status = ? AND worker_id IS ? AND heartbeat_at IS ?",
+                (job.status.value, job.model_dump_json(), job_id, JobStatus.RUNNING.value, row[1], row[2])
+            ).rowcount
+        return job if requeued else None
+
+class JobQueue:
+    def __init__(self, runner: Callable[[ReviewJob], Awaitable[ReviewResponse]],
+                 store: Optional[JobStore] = None, concurrency: int = 2, callback_timeout: float = 10.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, lease_seconds: float = 60.0,
+                 worker_id: Optional[str] = None, poll_seconds: float = 5.0):
+        """
+        Run submitted jobs through `runner` on `concurrency` worker tasks. A
+        running job's claim is renewed every third of lease_seconds; a job whose
+        claim was not renewed for lease_seconds is taken back and run again. The
+        store is checked for jobs queued by other processes every poll_seconds.
+        """
+        self.runner = runner
+        self.transport = transport
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        # Identifies this process's claims in a store shared with other workers
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.store = store if store is not None else MemoryJobStore()
+        self.concurrency = max(1, concurrency)
+        self.callback_timeout = callback_timeout
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._watcher: Optional[asyncio.Task] = None
+        # Ids in the local queue, so polling the store does not queue a job twice
+        self._pending: Set[str] = set()
+        self._busy: Set[asyncio.Task] = set()
+        self._draining = False
+        self._sequence = 0
+
+    def start(self):
+        """
+        Start the workers on the running event loop and queue the jobs waiting
+        in the store, taking back running jobs whose worker stopped renewing
+        its claim
+        """
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._pending = set()
+        self._draining = False
+        self._enqueue_waiting()
+        self._requeue_expired()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._watcher = asyncio.create_task(self._watch_store())
+        logger.info(f"Started {self.concurrency} review job workers as {self.worker_id}")
+
+    def _requeue_expired(self):
+        """Queue again the running jobs whose claim expired, e.g. because their worker died"""
+        stale_before = time.time() - self.lease_seconds
+        for job in self.store.unfinished():
+            if job.status != JobStatus.RUNNING or job.worker_id == self.worker_id:
+                continue
+            requeued = self.store.requeue(job.id, stale_before=stale_before)
+            if requeued is not None:
+                logger.warning(f"Review job {job.id} held by {job.worker_id} expired; queuing it again")
+                self._enqueue(requeued)
+
+    def _enqueue_waiting(self):
+        """Queue the jobs waiting in the store, including those submitted through other processes"""
+        for job in self.store.unfinished():
+            if job.status == JobStatus.QUEUED:
+                self._enqueue(job)
+
+    async def _watch_store(self):
+        while True:
+            await asyncio.sleep(min(self.poll_seconds, self.lease_seconds / 2))
+            self._enqueue_waiting()
+            self._requeue_expired()
+
+    async def stop(self, timeout: float = 0.0):
+        """
+        Stop taking jobs, give running ones up to timeout seconds to finish and
+        cancel the workers. Jobs that did not finish stay marked unfinished and
+        are retried on the next start.
+        """
+        self._draining = True
+        if timeout > 0 and self._busy:
+            logger.info(f"Waiting up to {timeout:.0f}s for {len(self._busy)} running review jobs")
+            await asyncio.wait(set(self._busy), timeout=timeout)
+        tasks = self._workers + ([self._watcher] if self._watcher else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._watcher = None
+
+    def submit(self, request: ReviewJobRequest, head_sha: Optional[str] = None,
+               tenant_id: Optional[str] = None) -> ReviewJob:
+        """
+        Queue a review, or return the tenant's existing job for the same review;
+        raises ValueError for a callback URL that is not https or not public
+        """
+        if request.callback_url:
+            check_callback_url(str(request.callback_url))
+        self.start()
+        dedup_key = job_dedup_key(request, head_sha, tenant_id)
+        if dedup_key:
+            existing = self.store.find(dedup_key)
+            if existing is not None:
+                logger.info(f"Review job {existing.id} already covers this request ({existing.status.value})")
+                return existing
+
+        job = ReviewJob(
+            id=uuid.uuid4().hex,
+            request=request,
+            head_sha=head_sha,
+            tenant_id=tenant_id,
+            dedup_key=dedup_key,
+            created_at=time.time()
+        )
+        self.store.save(job)
+        self._enqueue(job)
+        logger.info(f"Queued review job {job.id} with priority {request.priority}")
+        return job
+
+    def get(self, job_id: str) -> Optional[ReviewJob]:
+        return self.store.get(job_id)
+
+    def _enqueue(self, job: ReviewJob):
+        if job.id in self._pending:
+            return
+        self._pending.add(job.id)
+        # Highest priority first, then first come first served
+        self._sequence += 1
+        self._queue.put_nowait((-job.request.priority, self._sequence, job.id))
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._pending.discard(job_id)
+            try:
+                # A draining queue leaves new work queued in the store for the next start
+                job = None if self._draining else self.store.claim(job_id, self.worker_id, time.time())
+                if job is not None:
+                    # Its own task, so stop() can wait for the job without waiting for the worker
+                    running = asyncio.create_task(self._run(job))
+                    heartbeat = asyncio.create_task(self._heartbeat(job.id))
+                    self._busy.add(running)
+                    try:
+                        await running
+                    finally:
+                        self._busy.discard(running)
+                        heartbeat.cancel()
+                        if job.status == JobStatus.RUNNING:
+                            # Cancelled by stop(); hand the job straight back instead of waiting out the lease
+                            self.store.requeue(job.id, worker_id=self.worker_id)
+            finally:
+                self._queue.task_done()
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self.store.heartbeat(job_id, self.worker_id, time.time()):
+                logger.warning(f"Lost the claim on review job {job_id}")
+                return
+
+    async def _run(self, job: ReviewJob):
+        try:
+            job.result = await self.runner(job)
+            job.status = JobStatus.COMPLETED
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Review job {job.id} failed: {str(e)}")
+            job.status = JobStatus.FAILED
+            job.error = str(e)
+        job.finished_at = time.time()
+        self.store.save(job)
+        logger.info(f"Review job {job.id} {job.status.value} in {job.finished_at - job.started_at:.2f} seconds")
+
+        if job.request.callback_url:
+            await self._notify(job)
+
+    async def _notify(self, job: ReviewJob):
+        """POST the finished job to its callback URL; failures are logged, not retried"""
+        try:
+            # Checked again now, as the host may resolve elsewhere than at submission; redirects are not followed
+            await check_callback_addresses(str(job.request.callback_url))
+            async with httpx.AsyncClient(timeout=self.callback_timeout, transport=self.transport) as client:
+                response = await client.post(
+                    str(job.request.callback_url),
+                    content=job.model_dump_json(),
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Callback for review job {job.id} failed: {str(e)}")
+
+def job_queue_from_env(runner: Callable[[ReviewJob], Awaitable[ReviewResponse]]) -> JobQueue:
+    """
+    Build the job queue configured by REVIEW_JOB_WORKERS, REVIEW_JOB_STORE
+    (memory or sqlite) and REVIEW_JOB_POLL_SECONDS
+    """
+    max_entries = int(os.getenv("REVIEW_JOB_MAX_ENTRIES", 1000))
+    if os.getenv("REVIEW_JOB_STORE", "memory").lower() == "sqlite":
+        path = os.getenv("REVIEW_JOB_STORE_PATH", "review_jobs.sqlite3")
+        logger.info(f"Using SQLite job store at {path}")
+        store: JobStore = SQLiteJobStore(path, max_entries)
+    else:
+        store = MemoryJobStore(max_entries)
+    return JobQueue(runner, store, concurrency=int(os.getenv("REVIEW_JOB_WORKERS", 2)),
+                    lease_seconds=float(os.getenv("REVIEW_JOB_LEASE_SECONDS", 60)),
+                    poll_seconds=float(os.getenv("REVIEW_JOB_POLL_SECONDS", 5)))
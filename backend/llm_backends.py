@@ -0,0 +1,266 @@
+"""
+Chat-completion backends used by LLMService.
+
+OpenAIBackend talks to the OpenAI API or to any server exposing the same
+chat completions endpoint (vLLM, llama.cpp, Ollama, LM Studio, ...) through
+`base_url`. OfflineBackend needs no network: it answers with a deterministic
+review of the files named in the prompt, sized like a real answer, after a
+configurable latency and token throughput, so load tests exercise the real
+parsing and serialization paths. It is only used when asked for, and its
+reviews say they are mock reviews. Without an OpenAI key and without that
+opt-in, UnavailableBackend fails every review with LLMUnavailableError.
+
+Backends given an `on_text` callback pass it the answer piece by piece as it
+is generated, so the review can be parsed before the answer is finished.
+"""
+
+import os
+import re
+import json
+import random
+import asyncio
+import hashlib
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from chunking import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailableError(Exception):
+    """Raised when no model in the fallback chain produced an answer"""
+
+class LLMCompletion(NamedTuple):
+    """Answer of one chat completion with the tokens it used"""
+    content: str
+    prompt_tokens: int
+    completion_tokens: int
+    # True when the counts are estimated from the text because the backend reported no usage
+    estimated: bool = False
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+class LLMBackend:
+    """Interface for chat-completion providers"""
+    name = "base"
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, timeout: float = 60.0,
+                 max_connections: int = 20):
+        """OpenAI or an OpenAI-compatible server at base_url, over one pooled HTTP client"""
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout
+        )
+        # Retries are handled by LLMService so they can move down the fallback chain
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            timeout=timeout,
+            max_retries=0
+        )
+        if base_url:
+            self.name = "openai-compatible"
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        if on_text is not None:
+            return await self._stream(model, messages, max_tokens, temperature, on_text)
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        if not response or not response.choices or not response.choices[0].message.content:
+            raise LLMUnavailableError(f"Empty response from {model}")
+        content = response.choices[0].message.content
+        # Some OpenAI-compatible servers leave usage out; fall back to estimates
+        if response.usage:
+            return LLMCompletion(content, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return LLMCompletion(content, estimate_message_tokens(messages), estimate_tokens(content), estimated=True)
+
+    async def _stream(self, model: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                      on_text: Callable[[str], None]) -> LLMCompletion:
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        pieces = []
+        async for chunk in stream:
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                pieces.append(text)
+                on_text(text)
+        content = "".join(pieces)
+        if not content:
+            raise LLMUnavailableError(f"Empty response from {model}")
+        # Streamed answers carry no usage with this client version, so both counts are estimates
+        return LLMCompletion(content, estimate_message_tokens(messages), estimate_tokens(content), estimated=True)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+class UnavailableBackend(LLMBackend):
+    name = "unavailable"
+
+    def __init__(self, reason: str):
+        """Backend of a service with no usable model; every call fails with `reason`"""
+        self.reason = reason
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        raise LLMUnavailableError(self.reason)
+
+class OfflineBackend(LLMBackend):
+    name = "offline"
+
+    # Starts the summary of every offline review, so it cannot pass for a real one
+    SUMMARY_PREFIX = "[Mock review from the offline backend, not a model] "
+
+    # Paths are the headings of the file blocks in the review prompt
+    FILE_KEY = re.compile(r"^### (.+?)(?: \(new file\))?$", re.MULTILINE)
+    MAX_ISSUES = re.compile(r"up to (\d+) issues")
+    # Size of the pieces a streamed answer is delivered in
+    STREAM_CHUNK_CHARS = 64
+
+    LABELS = ["security", "style", "refactor", "test_coverage", "performance", "documentation", "bug"]
+    TITLES = [
+        "Missing input validation",
+        "Function is doing too much",
+        "Inconsistent naming",
+        "Unhandled error path",
+        "Repeated work inside loop",
+        "Public function lacks docstring",
+        "Possible off-by-one error",
+    ]
+
+    def __init__(self, latency_seconds: float = 0.0, tokens_per_second: float = 0.0, issues_per_file: int = 2):
+        """
+        Answer after latency_seconds plus the time to "generate" the answer at
+        tokens_per_second (0 means instantly), with issues_per_file issues per file
+        """
+        self.latency_seconds = latency_seconds
+        self.tokens_per_second = tokens_per_second
+        self.issues_per_file = issues_per_file
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                       temperature: float, on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        prompt = messages[-1]["content"]
+        answer = json.dumps(self.review_for(prompt, max_tokens), indent=2)
+        completion_tokens = estimate_tokens(answer)
+        if self.latency_seconds > 0:
+            await asyncio.sleep(self.latency_seconds)
+        generation = completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        if on_text is None:
+            if generation > 0:
+                await asyncio.sleep(generation)
+        else:
+            pieces = [answer[start:start + self.STREAM_CHUNK_CHARS]
+                      for start in range(0, len(answer), self.STREAM_CHUNK_CHARS)]
+            for piece in pieces:
+                if generation > 0:
+                    await asyncio.sleep(generation / len(pieces))
+                on_text(piece)
+        return LLMCompletion(answer, estimate_message_tokens(messages), completion_tokens, estimated=True)
+
+    def review_for(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Deterministic review of the files in the prompt, trimmed to about max_tokens"""
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        files = list(dict.fromkeys(self.FILE_KEY.findall(prompt)))
+        match = self.MAX_ISSUES.search(prompt)
+        max_issues = int(match.group(1)) if match else 10
+
+        issues = []
+        for file_path in files:
+            for _ in range(self.issues_per_file):
+                if len(issues) < max_issues:
+                    issues.append(self._issue(rng, file_path))
+        review = {
+            "issues": issues,
+            "test_suggestions": [self._test_suggestion(file_path) for file_path in files[:3]],
+            "summary": (f"{self.SUMMARY_PREFIX}Reviewed {len(files)} files. The changes are generally reasonable; the main "
+                        f"concerns are error handling, input validation and a few readability issues "
+                        f"that would make the code easier to maintain."),
+            "suggested_labels": sorted({label for issue in issues for label in issue["labels"]}),
+        }
+        # A real model stops at max_tokens; drop issues until the answer would fit
+        while review["issues"] and estimate_tokens(json.dumps(review, indent=2)) > max_tokens:
+            review["issues"].pop()
+        return review
+
+    def _issue(self, rng: random.Random, file_path: str) -> Dict[str, Any]:
+        title = rng.choice(self.TITLES)
+        first_line = rng.randint(1, 200)
+        return {
+            "title": title,
+            "file_path": file_path,
+            "line_numbers": [first_line, first_line + rng.randint(0, 6)],
+            "description": (f"{title} in {file_path}. The code around these lines assumes its inputs are "
+                            f"always well formed and that the calls it makes cannot fail. When that does not "
+                            f"hold, the error surfaces far from its cause and is hard to diagnose."),
+            "suggestion": ("Validate the inputs at the boundary, handle the failure explicitly and extract "
+                           "the logic into a small, well-named helper that can be tested on its own."),
+            "code_example": ("def process(items):\n"
+                             "    if not items:\n"
+                             "        raise ValueError(\"items must not be empty\")\n"
+                             "    return [normalize(item) for item in items]"),
+            "labels": rng.sample(self.LABELS, 2),
+        }
+
+    def _test_suggestion(self, file_path: str) -> Dict[str, str]:
+        return {
+            "file_path": file_path,
+            "test_description": f"Cover the error paths in {file_path}, including empty and malformed input.",
+            "test_case_example": ("def test_process_rejects_empty_input():\n"
+                                  "    with pytest.raises(ValueError):\n"
+                                  "        process([])"),
+        }
+
+def llm_backend_from_env(api_key: Optional[str], mock_mode: bool) -> LLMBackend:
+    """
+    Build the backend selected by LLM_BACKEND (openai, openai-compatible or
+    offline); MOCK_MODE also selects the offline backend. The openai backend
+    without an API key is unavailable rather than silently offline.
+    """
+    backend = os.getenv("LLM_BACKEND", "openai").lower()
+    timeout = float(os.getenv("LLM_REQUEST_TIMEOUT", 60))
+    max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+
+    if backend == "openai-compatible":
+        base_url = os.getenv("OPENAI_BASE_URL", "http://localhost:8080/v1")
+        logger.info(f"Using OpenAI-compatible server at {base_url}")
+        # Local servers usually ignore the key, but the client requires one
+        return OpenAIBackend(api_key or "not-needed", base_url, timeout, max_connections)
+    if backend == "openai" and not mock_mode:
+        if not api_key:
+            logger.error("No OpenAI API key found; set OPENAI_API_KEY, or LLM_BACKEND=offline for mock reviews")
+            return UnavailableBackend("No OpenAI API key is configured")
+        logger.info("Using real OpenAI API for analysis")
+        return OpenAIBackend(api_key, os.getenv("OPENAI_BASE_URL") or None, timeout, max_connections)
+
+    if mock_mode:
+        logger.info("MOCK_MODE is enabled in configuration")
+    logger.warning("Using the offline LLM backend: reviews are mock reviews, not made by a model")
+    return OfflineBackend(
+        latency_seconds=float(os.getenv("OFFLINE_LLM_LATENCY_SECONDS", 0)),
+        tokens_per_second=float(os.getenv("OFFLINE_LLM_TOKENS_PER_SECOND", 0)),
+        issues_per_file=int(os.getenv("OFFLINE_LLM_ISSUES_PER_FILE", 2))
+    )
@@ -1,167 +1,452 @@
 import time
-import json
+import random
+import asyncio
 import logging
-import traceback
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+import openai
 import os
+from llm_backends import LLMBackend, LLMCompletion, LLMUnavailableError, llm_backend_from_env
+from metrics import record_cache_lookup, record_tokens, stage
+from token_budget import TenantBudgets, TokenBudgetExceeded, fit_batches, tenant_budgets_from_env
+from review_cache import ReviewCacheBackend, review_cache_from_env, review_cache_key
+from chunking import estimate_tokens, pack_files, merge_reviews
+from issue_ranking import IssueClusters, rank_issues
+from diff_context import extract_hunk_context
+from code_index import CodeIndex, symbol_context
+from prompt_format import build_prompt, format_file
+from review_parser import ReviewStreamParser
 from models import (
     ReviewResponse, 
     Issue, 
-    IssueLabel, 
-    TestSuggestion, 
     ReviewSettings,
     CodeChange,
-    ReviewTone
+    ReviewMode,
+    SkippedFile,
+    TokenUsage
 )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Transient failures worth retrying with backoff
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+# Title of the issue that stands in for an answer without a JSON review
+PARSE_ERROR_TITLE = "Error in Response Parsing"
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, review_cache: Optional[ReviewCacheBackend] = None, backend: Optional[LLMBackend] = None,
+                 tenant_budgets: Optional[TenantBudgets] = None, code_index: Optional[CodeIndex] = None):
         """Initialize the LLM service with API key from environment variables"""
         # Set up OpenAI client if API key is available
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         # Use MOCK_MODE environment variable or default to True to avoid quota issues
         self.mock_mode = os.getenv("MOCK_MODE", "False").lower() == "true"
+        self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")  # GPT-3.5 for cost and speed
+        # Prompt sizing: files are packed into batches that fit the model's context window
+        self.context_tokens = int(os.getenv("LLM_CONTEXT_TOKENS", 16385))
+        self.max_output_tokens = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", 2000))
+        self.batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", 4))
+        # Models tried in order when the primary one keeps failing
+        self.fallback_models = [model.strip() for model in os.getenv("OPENAI_FALLBACK_MODELS", "").split(",") if model.strip()]
+        # Small prompts can be routed to a cheaper, faster model first
+        self.fast_model = os.getenv("LLM_FAST_MODEL") or None
+        self.fast_model_max_prompt_tokens = int(os.getenv("LLM_FAST_MODEL_MAX_PROMPT_TOKENS", 2000))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 3))
+        self.retry_base_delay = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+        self.retry_max_delay = float(os.getenv("LLM_RETRY_MAX_DELAY", 30.0))
+        # Default per-review token budget (0 = unlimited) and per-tenant budgets
+        self.review_token_budget = int(os.getenv("REVIEW_TOKEN_BUDGET", 0))
+        self.tenant_budgets = tenant_budgets if tenant_budgets is not None else tenant_budgets_from_env()
+        # Finished reviews keyed by commit, file SHAs, settings and model
+        self.review_cache = review_cache if review_cache is not None else review_cache_from_env()
+        # Parsed symbols of reviewed files, keyed by blob SHA
+        self.code_index = code_index if code_index is not None else CodeIndex.from_env()
         
-        if self.openai_api_key and not self.mock_mode:
-            # Initialize the modern OpenAI client
-            self.client = OpenAI(api_key=self.openai_api_key)
-            logger.info("Using real OpenAI API for analysis")
-        else:
-            self.client = None
-            logger.info("Using mock responses (no API calls)")
-            if self.mock_mode:
-                logger.info("MOCK_MODE is enabled in configuration")
-            else:
-                logger.warning("MOCK_MODE is disabled but no OpenAI API key found")
+        self.backend = backend if backend is not None else llm_backend_from_env(self.openai_api_key, self.mock_mode)
     
-    def analyze_code(self, code_changes: List[CodeChange], review_settings: ReviewSettings) -> ReviewResponse:
+    def analyze_code(self, code_changes: List[CodeChange], review_settings: ReviewSettings,
+                     head_sha: Optional[str] = None, tenant: Optional[str] = None) -> ReviewResponse:
         """
         Analyze code changes using LLM and return review suggestions
         """
-        start_time = time.time()
-        logger.info(f"Starting code analysis with {len(code_changes)} files")
+        return asyncio.run(self.analyze_code_async(code_changes, review_settings, head_sha, tenant))
+    
+    async def analyze_code_async(self, code_changes: List[CodeChange], review_settings: ReviewSettings,
+                                 head_sha: Optional[str] = None, tenant: Optional[str] = None) -> ReviewResponse:
+        """
+        Analyze code changes without blocking the event loop, through the review
+        pipeline from its review cache check on. An identical earlier review of the
+        same commit is served from the review cache.
+        """
+        pipeline, run = self._pipeline_run(code_changes, review_settings, head_sha, tenant, stream_tokens=False)
+        return await pipeline.review(run)
+    
+    async def analyze_code_stream(self, code_changes: List[CodeChange], review_settings: ReviewSettings,
+                                  head_sha: Optional[str] = None, tenant: Optional[str] = None,
+                                  stream_tokens: bool = True) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Analyze code changes, yielding ("issue", Issue) for each issue as soon as
+        it is parsed, ("batch", progress) as each batch finishes, and finally
+        ("result", ReviewResponse) with the merged review. With stream_tokens the
+        model's answer is read as it is generated, so issues arrive before their
+        batch is done. Files that do not fit the review's or the tenant's token
+        budget are left out; raises TokenBudgetExceeded when none fit.
+        """
+        pipeline, run = self._pipeline_run(code_changes, review_settings, head_sha, tenant, stream_tokens)
+        async for event in pipeline.stream(run):
+            yield event
+    
+    def _pipeline_run(self, code_changes: List[CodeChange], review_settings: ReviewSettings,
+                      head_sha: Optional[str], tenant: Optional[str], stream_tokens: bool):
+        """A review pipeline over this service, and its run for files that are already fetched"""
+        # review_pipeline builds on this module, so it is imported on use
+        from review_pipeline import ReviewPipeline, ReviewRun
+        run = ReviewRun(None, review_settings, tenant=tenant, stream_tokens=stream_tokens,
+                        code_changes=code_changes, head_sha=head_sha)
+        return ReviewPipeline(None, self), run
+    
+    def cached_review(self, code_changes: List[CodeChange], review_settings: ReviewSettings,
+                      head_sha: Optional[str] = None) -> Tuple[Optional[str], Optional[ReviewResponse]]:
+        """The review cache key for these files and settings, and the review cached under it if any"""
+        if self.review_cache is None:
+            return None, None
+        cache_key = review_cache_key(code_changes, review_settings, f"{self.backend.name}/{self.model}", head_sha)
+        if not cache_key:
+            return None, None
+        cached = self.review_cache.get(cache_key)
+        record_cache_lookup("review", cached is not None)
+        if cached is None:
+            return cache_key, None
+        review = ReviewResponse.model_validate_json(cached)
+        review.cached = True
+        # Serving from cache spends no tokens
+        review.token_usage = TokenUsage()
+        return cache_key, review
+    
+    def prepare_files(self, code_changes: List[CodeChange], review_settings: ReviewSettings) -> Dict[str, Dict[str, Any]]:
+        """Each reviewable file as the entry its part of the prompt is rendered from"""
+        return self._prepare_code_content(code_changes, review_settings)
+    
+    def plan_review(self, code_for_analysis: Dict[str, Dict[str, Any]], review_settings: ReviewSettings,
+                    tenant: Optional[str] = None) -> Tuple[List[Dict[str, Dict[str, Any]]], TokenUsage]:
+        """
+        Split the prepared files into batches that fit the context window, leaving
+        out files that do not fit the review's or the tenant's token budget;
+        raises TokenBudgetExceeded when none fit
+        """
+        batches = self._plan_batches(code_for_analysis, review_settings)
+        return self._apply_token_budget(batches, review_settings, tenant)
+    
+    def build_prompts(self, batches: List[Dict[str, Dict[str, Any]]], review_settings: ReviewSettings) -> List[str]:
+        return [self._create_analysis_prompt(batch, review_settings) for batch in batches]
+    
+    async def review_batches(self, batches: List[Dict[str, Dict[str, Any]]], prompts: List[str],
+                             code_changes: List[CodeChange], review_settings: ReviewSettings, usage: TokenUsage,
+                             tenant: Optional[str] = None, stream_tokens: bool = False,
+                             parse: Optional[Callable[..., ReviewResponse]] = None) -> AsyncIterator[Tuple[Any, ...]]:
+        """
+        Send each batch's prompt to the LLM, batch_concurrency at a time, adding
+        the tokens used to `usage` and to the tenant's budget. Every answer is
+        handed to `parse` (parse_batch by default) as soon as it arrives. Yields
+        ("issue", Issue) for each new finding, up to max_issues, and ("batch",
+        batch index, batch count, review) as batches finish. With stream_tokens
+        answers are read while they are generated, so issues arrive before their
+        batch is done.
+        """
+        parse = parse or self.parse_batch
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        events: asyncio.Queue = asyncio.Queue()
+        # Batches can report the same finding; report each one once
+        streamed = IssueClusters()
+        
+        def is_new(issue: Issue) -> bool:
+            return len(streamed.clusters) < review_settings.max_issues and streamed.add(issue)
         
-        # Check if we should use mock mode
-        use_mock = self.mock_mode or not self.openai_api_key
+        def on_item(item):
+            if isinstance(item, Issue):
+                events.put_nowait(("issue", item))
         
-        # Add detailed logging
-        logger.info(f"MOCK_MODE from env: {self.mock_mode}")
-        logger.info(f"Has OpenAI API key: {bool(self.openai_api_key)}")
-        logger.info(f"Using mock mode: {use_mock}")
+        async def call(index: int, prompt: str):
+            try:
+                parser = ReviewStreamParser(on_item if stream_tokens else None)
+                async with semaphore:
+                    with stage("llm_call"):
+                        response = await self._call_llm(prompt, usage, parser if stream_tokens else None)
+                events.put_nowait(("answer", index, response, parser))
+            except Exception as e:
+                events.put_nowait(("error", e))
         
-        if use_mock:
-            logger.info("Using mock analysis mode")
-            # Prepare a mock response
-            response = self._get_mock_response_with_real_files(code_changes)
-            # Parse the mock response
-            analysis_result = self._parse_llm_response(response, code_changes)
+        # Reserve the estimate so concurrent reviews of one tenant cannot overshoot together
+        self.tenant_budgets.reserve(tenant, usage.estimated_tokens)
+        tasks = [asyncio.create_task(call(index, prompt)) for index, prompt in enumerate(prompts)]
+        try:
+            finished = 0
+            while finished < len(prompts):
+                event = await events.get()
+                if event[0] == "error":
+                    raise event[1]
+                if event[0] == "issue":
+                    if is_new(event[1]):
+                        yield event
+                    continue
+                _, index, response, parser = event
+                review = parse(response, batches[index], code_changes, parser)
+                # Issues of answers that were not streamed are reported once parsed
+                for issue in review.issues:
+                    if is_new(issue):
+                        yield "issue", issue
+                finished += 1
+                yield "batch", index, len(prompts), review
+        finally:
+            # Stop outstanding batches if the consumer goes away mid-stream
+            for task in tasks:
+                task.cancel()
+            self.tenant_budgets.settle(tenant, usage.estimated_tokens, usage.prompt_tokens + usage.completion_tokens)
+    
+    def parse_batch(self, response: str, batch: Dict[str, Dict[str, Any]], code_changes: List[CodeChange],
+                    parser: Optional[ReviewStreamParser] = None) -> ReviewResponse:
+        """The review in one batch's answer"""
+        batch_changes = [change for change in code_changes if change.file_path in batch]
+        with stage("response_parse"):
+            return self._parse_llm_response(response, batch_changes, parser)
+    
+    def finish_review(self, reviews: List[ReviewResponse], batches: List[Dict[str, Dict[str, Any]]],
+                      code_changes: List[CodeChange], review_settings: ReviewSettings, usage: TokenUsage,
+                      start_time: float, cache_key: Optional[str] = None) -> ReviewResponse:
+        """
+        Merge the batch reviews into one with duplicate issues collapsed and the
+        best max_issues kept, account for the files and tokens, and cache it
+        """
+        if not reviews:
+            # Nothing was left to send, e.g. every file was binary
+            analysis_result = ReviewResponse(total_files_analyzed=0, analysis_time_seconds=0.0)
+        elif len(reviews) == 1:
+            analysis_result = reviews[0]
+            analysis_result.issues = rank_issues(analysis_result.issues, review_settings.max_issues)
         else:
-            logger.info("Using OpenAI API for analysis")
-            # Prepare the code changes for analysis
-            code_for_analysis = self._prepare_code_content(code_changes)
-            # Create the prompt based on review settings
-            prompt = self._create_analysis_prompt(code_for_analysis, review_settings)
-            # Call the LLM with real API
-            response = self._call_llm(prompt)
-            # Parse LLM response
-            analysis_result = self._parse_llm_response(response, code_changes)
+            analysis_result = merge_reviews(reviews, review_settings.max_issues)
         
         # Add timing information
         analysis_time = time.time() - start_time
         analysis_result.analysis_time_seconds = analysis_time
-        analysis_result.total_files_analyzed = len(code_changes)
+        reviewed = {path for batch in batches for path in batch}
+        analysis_result.total_files_analyzed = len(reviewed)
+        analysis_result.token_usage = usage
+        analysis_result.llm_backend = self.backend.name
+        analysis_result.skipped_files = [
+            SkippedFile(file_path=change.file_path, reason=change.skip_reason, size=change.size)
+            for change in code_changes if change.skip_reason
+        ]
         
-        logger.info(f"Analysis completed in {analysis_time:.2f} seconds")
+        # A trimmed review depends on the budget, which is not part of the cache key, and an answer
+        # that could not be parsed is worth asking for again
+        parse_failed = any(issue.title == PARSE_ERROR_TITLE for review in reviews for issue in review.issues)
+        if cache_key and not usage.trimmed_files and not parse_failed:
+            self.review_cache.set(cache_key, analysis_result.model_dump_json())
+        
+        logger.info(f"Analysis completed in {analysis_time:.2f} seconds using "
+                    f"{usage.prompt_tokens} prompt and {usage.completion_tokens} completion tokens")
         return analysis_result
     
-    def _call_llm(self, prompt: str) -> str:
-        """Call the LLM with the prepared prompt"""
-        try:
-            logger.info("Making OpenAI API request")
-            logger.info(f"API Key (first 5 chars): {self.openai_api_key[:5] if self.openai_api_key else 'None'}")
-            logger.info(f"Using model: gpt-3.5-turbo")
-            
-            # Print OpenAI's env variable to verify
-            import os
-            logger.info(f"OpenAI API Key from env: {os.getenv('OPENAI_API_KEY')[:5] if os.getenv('OPENAI_API_KEY') else 'None'}")
-            
-            # Use the modern OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",  # Using GPT-3.5 for cost and speed
-                messages=[
-                    {"role": "system", "content": "You are a code review assistant that provides detailed and helpful feedback."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=2000
+    def _plan_batches(self, code_for_analysis: Dict[str, Any],
+                      review_settings: ReviewSettings) -> List[Dict[str, Dict[str, Any]]]:
+        """Pack the prepared files into batches that each fit one prompt"""
+        # Whatever the template and the model's answer need is not available for code
+        overhead = estimate_tokens(self._create_analysis_prompt({}, review_settings))
+        budget = max(self.context_tokens - self.max_output_tokens - overhead, 1)
+        batches = pack_files(code_for_analysis, budget, self._measure_file_tokens)
+        logger.info(f"Packed {len(code_for_analysis)} files into {len(batches)} batches of up to {budget} tokens")
+        return batches
+    
+    def _apply_token_budget(self, batches: List[Dict[str, Dict[str, Any]]], review_settings: ReviewSettings,
+                            tenant: Optional[str]) -> Tuple[List[Dict[str, Dict[str, Any]]], TokenUsage]:
+        """Drop the files that would take the review over its own or its tenant's token budget"""
+        budget = review_settings.token_budget or self.review_token_budget or None
+        remaining = self.tenant_budgets.remaining(tenant)
+        if remaining is not None:
+            budget = remaining if budget is None else min(budget, remaining)
+        
+        # Every batch pays for the template and for the output tokens reserved for its answer
+        overhead = estimate_tokens(self._create_analysis_prompt({}, review_settings)) + self.max_output_tokens
+        
+        def batch_cost(batch: Dict[str, Dict[str, Any]]) -> int:
+            return overhead + sum(self._measure_file_tokens(path, entry) for path, entry in batch.items())
+        
+        kept, trimmed, estimated = fit_batches(batches, budget, batch_cost)
+        if batches and not kept:
+            raise TokenBudgetExceeded(
+                f"Reviewing even one file needs more than the remaining budget of {budget} tokens"
             )
+        if trimmed:
+            logger.warning(f"Token budget of {budget} leaves {len(trimmed)} files out of the review")
+        return kept, TokenUsage(estimated_tokens=estimated, budget=budget, trimmed_files=trimmed)
+    
+    def _measure_file_tokens(self, file_path: str, entry: Dict[str, Any]) -> int:
+        """Tokens one prepared file adds to the prompt"""
+        return estimate_tokens(format_file(file_path, entry) + "\n\n")
+    
+    async def aclose(self):
+        """Release the backend's pooled connections"""
+        await self.backend.aclose()
+    
+    async def _call_llm(self, prompt: str, usage: Optional[TokenUsage] = None,
+                        parser: Optional[ReviewStreamParser] = None) -> str:
+        """
+        Call the LLM with the prepared prompt, retrying transient failures and
+        moving down the fallback model chain when a model stays unavailable.
+        The tokens the answer used are added to `usage`; with a parser the
+        answer is fed to it while it is generated.
+        """
+        models = [self.model] + self.fallback_models
+        if self.fast_model and estimate_tokens(prompt) <= self.fast_model_max_prompt_tokens:
+            models.insert(0, self.fast_model)
+        
+        last_error: Optional[Exception] = None
+        for model in models:
+            try:
+                completion = await self._call_model(model, prompt, parser)
+                if usage is not None:
+                    usage.prompt_tokens += completion.prompt_tokens
+                    usage.completion_tokens += completion.completion_tokens
+                    usage.usage_estimated = usage.usage_estimated or completion.estimated
+                return completion.content
+            except openai.AuthenticationError:
+                raise
+            except (openai.APIError, LLMUnavailableError) as e:
+                last_error = e
+                logger.error(f"Model {model} failed: {str(e)}")
+        raise LLMUnavailableError(f"No model produced a review: {str(last_error)}") from last_error
+    
+    async def _call_model(self, model: str, prompt: str, parser: Optional[ReviewStreamParser] = None) -> LLMCompletion:
+        """One model, with exponential backoff and full jitter on rate limits, timeouts and 5xx errors"""
+        for attempt in range(self.max_retries + 1):
+            if parser is not None:
+                # A retried answer starts over
+                parser.restart()
+            try:
+                logger.info(f"Making {self.backend.name} request with model {model} (attempt {attempt + 1})")
+                completion = await self.backend.complete(
+                    model,
+                    [
+                        {"role": "system", "content": "You are a code review assistant that provides detailed and helpful feedback."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=self.max_output_tokens,
+                    temperature=0.1,
+                    on_text=parser.feed if parser is not None else None
+                )
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, e)
+                logger.warning(f"LLM request failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
             
-            if not response or not hasattr(response, 'choices') or not response.choices:
-                logger.error("Invalid response format from OpenAI")
-                return self._get_mock_response_with_real_files([])
-                
-            logger.info(f"Response received with {len(response.choices)} choices")
-            response_content = response.choices[0].message.content
-            logger.info("Successfully received OpenAI API response")
-            logger.info(f"Response starts with: {response_content[:100]}...")
-            return response_content
-        except Exception as e:
-            logger.error(f"Error calling OpenAI API: {str(e)}")
-            logger.error(f"Error trace: {traceback.format_exc()}")
-            logger.error("Falling back to mock response with real file paths")
-            return self._get_mock_response(prompt)
+            logger.info(f"Successfully received LLM response from {model}")
+            record_tokens(model, completion.prompt_tokens, completion.completion_tokens, completion.estimated)
+            return completion
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Honour Retry-After when the API sends one, otherwise back off exponentially with jitter"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.retry_max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
     
-    def _get_mock_response_with_real_files(self, code_changes: List[CodeChange]) -> str:
-        """Generate a mock response using the actual file paths from code_changes"""
-        # Get real file paths from code changes
-        real_files = [change.file_path for change in code_changes]
+    def generate_markdown_report(self, review: ReviewResponse) -> str:
+        """Render a review as a Markdown report"""
+        sections = ["# Code Review Report"]
         
-        # Create a more realistic mock response with the actual files
-        mock_response = {
-            "issues": [],
-            "test_suggestions": [],
-            "summary": f"This is a mock code review of {len(real_files)} files. MOCK_MODE is enabled in the backend.",
-            "suggested_labels": ["mock"]
-        }
+        if review.summary:
+            sections.append(f"## Summary\n\n{review.summary}")
         
-        # Add mock issues for the real files (up to 3 files)
-        issue_types = ["Documentation needed", "Consider refactoring", "Add comments"]
+        if review.issues:
+            sections.append("## Issues Found")
+            for number, issue in enumerate(review.issues, 1):
+                sections.append(self.format_issue_markdown(issue, number))
         
-        for i, file_path in enumerate(real_files[:3]):
-            if i < len(issue_types):
-                mock_response["issues"].append({
-                    "title": f"{issue_types[i]} in {file_path}",
-                    "file_path": file_path,
-                    "line_numbers": [1],
-                    "description": f"This is a mock issue for demonstration purposes in {file_path}. The backend is running in MOCK_MODE, so these are not real issues.",
-                    "suggestion": "Enable real analysis by setting MOCK_MODE=False in .env and providing a valid OpenAI API key.",
-                    "code_example": "# This is mock code\nprint('Hello world')",
-                    "labels": ["mock"]
-                })
+        if review.test_suggestions:
+            sections.append("## Test Suggestions")
+            for suggestion in review.test_suggestions:
+                section = f"### `{suggestion.file_path}`\n\n{suggestion.test_description}"
+                if suggestion.test_case_example:
+                    section += f"\n\n```\n{suggestion.test_case_example}\n```"
+                sections.append(section)
         
-        # Add a mock test suggestion using a real file
-        if real_files:
-            mock_response["test_suggestions"].append({
-                "file_path": real_files[0],
-                "test_description": "This is a mock test suggestion for demonstration purposes. The backend is running in MOCK_MODE, so this is not a real suggestion.",
-                "test_case_example": "# This is a mock test case\ndef test_example():\n    assert True"
-            })
+        if review.suggested_labels:
+            sections.append("## Suggested Labels\n\n" + ", ".join(f"`{label.value}`" for label in review.suggested_labels))
         
-        # Convert to JSON string
-        return json.dumps(mock_response)
+        if review.skipped_files:
+            sections.append("## Skipped Files\n\n" + "\n".join(
+                f"- `{skipped.file_path}` ({skipped.reason.replace('_', ' ')})" for skipped in review.skipped_files
+            ))
+        
+        return "\n\n".join(sections) + "\n"
+    
+    def format_issue_markdown(self, issue: Issue, number: int) -> str:
+        """Render a single issue as a Markdown section"""
+        location = f"`{issue.file_path}`"
+        if issue.line_numbers:
+            location += " (lines " + ", ".join(str(line) for line in issue.line_numbers) + ")"
+        
+        parts = [f"### {number}. {issue.title}", f"**File:** {location}"]
+        if issue.labels:
+            parts.append("**Labels:** " + ", ".join(f"`{label.value}`" for label in issue.labels))
+        if issue.description:
+            parts.append(issue.description)
+        if issue.suggestion:
+            parts.append(f"**Suggestion:** {issue.suggestion}")
+        if issue.code_example:
+            parts.append(f"```\n{issue.code_example}\n```")
+        return "\n\n".join(parts)
     
-    def _prepare_code_content(self, code_changes: List[CodeChange]) -> Dict[str, Any]:
+    def _prepare_code_content(self, code_changes: List[CodeChange],
+                              review_settings: Optional[ReviewSettings] = None) -> Dict[str, Any]:
         """Prepare code content in a format suitable for LLM analysis"""
+        review_mode = review_settings.review_mode if review_settings is not None else ReviewMode.FULL
+        diff_mode = review_mode in (ReviewMode.DIFF, ReviewMode.SYMBOLS)
         prepared_content = {}
         
         for change in code_changes:
+            # Binary, oversized or unavailable files are reported, not sent
+            if change.skip_reason:
+                continue
+            index = None
+            if change.diff and review_mode == ReviewMode.SYMBOLS and not change.is_new:
+                index = self.code_index.get(change.file_path, change.content, change.sha)
+            # In symbols mode, indexed PR files are represented by their changed symbols and what those use
+            if index is not None:
+                prepared_content[change.file_path] = {
+                    "diff": change.diff,
+                    "is_new": change.is_new,
+                    **symbol_context(index, change.content, change.diff, review_settings.context_lines)
+                }
+            # In diff mode, PR files are represented by their hunks and nearby code only
+            elif change.diff and diff_mode:
+                entry = {
+                    "diff": change.diff,
+                    "is_new": change.is_new
+                }
+                # A new file's diff already is the whole file
+                if not change.is_new:
+                    entry["context"] = extract_hunk_context(
+                        change.file_path, change.content, change.diff, review_settings.context_lines
+                    )
+                prepared_content[change.file_path] = entry
             # For PRs with diffs
-            if change.diff:
+            elif change.diff:
                 prepared_content[change.file_path] = {
                     "content": change.content,
                     "diff": change.diff,
@@ -176,201 +461,31 @@ class LLMService:
         
         return prepared_content
     
-    def _parse_llm_response(self, response: str, code_changes: List[CodeChange]) -> ReviewResponse:
-        """Parse the LLM response into structured data"""
-        try:
-            # Try to parse the JSON response
-            logger.info("Parsing LLM response")
-            # Find JSON in the response (handle cases where the model outputs text before/after JSON)
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                response_data = json.loads(json_str)
-            else:
-                response_data = json.loads(response)
-            
-            # Extract issues
-            issues = []
-            for issue_data in response_data.get("issues", []):
-                labels = [IssueLabel(label) for label in issue_data.get("labels", [])]
-                
-                issues.append(Issue(
-                    title=issue_data.get("title", "Unnamed Issue"),
-                    file_path=issue_data.get("file_path", ""),
-                    line_numbers=issue_data.get("line_numbers", []),
-                    description=issue_data.get("description", ""),
-                    suggestion=issue_data.get("suggestion", ""),
-                    code_example=issue_data.get("code_example", ""),
-                    labels=labels
-                ))
-            
-            # Extract test suggestions
-            test_suggestions = []
-            for test_data in response_data.get("test_suggestions", []):
-                test_suggestions.append(TestSuggestion(
-                    file_path=test_data.get("file_path", ""),
-                    test_description=test_data.get("test_description", ""),
-                    test_case_example=test_data.get("test_case_example", "")
-                ))
-            
-            # Extract summary and suggested labels
-            summary = response_data.get("summary", "")
-            suggested_labels = response_data.get("suggested_labels", [])
-            
-            return ReviewResponse(
-                issues=issues,
-                test_suggestions=test_suggestions,
-                summary=summary,
-                suggested_labels=suggested_labels,
-                analysis_time_seconds=0.0,  # Will be updated later
-                total_files_analyzed=len(code_changes)
-            )
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM response as JSON: {str(e)}")
-            logger.error(f"Raw response: {response}")
-            # Return a simplified response with error information
-            return ReviewResponse(
-                issues=[Issue(
-                    title="Error in Response Parsing",
-                    file_path="",
-                    line_numbers=[],
-                    description=f"Failed to parse LLM response: {str(e)}",
-                    suggestion="Please try again with a different repository or settings.",
-                    code_example="",
-                    labels=[IssueLabel.ERROR]
-                )],
-                test_suggestions=[],
-                summary="An error occurred during code analysis.",
-                suggested_labels=[],
-                analysis_time_seconds=0.0,
-                total_files_analyzed=len(code_changes)
-            )
+    def _parse_llm_response(self, response: str, code_changes: List[CodeChange],
+                            parser: Optional[ReviewStreamParser] = None) -> ReviewResponse:
+        """
+        Parse the LLM response into structured data, keeping every well-formed
+        issue and test suggestion even when others are malformed or the answer
+        was cut off
+        """
+        logger.info("Parsing LLM response")
+        parser = parser or ReviewStreamParser()
+        review = parser.close(response)
+        review.total_files_analyzed = len(code_changes)
+        if not parser.found_object:
+            logger.error(f"No JSON review in LLM response: {response[:500]}")
+            review.issues = [Issue(
+                title=PARSE_ERROR_TITLE,
+                file_path="",
+                line_numbers=[],
+                description="The model's answer did not contain a JSON review.",
+                suggestion="Please try again with a different repository or settings.",
+                code_example="",
+                labels=[]
+            )]
+            review.summary = "An error occurred during code analysis."
+        return review
 
     def _create_analysis_prompt(self, code_content: Dict[str, Any], settings: ReviewSettings) -> str:
         """Create the prompt for the LLM based on the code and settings"""
-        tone_instructions = {
-            ReviewTone.STRICT: "Be thorough and critical in your review. Focus on identifying all issues and potential improvements.",
-            ReviewTone.MENTOR: "Be constructive and educational. Explain issues clearly and provide guidance on how to improve the code.",
-            ReviewTone.NEUTRAL: "Provide a balanced review focusing on significant issues while acknowledging good practices."
-        }
-        
-        prompt = f"""
-        You are an expert code reviewer with deep knowledge of software engineering best practices, security, and performance optimization.
-        
-        REVIEW TONE: {tone_instructions[settings.tone]}
-        
-        TASK: Perform a detailed code review of the following files and return a structured analysis.
-        
-        FILES TO REVIEW:
-        ```
-        {json.dumps(code_content, indent=2)}
-        ```
-        
-        INSTRUCTIONS:
-        
-        1. Identify up to {settings.max_issues} issues or areas for improvement in the code.
-        2. For each issue, provide:
-           - A clear title describing the issue
-           - The file path and line numbers where the issue occurs
-           - A detailed description of why it's problematic
-           - A specific suggestion for how to fix it
-           - An example of improved code when applicable
-           - Appropriate labels from: security, style, refactor, test_coverage, performance, documentation, bug
-        
-        3. {"Suggest test cases for components that lack testing." if settings.include_test_suggestions else ""}
-        
-        4. {"Provide a high-level summary of the changes that would be understandable by non-technical stakeholders." if settings.include_summary else ""}
-        
-        FORMAT YOUR RESPONSE AS A JSON OBJECT with the following structure:
-        {{
-            "issues": [
-                {{
-                    "title": "Issue title",
-                    "file_path": "path/to/file.ext",
-                    "line_numbers": [23, 24],
-                    "description": "Detailed explanation of the issue",
-                    "suggestion": "How to fix it",
-                    "code_example": "Example code fix",
-                    "labels": ["security", "refactor"]
-                }}
-            ],
-            "test_suggestions": [
-                {{
-                    "file_path": "path/to/file.ext",
-                    "test_description": "What should be tested",
-                    "test_case_example": "Example test code"
-                }}
-            ],
-            "summary": "High-level summary for non-technical stakeholders",
-            "suggested_labels": ["security", "refactor"]
-        }}
-        """
-        
-        return prompt
-        
-    def _get_mock_response(self, prompt=None) -> str:
-        """Return a mock response for demonstration without API usage"""
-        # Extract file info from prompt if available
-        file_info = ""
-        if prompt:
-            # Try to extract file paths from the prompt
-            import re
-            file_matches = re.findall(r'"file_path":\s*"([^"]+)"', prompt)
-            if file_matches:
-                file_info = f"for files: {', '.join(file_matches[:3])}"
-        
-        return f"""{{"issues": [
-            {{
-                "title": "Potential SQL Injection Risk {file_info}",
-                "file_path": "app/database.py",
-                "line_numbers": [45, 46],
-                "description": "Direct string interpolation in SQL query creates a risk for SQL injection attacks. User input should never be directly concatenated into SQL queries.",
-                "suggestion": "Use parameterized queries with placeholders to prevent SQL injection attacks.",
-                "code_example": "cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))",
-                "labels": ["security", "bug"]
-            }},
-            {{
-                "title": "Missing Input Validation",
-                "file_path": "app/routes.py",
-                "line_numbers": [23],
-                "description": "User input is processed without validation, which could lead to unexpected behavior or security vulnerabilities.",
-                "suggestion": "Add input validation before processing user data.",
-                "code_example": "if not validate_input(user_input):\\n    return jsonify({{'error': 'Invalid input'}}), 400",
-                "labels": ["security", "bug"]
-            }},
-            {{
-                "title": "Inefficient Algorithm",
-                "file_path": "app/utils.py",
-                "line_numbers": [78, 79, 80],
-                "description": "This function uses a nested loop with O(n²) time complexity, which can cause performance issues with large datasets.",
-                "suggestion": "Consider using a more efficient algorithm or data structure to improve performance.",
-                "code_example": "# Use a dictionary for O(n) lookup\\nitem_map = {{item['id']: item for item in items}}\\nresult = [item_map[id] for id in ids if id in item_map]",
-                "labels": ["performance", "refactor"]
-            }},
-            {{
-                "title": "Inadequate Error Handling",
-                "file_path": "app/api.py",
-                "line_numbers": [102],
-                "description": "The function doesn't properly handle exceptions, which could lead to unexpected crashes or exposing sensitive information.",
-                "suggestion": "Implement proper error handling with try-except blocks and meaningful error messages.",
-                "code_example": "try:\\n    result = process_data(data)\\nexcept ValidationError as e:\\n    return jsonify({{'error': str(e)}}), 400\\nexcept Exception as e:\\n    logger.error(f'Unexpected error: {{e}}')\\n    return jsonify({{'error': 'An unexpected error occurred'}}), 500",
-                "labels": ["bug", "refactor"]
-            }}
-        ],
-        "test_suggestions": [
-            {{
-                "file_path": "app/api.py",
-                "test_description": "Test error handling scenarios to ensure the API responds correctly when invalid data is provided.",
-                "test_case_example": "def test_api_error_handling():\\n    response = client.post('/api/data', json={{'invalid': 'data'}})\\n    assert response.status_code == 400\\n    assert 'error' in response.json()"
-            }},
-            {{
-                "file_path": "app/utils.py",
-                "test_description": "Add tests for the utility functions with various input sizes to verify performance characteristics.",
-                "test_case_example": "def test_utils_performance():\\n    # Test with small input\\n    start_time = time.time()\\n    result_small = process_items(small_dataset)\\n    small_duration = time.time() - start_time\\n    \\n    # Test with large input\\n    start_time = time.time()\\n    result_large = process_items(large_dataset)\\n    large_duration = time.time() - start_time\\n    \\n    # Verify performance is roughly linear\\n    ratio = large_dataset_size / small_dataset_size\\n    assert large_duration < small_duration * ratio * 1.5"
-            }}
-        ],
-        "summary": "The code review identified several issues including security vulnerabilities (SQL injection, missing input validation), performance concerns (inefficient algorithms), and code quality issues (inadequate error handling). Addressing these issues will improve security, performance, and reliability. Additionally, improving test coverage would help ensure code quality as the application evolves.",
-        "suggested_labels": ["security", "bug", "performance", "refactor"]
-    }}"""
+        return build_prompt(code_content, settings)
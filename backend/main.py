@@ -1,21 +1,30 @@
+import json
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 import os
 import traceback
-from typing import List, Optional
+from typing import Any, List, Optional
 from dotenv import load_dotenv
 
-from github_service import GithubService
-from llm_service import LLMService
+from llm_service import LLMUnavailableError
+from services import github_service, llm_service, review_pipeline
+from review_pipeline import ReviewRun
+from token_budget import TokenBudgetExceeded
+from concurrency import SHUTDOWN_DRAIN_SECONDS
+from job_queue import job_queue_from_env
+from webhooks import verify_signature, webhook_reviewer_from_env
+from metrics import metrics_response
 from models import (
     ReviewRequest, 
     ReviewResponse, 
-    Issue, 
-    IssueLabel, 
-    TestSuggestion,
-    ReviewSettings
+    ReviewSettings,
+    CodeChange,
+    ReviewJob,
+    ReviewJobRequest
 )
 
 # Load environment variables
@@ -41,69 +50,219 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-github_service = GithubService(os.getenv("GITHUB_TOKEN"))
-llm_service = LLMService()
+async def _run_review_job(job: ReviewJob) -> ReviewResponse:
+    """Run one queued review job end to end"""
+    request = job.request
+    run = ReviewRun(request.url, request.settings, request.file_paths, tenant=job.tenant_id)
+    analysis = await review_pipeline.review(run)
+    
+    if request.settings.apply_labels and run.target["is_pr"]:
+        await asyncio.to_thread(
+            github_service.apply_labels,
+            run.target["owner"],
+            run.target["repo"],
+            run.target["pr_number"],
+            analysis.issues
+        )
+    return analysis
+
+job_queue = job_queue_from_env(_run_review_job)
+
+async def _review_webhook_changes(code_changes: List[CodeChange], settings: ReviewSettings, head_sha: str,
+                                  tenant: Optional[str] = None) -> ReviewResponse:
+    run = ReviewRun(None, settings, tenant=tenant, code_changes=code_changes, head_sha=head_sha)
+    return await review_pipeline.review(run)
+
+async def _label_webhook_review(owner: str, repo: str, pr_number: int, review: ReviewResponse):
+    if webhook_reviewer.settings.apply_labels:
+        await asyncio.to_thread(github_service.apply_labels, owner, repo, pr_number, review.issues)
+
+webhook_reviewer = webhook_reviewer_from_env(
+    github_service.get_pr_changes_async,
+    _review_webhook_changes,
+    on_review=_label_webhook_review
+)
+
+# Pull request actions that change the code under review
+WEBHOOK_PR_ACTIONS = ("opened", "reopened", "synchronize")
+
+@app.on_event("startup")
+async def start_job_queue():
+    # Resume jobs persisted by a previous run
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    # Uvicorn has already drained in-flight requests; give background reviews the same time
+    await asyncio.gather(
+        job_queue.stop(SHUTDOWN_DRAIN_SECONDS),
+        webhook_reviewer.stop(SHUTDOWN_DRAIN_SECONDS)
+    )
+    await llm_service.aclose()
 
 @app.get("/")
 async def root():
     return {"message": "Code Review Assistant API is running"}
 
 @app.post("/review", response_model=ReviewResponse)
-async def review_code(request: ReviewRequest, background_tasks: BackgroundTasks):
+async def review_code(request: ReviewRequest, background_tasks: BackgroundTasks,
+                      x_tenant_id: Optional[str] = Header(None)):
     """
-    Analyze a GitHub repository or PR and return code review suggestions
+    Analyze a GitHub repository or PR and return code review suggestions.
+    The X-Tenant-ID header selects whose token budget pays for the review.
     """
     try:
         logger.info(f"Received review request for URL: {request.url}")
-        
-        # Extract repo and PR info from the URL
-        repo_info = github_service.parse_github_url(request.url)
-        logger.info(f"Parsed GitHub URL: {repo_info}")
-        
-        # Fetch the code changes
-        logger.info("Fetching code changes...")
-        if repo_info["is_pr"]:
-            code_changes = github_service.get_pr_changes(
-                repo_info["owner"], 
-                repo_info["repo"], 
-                repo_info["pr_number"]
-            )
-        else:
-            code_changes = github_service.get_repo_files(
-                repo_info["owner"], 
-                repo_info["repo"],
-                request.file_paths
-            )
-        
-        logger.info(f"Fetched {len(code_changes)} files for analysis")
-        
-        # Analyze the code with LLM
-        logger.info("Starting code analysis with LLM...")
-        analysis = llm_service.analyze_code(
-            code_changes, 
-            review_settings=request.settings
-        )
+        run = ReviewRun(request.url, request.settings, request.file_paths, tenant=x_tenant_id)
+        analysis = await review_pipeline.review(run)
         
         # Optionally apply labels to GitHub PR
-        if request.settings.apply_labels and repo_info["is_pr"]:
+        if request.settings.apply_labels and run.target["is_pr"]:
             logger.info("Applying labels to PR...")
             background_tasks.add_task(
                 github_service.apply_labels,
-                repo_info["owner"],
-                repo_info["repo"],
-                repo_info["pr_number"],
+                run.target["owner"],
+                run.target["repo"],
+                run.target["pr_number"],
                 analysis.issues
             )
         
         logger.info("Review completed successfully")
         return analysis
         
+    except TokenBudgetExceeded as e:
+        logger.warning(f"Token budget exhausted for review request: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e))
+    except LLMUnavailableError as e:
+        logger.error(f"LLM unavailable for review request: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing review request: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/review/stream")
+async def review_code_stream(request: ReviewRequest, background_tasks: BackgroundTasks,
+                             x_tenant_id: Optional[str] = Header(None)):
+    """
+    Analyze a GitHub repository or PR, streaming progress events, each issue as
+    soon as it is parsed and finally the full review as Server-Sent Events
+    """
+    run = ReviewRun(request.url, request.settings, request.file_paths, tenant=x_tenant_id, stream_tokens=True)
+    try:
+        logger.info(f"Received streaming review request for URL: {request.url}")
+        # An unusable URL is answered with an error status rather than an error event
+        await review_pipeline.run_stage("resolve", run)
+    except Exception as e:
+        logger.error(f"Error processing review request: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def events():
+        try:
+            async for event in review_pipeline.stream(run, _sse):
+                yield event
+            
+            # Runs once the stream has been sent
+            if request.settings.apply_labels and run.target["is_pr"]:
+                background_tasks.add_task(
+                    github_service.apply_labels,
+                    run.target["owner"],
+                    run.target["repo"],
+                    run.target["pr_number"],
+                    run.review.issues
+                )
+            logger.info("Streaming review completed successfully")
+        except Exception as e:
+            logger.error(f"Error processing streaming review: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield _sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse(event: str, payload: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    data = payload.model_dump_json() if isinstance(payload, BaseModel) else json.dumps(payload)
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.post("/jobs", response_model=ReviewJob, status_code=202)
+async def submit_review_job(request: ReviewJobRequest, x_tenant_id: Optional[str] = Header(None)):
+    """
+    Queue a review and return its job straight away; poll GET /jobs/{job_id}
+    or pass callback_url to be notified when it finishes
+    """
+    try:
+        repo_info = github_service.parse_github_url(request.url)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # Jobs for the same commit are deduplicated, so resolve it up front
+        head_sha = await github_service.get_head_sha_async(
+            repo_info["owner"], repo_info["repo"], repo_info.get("pr_number")
+        )
+    except Exception as e:
+        logger.warning(f"Could not resolve commit for {request.url}, job will not be deduplicated: {str(e)}")
+        head_sha = None
+    
+    try:
+        return job_queue.submit(request, head_sha, x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/jobs/{job_id}", response_model=ReviewJob)
+async def get_review_job(job_id: str):
+    """
+    Return the status of a review job, including the review once it has completed
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.post("/webhooks/github", status_code=202)
+async def github_webhook(
+    request: Request,
+    x_hub_signature_256: Optional[str] = Header(None),
+    x_github_event: Optional[str] = Header(None)
+):
+    """
+    Receive GitHub webhook deliveries and schedule a debounced, incremental
+    review for pull request pushes
+    """
+    body = await request.body()
+    if not verify_signature(os.getenv("GITHUB_WEBHOOK_SECRET"), body, x_hub_signature_256):
+        logger.warning("Rejected webhook delivery with a missing or invalid signature")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    if x_github_event == "ping":
+        return {"status": "pong"}
+    payload = json.loads(body)
+    if x_github_event != "pull_request" or payload.get("action") not in WEBHOOK_PR_ACTIONS:
+        return {"status": "ignored"}
+    
+    pull_request = payload["pull_request"]
+    owner = payload["repository"]["owner"]["login"]
+    repo = payload["repository"]["name"]
+    head_sha = pull_request["head"]["sha"]
+    # The push moved the head; do not serve the old one from the PR cache
+    github_service.forget_pull_request(owner, repo, pull_request["number"])
+    webhook_reviewer.schedule(owner, repo, pull_request["number"], head_sha)
+    return {"status": "scheduled", "head_sha": head_sha}
+
+@app.get("/webhooks/github/reviews/{owner}/{repo}/{pr_number}", response_model=ReviewResponse)
+async def get_webhook_review(owner: str, repo: str, pr_number: int):
+    """
+    Return the latest webhook-triggered review of a pull request
+    """
+    last = webhook_reviewer.last_review(owner, repo, pr_number)
+    if last is None:
+        raise HTTPException(status_code=404, detail=f"No review recorded for {owner}/{repo}#{pr_number}")
+    return last.response
+
 @app.post("/export-review")
 async def export_review(review: ReviewResponse):
     """
@@ -112,6 +271,27 @@ async def export_review(review: ReviewResponse):
     markdown = llm_service.generate_markdown_report(review)
     return {"markdown": markdown}
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage review timings, GitHub API calls, cache hits and LLM token usage
+    """
+    return metrics_response()
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """
+    Report GitHub cache hit/miss counters and the last known rate-limit quota
+    """
+    return {
+        "blob_cache": github_service.blob_cache.stats(),
+        "not_modified_responses": github_service.etag_cache.not_modified,
+        "rate_limit": {
+            "remaining": github_service.rate_limiter.remaining,
+            "reset_at": github_service.rate_limiter.reset_at,
+        },
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
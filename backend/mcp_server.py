@@ -1,13 +1,16 @@
 import json
-from fastapi import FastAPI, HTTPException, Request, Depends
+import time
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
-import os
+from typing import Dict, Any, List, Optional, AsyncIterator
 from dotenv import load_dotenv
 
-from github_service import GithubService
-from llm_service import LLMService
+from services import llm_service, review_pipeline
+from review_pipeline import ReviewRun
+from metrics import metrics_response
+from models import ReviewResponse
 
 # Load environment variables
 load_dotenv()
@@ -28,9 +31,31 @@ mcp_app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-github_service = GithubService(os.getenv("GITHUB_TOKEN"))
-llm_service = LLMService()
+@mcp_app.on_event("shutdown")
+async def close_llm_client():
+    await llm_service.aclose()
+
+HELP_MESSAGE = """
+# Code Review Assistant MCP
+
+This is a Code Review Assistant MCP server that can analyze GitHub repositories or pull requests and provide AI-powered code review suggestions.
+
+## How to use:
+
+1. Provide a GitHub repository or pull request URL
+2. Optionally specify file paths to review
+3. Configure review settings like tone, test suggestions, etc.
+
+Example request:
+```
+Please review this GitHub repository: https://github.com/username/repo
+```
+
+For more specific reviews:
+```
+Review this PR with strict tone and focus on security issues: https://github.com/username/repo/pull/123
+```
+                        """
 
 # MCP Request models
 class MCPMessage(BaseModel):
@@ -43,6 +68,8 @@ class MCPRequest(BaseModel):
     max_tokens: Optional[int] = 1000
     temperature: Optional[float] = 0.7
     stream: Optional[bool] = False
+    # OpenAI's end-user field; reviews are charged to this tenant's token budget
+    user: Optional[str] = None
 
 class CodeReviewInput(BaseModel):
     url: str
@@ -51,6 +78,8 @@ class CodeReviewInput(BaseModel):
     include_test_suggestions: Optional[bool] = True
     include_summary: Optional[bool] = True
     max_issues: Optional[int] = 10
+    review_mode: Optional[str] = "full"
+    context_lines: Optional[int] = 3
 
 class MCPResponse(BaseModel):
     id: str = "mcp-code-review-response"
@@ -59,13 +88,18 @@ class MCPResponse(BaseModel):
     created: int
     choices: List[Dict[str, Any]]
 
+@mcp_app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: per-stage review timings, GitHub API calls, cache hits and LLM token usage
+    """
+    return metrics_response()
+
 @mcp_app.post("/v1/chat/completions")
 async def mcp_code_review(request: MCPRequest):
     """
     MCP endpoint for code review services
     """
-    import time
-    
     # Get the last user message
     user_messages = [m for m in request.messages if m.role == "user"]
     if not user_messages:
@@ -78,53 +112,31 @@ async def mcp_code_review(request: MCPRequest):
         input_data = _parse_code_review_request(user_message)
         
         if input_data:
-            # Extract repo and PR info from the URL
-            repo_info = github_service.parse_github_url(input_data.url)
-            
             # Create review settings
-            from models import ReviewSettings, ReviewTone
+            from models import ReviewSettings, ReviewTone, ReviewMode
             settings = ReviewSettings(
                 tone=ReviewTone(input_data.review_tone),
                 include_test_suggestions=input_data.include_test_suggestions,
                 include_summary=input_data.include_summary,
-                max_issues=input_data.max_issues
+                max_issues=input_data.max_issues,
+                review_mode=ReviewMode(input_data.review_mode),
+                context_lines=input_data.context_lines
             )
+            run = ReviewRun(input_data.url, settings, input_data.file_paths, tenant=request.user,
+                            stream_tokens=bool(request.stream))
+            # An unusable URL is reported before a stream starts
+            await review_pipeline.run_stage("resolve", run)
             
-            # Fetch the code changes
-            if repo_info["is_pr"]:
-                code_changes = github_service.get_pr_changes(
-                    repo_info["owner"], 
-                    repo_info["repo"], 
-                    repo_info["pr_number"]
-                )
-            else:
-                code_changes = github_service.get_repo_files(
-                    repo_info["owner"], 
-                    repo_info["repo"],
-                    input_data.file_paths
+            if request.stream:
+                return StreamingResponse(
+                    _stream_completion(request.model, _stream_code_review(run)),
+                    media_type="text/event-stream"
                 )
             
-            # Analyze the code with LLM
-            analysis = llm_service.analyze_code(
-                code_changes, 
-                review_settings=settings
-            )
-            
-            # Generate a markdown report
-            markdown_report = llm_service.generate_markdown_report(analysis)
+            analysis = await review_pipeline.review(run)
             
             # Create response content
-            response_content = f"""
-# Code Review Results
-
-{markdown_report}
-
-## Analysis Summary
-- Total files analyzed: {analysis.total_files_analyzed}
-- Issues found: {len(analysis.issues)}
-- Test suggestions: {len(analysis.test_suggestions)}
-- Analysis completed in {analysis.analysis_time_seconds:.2f} seconds
-            """
+            response_content = _format_review_content(analysis)
             
             # Create MCP response
             response = {
@@ -141,12 +153,20 @@ async def mcp_code_review(request: MCPRequest):
                         },
                         "finish_reason": "stop"
                     }
-                ]
+                ],
+                "usage": {
+                    "prompt_tokens": analysis.token_usage.prompt_tokens,
+                    "completion_tokens": analysis.token_usage.completion_tokens,
+                    "total_tokens": analysis.token_usage.prompt_tokens + analysis.token_usage.completion_tokens
+                }
             }
             
             return response
         
         # If not a code review request, return a help message
+        if request.stream:
+            return StreamingResponse(_stream_completion(request.model, _single_chunk(HELP_MESSAGE)),
+                                     media_type="text/event-stream")
         return {
             "id": "mcp-code-review-" + str(int(time.time())),
             "model": request.model,
@@ -157,27 +177,7 @@ async def mcp_code_review(request: MCPRequest):
                     "index": 0,
                     "message": {
                         "role": "assistant",
-                        "content": """
-# Code Review Assistant MCP
-
-This is a Code Review Assistant MCP server that can analyze GitHub repositories or pull requests and provide AI-powered code review suggestions.
-
-## How to use:
-
-1. Provide a GitHub repository or pull request URL
-2. Optionally specify file paths to review
-3. Configure review settings like tone, test suggestions, etc.
-
-Example request:
-```
-Please review this GitHub repository: https://github.com/username/repo
-```
-
-For more specific reviews:
-```
-Review this PR with strict tone and focus on security issues: https://github.com/username/repo/pull/123
-```
-                        """
+                        "content": HELP_MESSAGE
                     },
                     "finish_reason": "stop"
                 }
@@ -186,6 +186,11 @@ Review this PR with strict tone and focus on security issues: https://github.com
         
     except Exception as e:
         # Return error message
+        if request.stream:
+            return StreamingResponse(
+                _stream_completion(request.model, _single_chunk(f"Error processing code review request: {str(e)}")),
+                media_type="text/event-stream"
+            )
         return {
             "id": "mcp-code-review-error-" + str(int(time.time())),
             "model": request.model,
@@ -203,6 +208,74 @@ Review this PR with strict tone and focus on security issues: https://github.com
             ]
         }
 
+def _format_review_content(analysis: ReviewResponse, include_issues: bool = True) -> str:
+    """Render the assistant message for a finished review"""
+    report = analysis if include_issues else analysis.model_copy(update={"issues": []})
+    markdown_report = llm_service.generate_markdown_report(report)
+    trimmed = ""
+    if analysis.token_usage.trimmed_files:
+        trimmed = f"\n- Left out to stay within the token budget: {', '.join(analysis.token_usage.trimmed_files)}"
+    return f"""
+# Code Review Results
+
+{markdown_report}
+
+## Analysis Summary
+- Total files analyzed: {analysis.total_files_analyzed}
+- Issues found: {len(analysis.issues)}
+- Test suggestions: {len(analysis.test_suggestions)}
+- Analysis completed in {analysis.analysis_time_seconds:.2f} seconds
+- Tokens used: {analysis.token_usage.prompt_tokens + analysis.token_usage.completion_tokens}{trimmed}
+            """
+
+async def _stream_code_review(run: ReviewRun) -> AsyncIterator[str]:
+    """Yield the review as Markdown fragments: progress lines, each issue as it is parsed, then the report"""
+    issues_streamed = 0
+    
+    def render(event: str, payload: Any) -> Optional[str]:
+        nonlocal issues_streamed
+        if event == "progress":
+            if payload["stage"] == "fetching":
+                return "Fetching files from GitHub...\n\n"
+            return f"Fetched {payload['files']} files, analyzing...\n\n"
+        if event == "batch":
+            return f"_Batch {payload['batch']} of {payload['total_batches']} analyzed._\n\n"
+        if event == "issue":
+            issues_streamed += 1
+            return llm_service.format_issue_markdown(payload, issues_streamed) + "\n\n"
+        # Issues already streamed are not repeated in the closing report
+        return _format_review_content(payload, include_issues=issues_streamed == 0)
+    
+    try:
+        async for content in review_pipeline.stream(run, render):
+            yield content
+    except Exception as e:
+        yield f"Error processing code review request: {str(e)}"
+
+async def _single_chunk(content: str) -> AsyncIterator[str]:
+    yield content
+
+async def _stream_completion(model: str, contents: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Wrap text fragments in OpenAI-compatible chat.completion.chunk Server-Sent Events"""
+    completion_id = "mcp-code-review-" + str(int(time.time()))
+    created = int(time.time())
+    
+    def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "model": model,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+    
+    yield chunk({"role": "assistant"})
+    async for content in contents:
+        yield chunk({"content": content})
+    yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
 def _parse_code_review_request(message: str) -> Optional[CodeReviewInput]:
     """
     Parse a user message to extract code review parameters
@@ -245,6 +318,20 @@ def _parse_code_review_request(message: str) -> Optional[CodeReviewInput]:
     if max_issues_match:
         review_input.max_issues = int(max_issues_match.group(1))
     
+    # Check for review mode
+    mode_pattern = r"mode:\s*(full|diff|symbols)"
+    mode_match = re.search(mode_pattern, message, re.IGNORECASE)
+    
+    if mode_match:
+        review_input.review_mode = mode_match.group(1).lower()
+    
+    # Check for context lines
+    context_lines_pattern = r"context(?:\s+|-)?lines:\s*(\d+)"
+    context_lines_match = re.search(context_lines_pattern, message, re.IGNORECASE)
+    
+    if context_lines_match:
+        review_input.context_lines = int(context_lines_match.group(1))
+    
     # Check for boolean flags
     if re.search(r"include\s+test\s+suggestions:\s*(?:false|no)", message, re.IGNORECASE):
         review_input.include_test_suggestions = False
@@ -0,0 +1,89 @@
+"""
+Prometheus metrics for the review pipeline.
+
+Each review stage (URL parsing, tree listing, file fetching, prompt building,
+the LLM call, response parsing and label application) is timed into one
+histogram labelled by stage. Counters track GitHub API calls by endpoint and
+status, cache lookups by cache and outcome, and LLM token usage by model.
+
+Both FastAPI apps expose the default registry at /metrics. When the server
+runs several worker processes, set PROMETHEUS_MULTIPROC_DIR so the values
+of all workers are aggregated.
+"""
+
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+
+# From quick cache hits up to multi-minute LLM batches
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "review_stage_seconds", "Time spent in each stage of a review", ["stage"], buckets=STAGE_BUCKETS
+)
+FILE_FETCH_SECONDS = Histogram(
+    "github_file_fetch_seconds", "Time to download the contents of one file from GitHub", buckets=STAGE_BUCKETS
+)
+GITHUB_REQUESTS = Counter(
+    "github_api_requests_total", "GitHub API requests by endpoint and response status", ["endpoint", "status"]
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens sent to and received from the LLM, as reported by it or estimated from the text",
+    ["model", "kind", "source"]
+)
+
+# Path segments that identify an object rather than an endpoint
+_VARIABLE_SEGMENT = re.compile(r"^(?:\d+|[0-9a-f]{40})$")
+
+def github_endpoint(path: str) -> str:
+    """Collapse a GitHub API path such as /repos/o/r/git/blobs/<sha> to a low-cardinality label like git/blobs"""
+    segments = [segment for segment in path.split("/") if segment]
+    if len(segments) < 3 or segments[0] != "repos":
+        return path
+    kept = []
+    for segment in segments[3:]:
+        if _VARIABLE_SEGMENT.match(segment) or (kept and kept[-1] in ("commits", "tarball", "trees")):
+            continue
+        kept.append(segment)
+    return "/".join(kept) or "repo"
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as one review stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+def record_cache_lookup(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def record_tokens(model: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+    source = "estimated" if estimated else "reported"
+    LLM_TOKENS.labels(model, "prompt", source).inc(prompt_tokens)
+    LLM_TOKENS.labels(model, "completion", source).inc(completion_tokens)
+
+def metrics_response() -> Response:
+    """Render the metrics in the Prometheus text format"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
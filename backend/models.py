@@ -7,6 +7,17 @@ class ReviewTone(str, Enum):
     MENTOR = "mentor"
     NEUTRAL = "neutral"
 
+class ReviewMode(str, Enum):
+    FULL = "full"
+    DIFF = "diff"
+    SYMBOLS = "symbols"
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class IssueLabel(str, Enum):
     SECURITY = "security"
     STYLE = "style"
@@ -22,6 +33,9 @@ class ReviewSettings(BaseModel):
     include_test_suggestions: bool = True
     include_summary: bool = True
     max_issues: int = 10
+    review_mode: ReviewMode = Field(ReviewMode.FULL, description="'diff' sends only changed hunks of PR files; 'symbols' sends the changed functions and classes with what they call")
+    context_lines: int = Field(3, ge=0, description="Lines of context around each hunk in diff and symbols mode")
+    token_budget: Optional[int] = Field(None, ge=1, description="Most tokens the review may use; defaults to REVIEW_TOKEN_BUDGET")
 
 class Issue(BaseModel):
     title: str
@@ -48,6 +62,22 @@ class CodeChange(BaseModel):
     content: str
     diff: Optional[str] = None
     is_new: bool = False
+    sha: Optional[str] = Field(None, description="Git blob SHA of the content")
+    skip_reason: Optional[str] = Field(None, description="Why the file is left out of the review, e.g. 'binary' or 'too_large'")
+    size: Optional[int] = Field(None, description="Size in bytes, when known")
+
+class SkippedFile(BaseModel):
+    file_path: str
+    reason: str
+    size: Optional[int] = None
+
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    usage_estimated: bool = Field(False, description="prompt_tokens and completion_tokens include estimates because the model reported no usage, e.g. for streamed answers")
+    estimated_tokens: int = Field(0, description="Estimate made before the LLM calls, including reserved output tokens")
+    budget: Optional[int] = Field(None, description="Tokens the review was allowed to use")
+    trimmed_files: List[str] = Field(default_factory=list, description="Files left out, fully or partly, to stay within the budget")
 
 class ReviewResponse(BaseModel):
     issues: List[Issue] = []
@@ -56,3 +86,26 @@ class ReviewResponse(BaseModel):
     suggested_labels: List[IssueLabel] = []
     total_files_analyzed: int
     analysis_time_seconds: float
+    cached: bool = Field(False, description="True when the review was served from the review cache")
+    llm_backend: Optional[str] = Field(None, description="Backend that wrote the review; 'offline' reviews are mock reviews made without a model")
+    token_usage: TokenUsage = Field(default_factory=TokenUsage)
+    skipped_files: List[SkippedFile] = Field(default_factory=list, description="Files that could not be reviewed, such as binary or oversized files")
+
+class ReviewJobRequest(ReviewRequest):
+    priority: int = Field(0, description="Jobs with a higher priority are started first")
+    callback_url: Optional[HttpUrl] = Field(None, description="URL that receives the finished job as a JSON POST")
+
+class ReviewJob(BaseModel):
+    id: str
+    status: JobStatus = JobStatus.QUEUED
+    request: ReviewJobRequest
+    head_sha: Optional[str] = Field(None, description="Commit the review was requested for")
+    tenant_id: Optional[str] = Field(None, description="Tenant whose token budget pays for the review")
+    dedup_key: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    worker_id: Optional[str] = Field(None, description="Worker process running the job")
+    heartbeat_at: Optional[float] = Field(None, description="When the running worker last renewed its claim")
+    finished_at: Optional[float] = None
+    result: Optional[ReviewResponse] = None
+    error: Optional[str] = None
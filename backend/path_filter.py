@@ -0,0 +1,181 @@
+"""
+Rules deciding which files of a repository or pull request are reviewed.
+
+All rules are compiled once: file suffixes into a tuple for one endswith()
+call, skipped directories into a set matched against whole path segments
+(so `mybuild/` is not mistaken for `build/`), lockfile names into a set, and
+glob or regex patterns into a single anchored regular expression. Files
+over the size threshold are dropped from the tree metadata (or, for pull
+requests, from the size their patch shows) before anything is downloaded, and looks_binary() sniffs downloaded content so binary files
+are reported as skipped instead of being sent to the model.
+
+Repositories can adjust the rules in their root `.gitattributes`: paths
+marked `linguist-generated` or `linguist-vendored` are skipped, and
+`-linguist-generated` / `linguist-vendored=false` bring paths back.
+
+Patterns follow .gitattributes conventions: a pattern without a slash
+matches the file name at any depth, a leading slash anchors it to the
+repository root, `**` spans directories and a trailing slash matches
+everything below a directory. Patterns starting with `re:` are regular
+expressions matched against the whole path.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+DEFAULT_SKIP_SUFFIXES = (
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".pdf", ".zip", ".tar", ".gz", ".pyc",
+    ".min.js", ".min.css", ".map", ".woff", ".woff2", ".ttf", ".eot", ".mp3", ".mp4", ".mov",
+    ".avi", ".exe", ".dll", ".so", ".dylib", ".class", ".jar",
+)
+DEFAULT_SKIP_DIRECTORIES = (
+    "node_modules", "venv", ".venv", "dist", "build", ".git", "__pycache__", ".idea", ".vscode",
+)
+# Generated dependency pins: large, noisy and never worth review comments
+DEFAULT_SKIP_FILENAMES = (
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock", "Cargo.lock",
+    "composer.lock", "Gemfile.lock", "go.sum", "uv.lock",
+)
+DEFAULT_MAX_FILE_SIZE = 500000
+
+# Attributes that take a path out of the review, as on GitHub's language statistics
+SKIP_ATTRIBUTES = ("linguist-generated", "linguist-vendored")
+
+# Like git, only the start of a file is inspected to tell text from binary
+SNIFF_BYTES = 8000
+# Control characters that are common in text: bell, backspace, tab, newline, form feed, carriage return, escape
+TEXT_CONTROL_BYTES = frozenset(b"\a\b\t\n\f\r\x1b")
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a .gitattributes-style glob, or a `re:` pattern, into a regex for the whole path"""
+    if pattern.startswith("re:"):
+        return f"(?:{pattern[3:]})"
+
+    directory = pattern.endswith("/")
+    # Only a leading or inner slash anchors the pattern; the trailing one marks a directory
+    pattern = pattern.rstrip("/") if directory else pattern
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            members = pattern[i + 1:end].replace("\\", "\\\\")
+            parts.append("[" + ("^" + members[1:] if members.startswith("!") else members) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+
+    body = "".join(parts)
+    prefix = "" if anchored else "(?:.*/)?"
+    return f"(?:{prefix}{body}{'/.*' if directory else ''})"
+
+def _compile(patterns: Iterable[str]) -> Optional["re.Pattern[str]"]:
+    regexes = [glob_to_regex(pattern) for pattern in patterns]
+    return re.compile("|".join(regexes)) if regexes else None
+
+class PathFilter:
+    def __init__(self,
+                 skip_suffixes: Iterable[str] = DEFAULT_SKIP_SUFFIXES,
+                 skip_directories: Iterable[str] = DEFAULT_SKIP_DIRECTORIES,
+                 skip_filenames: Iterable[str] = DEFAULT_SKIP_FILENAMES,
+                 skip_patterns: Iterable[str] = (),
+                 include_patterns: Iterable[str] = (),
+                 max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE):
+        """
+        Compile the rules. include_patterns win over every skip rule except the
+        size limit; max_file_size of None disables the size check.
+        """
+        self.skip_suffixes = tuple(suffix.lower() for suffix in skip_suffixes)
+        self.skip_directories = frozenset(skip_directories)
+        self.skip_filenames = frozenset(skip_filenames)
+        self.skip_patterns = tuple(skip_patterns)
+        self.include_patterns = tuple(include_patterns)
+        self.max_file_size = max_file_size
+        self._skip = _compile(self.skip_patterns)
+        self._include = _compile(self.include_patterns)
+
+    def skip_reason(self, path: str, size: Optional[int] = None) -> Optional[str]:
+        """Why a file is left out of the review, or None when it is reviewed"""
+        if size is not None and self.max_file_size is not None and size > self.max_file_size:
+            return "too_large"
+        if self._include is not None and self._include.fullmatch(path):
+            return None
+
+        directories, _, name = path.rpartition("/")
+        if name.lower().endswith(self.skip_suffixes):
+            return "file_type"
+        if name in self.skip_filenames:
+            return "lockfile"
+        if directories and not self.skip_directories.isdisjoint(directories.split("/")):
+            return "directory"
+        if self._skip is not None and self._skip.fullmatch(path):
+            return "pattern"
+        return None
+
+    def is_reviewable(self, path: str, size: Optional[int] = None) -> bool:
+        return self.skip_reason(path, size) is None
+
+    def with_gitattributes(self, text: str) -> "PathFilter":
+        """A copy of this filter that also honours the linguist markers of a .gitattributes file"""
+        skip, include = parse_gitattributes(text)
+        if not skip and not include:
+            return self
+        return PathFilter(self.skip_suffixes, self.skip_directories, self.skip_filenames,
+                          self.skip_patterns + tuple(skip), self.include_patterns + tuple(include),
+                          self.max_file_size)
+
+def parse_gitattributes(text: str) -> Tuple[List[str], List[str]]:
+    """Return (patterns marked generated or vendored, patterns explicitly unmarked)"""
+    skip, include = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        pattern, *attributes = line.split()
+        for attribute in attributes:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name not in SKIP_ATTRIBUTES:
+                continue
+            unset = attribute.startswith(("-", "!")) or value.lower() == "false"
+            (include if unset else skip).append(pattern)
+    return skip, include
+
+def looks_binary(data: bytes) -> bool:
+    """Whether content is binary: a NUL byte near the start, or more than a few unusual control characters"""
+    sample = data[:SNIFF_BYTES]
+    if b"\0" in sample:
+        return True
+    # Text, whatever its encoding, has almost no control characters besides whitespace
+    control = sum(1 for byte in sample if byte < 32 and byte not in TEXT_CONTROL_BYTES)
+    return control > len(sample) * 0.05
+
+def _env_list(name: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, "").split(",") if item.strip()]
+
+def path_filter_from_env() -> PathFilter:
+    """
+    Default rules extended by REVIEW_SKIP_PATTERNS and REVIEW_INCLUDE_PATTERNS
+    (comma-separated) and sized by MAX_REVIEW_FILE_SIZE
+    """
+    return PathFilter(
+        skip_patterns=_env_list("REVIEW_SKIP_PATTERNS"),
+        include_patterns=_env_list("REVIEW_INCLUDE_PATTERNS"),
+        max_file_size=int(os.getenv("MAX_REVIEW_FILE_SIZE", DEFAULT_MAX_FILE_SIZE)),
+    )
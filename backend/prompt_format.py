@@ -0,0 +1,122 @@
+"""
+Compact prompt encoding for reviews.
+
+Files are embedded as fenced blocks under a `### path` heading instead of
+as an indented JSON dump, so source code reaches the model verbatim rather
+than with every newline and quote escaped. Non-blank code lines carry their
+line number as a `12|` prefix, which keeps the line_numbers the model
+reports tied to real lines, including for excerpts and for parts of split
+files. benchmarks/prompt_size.py measures the difference in prompt tokens.
+
+The instructions around the files depend only on the review settings, so
+they are rendered once per distinct combination and reused.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from models import ReviewMode, ReviewSettings, ReviewTone
+
+# Marks the heading of each file block; the offline backend reads file paths from it
+FILE_HEADING = "### "
+NEW_FILE_MARK = " (new file)"
+
+# Excerpt lists produced by diff and symbols mode, with the caption shown for each
+EXCERPT_SECTIONS = (
+    ("symbols", "Changed"),
+    ("context", "Context"),
+    ("dependencies", "Called"),
+)
+
+TONE_INSTRUCTIONS = {
+    ReviewTone.STRICT: "Be thorough and critical in your review. Focus on identifying all issues and potential improvements.",
+    ReviewTone.MENTOR: "Be constructive and educational. Explain issues clearly and provide guidance on how to improve the code.",
+    ReviewTone.NEUTRAL: "Provide a balanced review focusing on significant issues while acknowledging good practices.",
+}
+
+MODE_NOTES = {
+    ReviewMode.FULL: "",
+    ReviewMode.DIFF: ("Only the changed hunks are shown for pull request files, with excerpts of the surrounding "
+                      "code under 'Context'. Focus on the changes."),
+    ReviewMode.SYMBOLS: ("Pull request files are shown as their diff, the changed functions and classes under "
+                         "'Changed', the code they call under 'Called' and the imports they use; other changed "
+                         "lines appear under 'Context'. Focus on the changes."),
+}
+
+RESPONSE_FORMAT = """FORMAT YOUR RESPONSE AS A JSON OBJECT with the following structure:
+{"issues": [{"title": "Issue title", "file_path": "path/to/file.ext", "line_numbers": [23, 24], "severity": "high", "description": "Detailed explanation of the issue", "suggestion": "How to fix it", "code_example": "Example code fix", "labels": ["security", "refactor"]}],
+ "test_suggestions": [{"file_path": "path/to/file.ext", "test_description": "What should be tested", "test_case_example": "Example test code"}],
+ "summary": "High-level summary for non-technical stakeholders",
+ "suggested_labels": ["security", "refactor"]}"""
+
+_BACKTICKS = re.compile(r"`{3,}")
+
+def fence(text: str, language: str = "") -> str:
+    """Wrap text in a code fence longer than any backtick run inside it"""
+    longest = max((len(run) for run in _BACKTICKS.findall(text)), default=2)
+    marker = "`" * max(3, longest + 1)
+    body = text.rstrip("\n")
+    return f"{marker}{language}\n{body}\n{marker}"
+
+def number_lines(code: str, first_line: int = 1) -> str:
+    """Prefix every non-blank line with its line number in the file; the next number places blank lines"""
+    return "\n".join(f"{number}|{line}" if line.strip() else ""
+                     for number, line in enumerate(code.splitlines(), first_line))
+
+def format_file(file_path: str, entry: Dict[str, Any]) -> str:
+    """One prepared file as a heading followed by fenced, line-numbered blocks"""
+    parts = [FILE_HEADING + file_path + (NEW_FILE_MARK if entry.get("is_new") else "")]
+    if entry.get("content"):
+        parts.append(fence(number_lines(entry["content"], entry.get("first_line", 1))))
+    # A new file's diff only repeats its content with every line added
+    if entry.get("diff") and not (entry.get("is_new") and entry.get("content")):
+        parts.append("Diff:\n" + fence(entry["diff"], "diff"))
+    for key, caption in EXCERPT_SECTIONS:
+        for excerpt in entry.get(key, []):
+            label = f" {excerpt['kind']} {excerpt['name']}" if "name" in excerpt else ""
+            parts.append(f"{caption}{label}:\n" + fence(number_lines(excerpt["code"], excerpt["start_line"])))
+    if entry.get("imports"):
+        parts.append("Imports:\n" + fence(entry["imports"]))
+    return "\n".join(parts)
+
+def format_files(code_content: Dict[str, Dict[str, Any]]) -> str:
+    return "\n\n".join(format_file(path, entry) for path, entry in code_content.items())
+
+@lru_cache(maxsize=128)
+def _static_sections(tone: ReviewTone, review_mode: ReviewMode, max_issues: int,
+                     include_test_suggestions: bool, include_summary: bool) -> Tuple[str, str]:
+    """The text before and after the files, for one combination of settings"""
+    head = [
+        "You are an expert code reviewer with deep knowledge of software engineering best practices, "
+        "security, and performance optimization.",
+        f"REVIEW TONE ({tone.value}): {TONE_INSTRUCTIONS[tone]}",
+        "TASK: Perform a detailed code review of the following files and return a structured analysis.",
+    ]
+    if MODE_NOTES[review_mode]:
+        head.append(MODE_NOTES[review_mode])
+    head.append("Every non-blank code line starts with its line number and '|'; line numbers refer to the new "
+                "version of each file.\n\nFILES TO REVIEW:")
+
+    instructions: List[str] = [
+        f"Identify up to {max_issues} issues or areas for improvement in the code.",
+        "For each issue, provide a clear title, the file path and line numbers where it occurs, a severity "
+        "from: critical, high, medium, low, info, why it is problematic, a specific suggestion for how to fix "
+        "it, an example of improved code when applicable, and labels from: security, style, refactor, "
+        "test_coverage, performance, documentation, bug. Report each problem once.",
+    ]
+    if include_test_suggestions:
+        instructions.append("Suggest test cases for components that lack testing.")
+    if include_summary:
+        instructions.append("Provide a high-level summary of the changes that would be understandable by "
+                            "non-technical stakeholders.")
+    tail = ["INSTRUCTIONS:"]
+    tail.extend(f"{number}. {instruction}" for number, instruction in enumerate(instructions, 1))
+    tail.append("\n" + RESPONSE_FORMAT)
+    return "\n\n".join(head), "\n".join(tail)
+
+def build_prompt(code_content: Dict[str, Dict[str, Any]], settings: ReviewSettings) -> str:
+    """The full review prompt for a batch of prepared files"""
+    head, tail = _static_sections(settings.tone, settings.review_mode, settings.max_issues,
+                                  settings.include_test_suggestions, settings.include_summary)
+    return f"{head}\n\n{format_files(code_content)}\n\n{tail}\n"
@@ -0,0 +1,157 @@
+"""
+Cache of finished reviews.
+
+A review is fully determined by the commit it looked at, the exact file
+contents and diffs sent to the model, the review settings and the model
+itself. When all of those match an earlier review, the stored
+ReviewResponse is returned instead of calling the LLM again.
+
+Backends are pluggable: MemoryReviewCache keeps entries in-process and
+SQLiteReviewCache persists them in a local database file. Both evict by
+TTL and by entry count.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from models import CodeChange, ReviewSettings
+
+logger = logging.getLogger(__name__)
+
+# Skip reasons that follow from the file itself or the path rules, so a retry skips the file again;
+# 'unavailable' and 'not_found' come from failed downloads and are left out
+DETERMINISTIC_SKIP_REASONS = frozenset({"too_large", "symlink", "binary", "file_type", "lockfile", "directory",
+                                        "pattern"})
+
+def review_cache_key(code_changes: List[CodeChange], settings: ReviewSettings, model: str,
+                     head_sha: Optional[str] = None) -> Optional[str]:
+    """
+    Build the cache key for a review, or return None when some reviewed file
+    has no blob SHA and the contents therefore cannot be identified cheaply,
+    or when a file was skipped for a reason a retry may not repeat. Skipped
+    files are sent to no model, so their path and the reason suffice.
+    """
+    reviewed = [change for change in code_changes if not change.skip_reason]
+    if not code_changes or any(not change.sha for change in reviewed):
+        return None
+    if any(change.skip_reason not in DETERMINISTIC_SKIP_REASONS for change in code_changes if change.skip_reason):
+        return None
+    files = sorted(
+        (change.file_path, change.sha, hashlib.sha256((change.diff or "").encode("utf-8")).hexdigest())
+        for change in reviewed
+    )
+    skipped = sorted((change.file_path, change.skip_reason) for change in code_changes if change.skip_reason)
+    material = {
+        "head_sha": head_sha,
+        "files": files,
+        "skipped": skipped,
+        "tone": settings.tone.value,
+        "max_issues": settings.max_issues,
+        "include_test_suggestions": settings.include_test_suggestions,
+        "include_summary": settings.include_summary,
+        "review_mode": settings.review_mode.value,
+        "context_lines": settings.context_lines,
+        "model": model,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ReviewCacheBackend:
+    """Interface for review cache storage; values are serialized ReviewResponse JSON"""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+class MemoryReviewCache(ReviewCacheBackend):
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        """In-process LRU cache of up to max_entries reviews, each kept for ttl_seconds"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteReviewCache(ReviewCacheBackend):
+    def __init__(self, path: str, max_entries: int = 1000, ttl_seconds: float = 86400):
+        """Review cache stored in a SQLite file, shared by every process that opens it"""
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS reviews ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM reviews WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE reviews SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO reviews (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            db.execute("DELETE FROM reviews WHERE created_at <= ?", (now - self.ttl_seconds,))
+            db.execute(
+                "DELETE FROM reviews WHERE key NOT IN "
+                "(SELECT key FROM reviews ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+def review_cache_from_env() -> Optional[ReviewCacheBackend]:
+    """Build the backend selected by REVIEW_CACHE_BACKEND (memory, sqlite or none)"""
+    backend = os.getenv("REVIEW_CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", 1000))
+    ttl_seconds = float(os.getenv("REVIEW_CACHE_TTL_SECONDS", 86400))
+
+    if backend == "none":
+        logger.info("Review cache disabled")
+        return None
+    if backend == "sqlite":
+        path = os.getenv("REVIEW_CACHE_PATH", "review_cache.sqlite3")
+        logger.info(f"Using SQLite review cache at {path}")
+        return SQLiteReviewCache(path, max_entries, ttl_seconds)
+    return MemoryReviewCache(max_entries, ttl_seconds)
@@ -0,0 +1,326 @@
+"""
+Incremental parser for the JSON reviews the LLM writes.
+
+The answer is fed in as it arrives. Each entry of "issues" and
+"test_suggestions" is decoded on its own as soon as its closing brace is
+seen, so entries can be streamed before the answer is finished, a
+malformed entry costs only itself, and an answer cut off at max_tokens
+still yields every entry completed before the cut. Text around the JSON
+object, such as a preamble or a Markdown fence, is ignored.
+
+Fields are read leniently: labels and severities are matched
+case-insensitively with a few common aliases and unknown ones are dropped,
+and line numbers given as strings or ranges are converted.
+"""
+
+import re
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from models import Issue, IssueLabel, ReviewResponse, TestSuggestion
+
+logger = logging.getLogger(__name__)
+
+ReviewItem = Union[Issue, TestSuggestion]
+
+# Label spellings models use besides the IssueLabel values
+LABEL_ALIASES = {
+    "test": IssueLabel.TEST_COVERAGE,
+    "tests": IssueLabel.TEST_COVERAGE,
+    "testing": IssueLabel.TEST_COVERAGE,
+    "coverage": IssueLabel.TEST_COVERAGE,
+    "doc": IssueLabel.DOCUMENTATION,
+    "docs": IssueLabel.DOCUMENTATION,
+    "perf": IssueLabel.PERFORMANCE,
+    "bugs": IssueLabel.BUG,
+    "correctness": IssueLabel.BUG,
+    "readability": IssueLabel.STYLE,
+    "maintainability": IssueLabel.REFACTOR,
+    "vulnerability": IssueLabel.SECURITY,
+}
+
+SEVERITIES = ("critical", "high", "medium", "low", "info")
+SEVERITY_ALIASES = {
+    "blocker": "critical",
+    "major": "high",
+    "error": "high",
+    "moderate": "medium",
+    "warning": "medium",
+    "minor": "low",
+    "trivial": "info",
+    "nit": "info",
+}
+
+# Where the parser is in the answer
+SEEK_OBJECT, EXPECT_KEY, EXPECT_VALUE, IN_ITEMS, DONE = range(5)
+
+_STRING_BODY = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_KEY = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*', re.DOTALL)
+_SCALAR = re.compile(r'[^,\]}\s]*')
+_WHITESPACE = re.compile(r'[\s,]*')
+_LINE_RANGE = re.compile(r"^\s*(\d+)\s*(?:-\s*(\d+))?\s*$")
+
+def parse_labels(values: Any) -> List[IssueLabel]:
+    """Known labels from whatever the model returned, in order and without duplicates"""
+    if isinstance(values, str):
+        values = [values]
+    if not isinstance(values, list):
+        return []
+    labels: List[IssueLabel] = []
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        name = value.strip().lower().replace("-", "_").replace(" ", "_")
+        try:
+            label = IssueLabel(name)
+        except ValueError:
+            label = LABEL_ALIASES.get(name.replace("_", " ")) or LABEL_ALIASES.get(name)
+        if label is not None and label not in labels:
+            labels.append(label)
+    return labels
+
+def parse_severity(value: Any) -> Optional[str]:
+    """One of SEVERITIES, or None when the model gave none or an unknown one"""
+    if not isinstance(value, str):
+        return None
+    name = value.strip().lower()
+    return name if name in SEVERITIES else SEVERITY_ALIASES.get(name)
+
+def parse_line_numbers(values: Any) -> List[int]:
+    """Line numbers from ints, numeric strings or "12-14" ranges"""
+    if not isinstance(values, list):
+        values = [values]
+    numbers: List[int] = []
+    for value in values:
+        if isinstance(value, int) and not isinstance(value, bool):
+            numbers.append(value)
+        elif isinstance(value, str):
+            match = _LINE_RANGE.match(value)
+            if match:
+                first = int(match.group(1))
+                last = int(match.group(2) or first)
+                numbers.extend(range(first, min(last, first + 200) + 1))
+    return numbers
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else "" if value is None else str(value)
+
+def build_issue(data: Dict[str, Any]) -> Issue:
+    return Issue(
+        title=_text(data.get("title")) or "Unnamed Issue",
+        file_path=_text(data.get("file_path")),
+        line_numbers=parse_line_numbers(data.get("line_numbers", [])),
+        description=_text(data.get("description")),
+        suggestion=_text(data.get("suggestion")),
+        code_example=_text(data.get("code_example")),
+        labels=parse_labels(data.get("labels", [])),
+        severity=parse_severity(data.get("severity"))
+    )
+
+def build_test_suggestion(data: Dict[str, Any]) -> TestSuggestion:
+    return TestSuggestion(
+        file_path=_text(data.get("file_path")),
+        test_description=_text(data.get("test_description")),
+        test_case_example=_text(data.get("test_case_example"))
+    )
+
+ITEM_BUILDERS: Dict[str, Callable[[Dict[str, Any]], ReviewItem]] = {
+    "issues": build_issue,
+    "test_suggestions": build_test_suggestion,
+}
+
+def _string_end(text: str, start: int) -> Optional[int]:
+    """End (exclusive) of the JSON string opening at start, or None if it is not complete yet"""
+    match = _STRING_BODY.match(text, start + 1)
+    return match.end() if match else None
+
+def _value_end(text: str, start: int, final: bool) -> Optional[int]:
+    """End (exclusive) of the JSON value starting at start, or None if more text is needed"""
+    first = text[start]
+    if first == '"':
+        return _string_end(text, start)
+    if first in "{[":
+        depth = 0
+        index = start
+        while index < len(text):
+            char = text[index]
+            if char == '"':
+                end = _string_end(text, index)
+                if end is None:
+                    return None
+                index = end
+                continue
+            if char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            index += 1
+        return None
+    end = _SCALAR.match(text, start).end()
+    # A number at the end of the text may still be growing
+    return end if end < len(text) or final else None
+
+class ReviewStreamParser:
+    def __init__(self, on_item: Optional[Callable[[ReviewItem], None]] = None):
+        """
+        Parse a review answer fed in pieces, calling on_item with every issue
+        and test suggestion as soon as it is complete
+        """
+        self.on_item = on_item
+        # Entries already reported stay reported when the answer is restarted
+        self._reported = {key: 0 for key in ITEM_BUILDERS}
+        self.restart()
+
+    def restart(self):
+        """Forget the answer so far, e.g. because the request is being retried"""
+        self.text = ""
+        self.items: Dict[str, List[ReviewItem]] = {key: [] for key in ITEM_BUILDERS}
+        self.summary: Optional[str] = None
+        self.suggested_labels: List[IssueLabel] = []
+        self.dropped = 0
+        self._position = 0
+        self._state = SEEK_OBJECT
+        self._key: Optional[str] = None
+
+    @property
+    def found_object(self) -> bool:
+        """Whether the answer contained a JSON object at all"""
+        return self._state != SEEK_OBJECT
+
+    @property
+    def complete(self) -> bool:
+        """Whether the whole JSON object has been read"""
+        return self._state == DONE
+
+    def feed(self, chunk: str) -> List[ReviewItem]:
+        """Add text to the answer and return the entries it completed"""
+        self.text += chunk
+        return self._advance(final=False)
+
+    def close(self, full_text: Optional[str] = None) -> ReviewResponse:
+        """
+        Finish the answer, given in full when it was not (or not entirely) fed,
+        and return the review made of every entry that could be read
+        """
+        if full_text is not None and full_text != self.text:
+            if full_text.startswith(self.text):
+                self.feed(full_text[len(self.text):])
+            else:
+                self.restart()
+                self.feed(full_text)
+        self._advance(final=True)
+
+        issues = self.items["issues"]
+        if not self.complete:
+            logger.warning(f"LLM answer ended early; kept {len(issues)} issues and "
+                           f"{len(self.items['test_suggestions'])} test suggestions")
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} malformed entries from the LLM answer")
+        return ReviewResponse(
+            issues=issues,
+            test_suggestions=self.items["test_suggestions"],
+            summary=self.summary or "",
+            suggested_labels=self.suggested_labels,
+            total_files_analyzed=0,
+            analysis_time_seconds=0.0
+        )
+
+    def _advance(self, final: bool) -> List[ReviewItem]:
+        completed: List[ReviewItem] = []
+        text = self.text
+        while self._state != DONE:
+            if self._state == SEEK_OBJECT:
+                start = text.find("{", self._position)
+                if start < 0:
+                    self._position = len(text)
+                    break
+                self._position = start + 1
+                self._state = EXPECT_KEY
+            elif self._state == EXPECT_KEY:
+                position = _WHITESPACE.match(text, self._position).end()
+                if position == len(text):
+                    break
+                if text[position] == "}":
+                    self._position = position + 1
+                    self._state = DONE
+                    break
+                match = _KEY.match(text, position)
+                if match is None or match.end() == len(text):
+                    # The key, or what follows it, has not fully arrived (or is not JSON at all)
+                    if match is None and text[position] != '"':
+                        self._state = DONE
+                    break
+                try:
+                    self._key = json.loads(f'"{match.group(1)}"')
+                except json.JSONDecodeError:
+                    self._key = match.group(1)
+                self._position = match.end()
+                self._state = EXPECT_VALUE
+            elif self._state == EXPECT_VALUE:
+                if self._key in ITEM_BUILDERS and text[self._position] == "[":
+                    self._position += 1
+                    self._state = IN_ITEMS
+                    continue
+                end = _value_end(text, self._position, final)
+                if end is None:
+                    break
+                self._store_field(text[self._position:end])
+                self._position = end
+                self._state = EXPECT_KEY
+            elif self._state == IN_ITEMS:
+                position = _WHITESPACE.match(text, self._position).end()
+                if position == len(text):
+                    break
+                if text[position] == "]":
+                    self._position = position + 1
+                    self._state = EXPECT_KEY
+                    continue
+                end = _value_end(text, position, final)
+                if end is None:
+                    break
+                if end == position:
+                    # Not a JSON value; nothing after this point can be read
+                    self._state = DONE
+                    break
+                item = self._build_item(text[position:end])
+                self._position = end
+                if item is not None:
+                    completed.append(item)
+        return completed
+
+    def _store_field(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        if self._key == "summary" and isinstance(value, str):
+            self.summary = value
+        elif self._key == "suggested_labels":
+            self.suggested_labels = parse_labels(value)
+
+    def _build_item(self, raw: str) -> Optional[ReviewItem]:
+        key = self._key
+        try:
+            data = json.loads(raw)
+            if not isinstance(data, dict):
+                raise ValueError(f"expected an object, got {type(data).__name__}")
+            item = ITEM_BUILDERS[key](data)
+        except ValueError as e:
+            # Pydantic's ValidationError and JSONDecodeError are both ValueErrors
+            logger.warning(f"Skipping malformed entry in {key}: {str(e)}")
+            self.dropped += 1
+            return None
+        items = self.items[key]
+        items.append(item)
+        if len(items) > self._reported[key]:
+            self._reported[key] = len(items)
+            if self.on_item is not None:
+                self.on_item(item)
+        return item
+
+def parse_review(text: str) -> ReviewResponse:
+    """Parse a complete (or truncated) answer in one go"""
+    return ReviewStreamParser().close(text)
@@ -0,0 +1,241 @@
+"""
+The review pipeline shared by the REST and MCP front-ends.
+
+A review runs as a sequence of named stages, each reading and extending one
+ReviewRun:
+
+    resolve      parse the GitHub URL into the repository or pull request to review
+    list         list the pull request's changed files or the repository tree, and the head commit
+    filter       choose the files to download (path rules, size limits, requested file_paths)
+    fetch        download their contents
+    index        prepare each file for the prompt (diff context, symbol index)
+    prompt       split the files into batches that fit the token budgets and render their prompts
+    call         send the prompts to the LLM, batch_concurrency at a time
+    parse        read one answer into a review; run by call as each answer arrives
+    postprocess  merge the batch reviews, deduplicate and rank their issues
+
+A review of a commit already in the review cache stops after fetch. A run
+given its files up front (webhook re-reviews of the changed files, or
+LLMService.analyze_code) starts at that cache check instead. The
+front-ends only build a ReviewRun from their request and render the events;
+rendering is not a stage, since each front-end has its own response format
+(Server-Sent Events, OpenAI chat chunks) and passes it to stream() as
+`render`. So the concurrency limit, review cache and stage timings apply to
+both in the same way. Every stage is looked up in ReviewPipeline.stages, so a
+stage can be swapped out (to stub or time it) without touching the others.
+"""
+
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from github_service import GithubService
+from llm_service import LLMService
+from concurrency import review_semaphore
+from metrics import stage
+from models import CodeChange, ReviewResponse, ReviewSettings
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("resolve", "list", "filter", "fetch", "index", "prompt", "call", "parse", "postprocess")
+
+class ReviewRun:
+    def __init__(self, url: Optional[str], settings: ReviewSettings, file_paths: Optional[List[str]] = None,
+                 tenant: Optional[str] = None, stream_tokens: bool = False,
+                 code_changes: Optional[List[CodeChange]] = None, head_sha: Optional[str] = None):
+        """
+        One review as it passes through the pipeline. The request fields are
+        set up front; each stage fills in what it produces. `timings` holds the
+        seconds spent in each stage, and `emit` receives the events of a
+        streamed review. A run given `code_changes` (and the `head_sha` they
+        were read at) reviews those files instead of fetching any, and needs
+        no `url`.
+        """
+        self.url = url
+        self.settings = settings
+        self.file_paths = file_paths
+        self.tenant = tenant
+        self.stream_tokens = stream_tokens
+
+        # resolve
+        self.target: Optional[Dict[str, Any]] = None
+        # list, filter, fetch
+        self.client = None
+        self.head_sha = head_sha
+        self.listing: Optional[Dict[str, Any]] = None
+        self.files: List[Dict[str, Any]] = []
+        self.skipped = []
+        self.prefetched = code_changes is not None
+        self.code_changes = list(code_changes or [])
+        # index, prompt
+        self.cache_key: Optional[str] = None
+        self.code_content: Dict[str, Dict[str, Any]] = {}
+        self.batches: List[Dict[str, Dict[str, Any]]] = []
+        self.usage = None
+        self.prompts: List[str] = []
+        # call, postprocess
+        self.reviews: List[ReviewResponse] = []
+        self.review: Optional[ReviewResponse] = None
+
+        self.start_time = time.time()
+        self.timings: Dict[str, float] = {}
+        self.emit: Callable[[str, Any], None] = lambda event, payload: None
+
+class ReviewPipeline:
+    def __init__(self, github_service: Optional[GithubService], llm_service: LLMService,
+                 stages: Optional[Dict[str, Callable]] = None):
+        """
+        Stages are called with the ReviewRun and may be coroutines; parse is
+        called with the run, one answer, its batch and the stream parser that
+        read it, and returns the batch's review. `stages` replaces the default
+        implementation of the stages it names. Without a github_service only
+        runs given their code_changes can be reviewed.
+        """
+        self.github_service = github_service
+        self.llm_service = llm_service
+        self.stages: Dict[str, Callable] = {
+            "resolve": self._resolve,
+            "list": self._list,
+            "filter": self._filter,
+            "fetch": self._fetch,
+            "index": self._index,
+            "prompt": self._prompt,
+            "call": self._call,
+            "parse": self._parse,
+            "postprocess": self._postprocess,
+        }
+        for name, stage in (stages or {}).items():
+            if name not in self.stages:
+                raise ValueError(f"Unknown review stage: {name}")
+            self.stages[name] = stage
+
+    async def review(self, run: ReviewRun) -> ReviewResponse:
+        """Run the review and return it"""
+        await self._execute(run)
+        return run.review
+
+    async def stream(self, run: ReviewRun,
+                     render: Optional[Callable[[str, Any], Any]] = None) -> AsyncIterator[Any]:
+        """
+        Run the review, yielding its events while the stages run: ("progress",
+        {"stage": "fetching"}) and ("progress", {"stage": "fetched", "files": n}),
+        ("issue", Issue) for each new finding, ("batch", progress) as each batch
+        finishes and finally ("result", ReviewResponse). With `render` each event
+        is passed through it instead, and events it renders as None are dropped.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        run.emit = lambda event, payload: events.put_nowait((event, payload))
+        task = asyncio.create_task(self._execute(run))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                output = render(*event) if render else event
+                if output is not None:
+                    yield output
+            # Raises the error that ended the review, if any
+            await task
+        finally:
+            # Stop the review if the consumer goes away mid-stream
+            task.cancel()
+
+    async def run_stage(self, name: str, run: ReviewRun, *args) -> Any:
+        """Run one stage, adding the time it took to run.timings[name]"""
+        start = time.perf_counter()
+        try:
+            result = self.stages[name](run, *args)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            run.timings[name] = run.timings.get(name, 0.0) + time.perf_counter() - start
+
+    async def _execute(self, run: ReviewRun):
+        if run.target is None and not run.prefetched:
+            await self.run_stage("resolve", run)
+        async with review_semaphore():
+            if not run.prefetched:
+                run.emit("progress", {"stage": "fetching"})
+                async with self.github_service.api_client() as run.client:
+                    for name in ("list", "filter", "fetch"):
+                        await self.run_stage(name, run)
+                run.client = None
+                logger.info(f"Fetched {len(run.code_changes)} files for analysis")
+                run.emit("progress", {"stage": "fetched", "files": len(run.code_changes)})
+
+            run.cache_key, run.review = self.llm_service.cached_review(run.code_changes, run.settings, run.head_sha)
+            if run.review is not None:
+                run.review.analysis_time_seconds = time.time() - run.start_time
+                logger.info(f"Serving review from cache in {run.review.analysis_time_seconds:.3f} seconds")
+            else:
+                # index and prompt together are the prompt_build stage of the review metrics
+                with stage("prompt_build"):
+                    for name in ("index", "prompt"):
+                        await self.run_stage(name, run)
+                for name in ("call", "postprocess"):
+                    await self.run_stage(name, run)
+        run.emit("result", run.review)
+
+    def _resolve(self, run: ReviewRun):
+        run.target = self.github_service.parse_github_url(run.url)
+
+    async def _list(self, run: ReviewRun):
+        target = run.target
+        pr_number = target.get("pr_number") if target["is_pr"] else None
+        listing = self.github_service.list_files(run.client, target["owner"], target["repo"], pr_number,
+                                                 run.file_paths)
+        if pr_number is None:
+            # A repository is listed at a commit, which keys the review cache
+            run.listing = await listing
+            run.head_sha = run.listing["sha"]
+        else:
+            run.head_sha, run.listing = await asyncio.gather(
+                self.github_service.head_sha(run.client, target["owner"], target["repo"], pr_number),
+                listing
+            )
+
+    def _filter(self, run: ReviewRun):
+        run.files, run.skipped = self.github_service.filter_files(run.listing, run.file_paths)
+
+    async def _fetch(self, run: ReviewRun):
+        run.code_changes = await self.github_service.fetch_files(
+            run.client, run.target["owner"], run.target["repo"], run.listing, run.files, run.skipped
+        )
+
+    def _index(self, run: ReviewRun):
+        run.code_content = self.llm_service.prepare_files(run.code_changes, run.settings)
+
+    def _prompt(self, run: ReviewRun):
+        run.batches, run.usage = self.llm_service.plan_review(run.code_content, run.settings, run.tenant)
+        run.prompts = self.llm_service.build_prompts(run.batches, run.settings)
+
+    async def _call(self, run: ReviewRun):
+        def parse(response, batch, code_changes, parser):
+            # Timed on its own, and as part of call
+            start = time.perf_counter()
+            try:
+                return self.stages["parse"](run, response, batch, parser)
+            finally:
+                run.timings["parse"] = run.timings.get("parse", 0.0) + time.perf_counter() - start
+
+        reviews: Dict[int, ReviewResponse] = {}
+        async for event in self.llm_service.review_batches(run.batches, run.prompts, run.code_changes, run.settings,
+                                                           run.usage, run.tenant, run.stream_tokens, parse):
+            if event[0] == "issue":
+                run.emit(*event)
+                continue
+            _, index, total, review = event
+            reviews[index] = review
+            run.emit("batch", {"batch": len(reviews), "total_batches": total, "issues": len(review.issues)})
+        run.reviews = [reviews[index] for index in sorted(reviews)]
+
+    def _parse(self, run: ReviewRun, response: str, batch: Dict[str, Dict[str, Any]], parser) -> ReviewResponse:
+        return self.llm_service.parse_batch(response, batch, run.code_changes, parser)
+
+    def _postprocess(self, run: ReviewRun):
+        run.review = self.llm_service.finish_review(run.reviews, run.batches, run.code_changes, run.settings,
+                                                    run.usage, run.start_time, run.cache_key)
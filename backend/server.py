@@ -0,0 +1,95 @@
+"""
+Production entry point: the REST API and the MCP API served together by
+several uvicorn worker processes.
+
+The REST app answers at / and the MCP app is mounted under /mcp, so MCP
+clients use http://host:8000/mcp/v1 as their base URL. Both front-ends in a
+worker share one GithubService and LLMService (see services.py).
+
+The supervisor loads .env and imports the app once before starting any
+worker, so a configuration error stops the server instead of every worker,
+and the workers inherit the loaded environment. Uvicorn starts workers as
+fresh processes, so each still builds its own clients and caches. With more
+than one worker, metrics are aggregated through PROMETHEUS_MULTIPROC_DIR
+(a temporary directory unless one is set). Review jobs must then live in a
+store every worker reads: one worker is started by default unless
+REVIEW_JOB_STORE=sqlite is set, and asking for more workers with the memory
+job store switches it to sqlite, so any worker can answer for a job another
+worker accepted.
+
+On SIGTERM or Ctrl+C each worker stops accepting connections, gives
+in-flight requests up to SHUTDOWN_DRAIN_SECONDS to finish, then gives running
+review jobs and webhook reviews the same time before it exits.
+
+Usage (from backend/):
+    python server.py --workers 4 --port 8000
+"""
+
+import os
+import sys
+import logging
+import argparse
+import tempfile
+from typing import List, Optional
+
+import uvicorn
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from concurrency import SHUTDOWN_DRAIN_SECONDS
+from main import app as rest_app
+from mcp_server import mcp_app
+
+logger = logging.getLogger(__name__)
+
+MCP_PREFIX = "/mcp"
+
+def create_app():
+    """The REST app with the MCP app mounted under MCP_PREFIX"""
+    # Worker processes run this module twice (as the spawned __main__ and as "server"), so mount once
+    if not any(getattr(route, "path", None) == MCP_PREFIX for route in rest_app.routes):
+        rest_app.mount(MCP_PREFIX, mcp_app)
+    return rest_app
+
+app = create_app()
+
+def shared_job_store() -> bool:
+    """Whether review jobs are kept where every worker can read them"""
+    return os.getenv("REVIEW_JOB_STORE", "memory").lower() == "sqlite"
+
+def default_workers() -> int:
+    """One worker per CPU when workers share the job store, otherwise a single worker"""
+    return (os.cpu_count() or 1) if shared_job_store() else 1
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the REST and MCP APIs with several worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", default_workers())),
+                        help="Worker processes (default: SERVER_WORKERS, else the number of CPUs with "
+                             "REVIEW_JOB_STORE=sqlite and 1 otherwise)")
+    args = parser.parse_args(argv)
+
+    # Set before the workers start, as they inherit the environment
+    if args.workers > 1:
+        if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            # Each worker writes its metrics where /metrics can collect them
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="code-review-metrics-")
+        if not shared_job_store():
+            logger.warning("Review jobs kept in memory are per worker; using REVIEW_JOB_STORE=sqlite instead")
+            os.environ["REVIEW_JOB_STORE"] = "sqlite"
+
+    logger.info(f"Serving REST and MCP APIs on {args.host}:{args.port} with {args.workers} workers")
+    uvicorn.run(
+        "server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+"""
+GitHub and LLM services shared by the API front-ends.
+
+main.py and mcp_server.py both use these instances, so a process serving
+the REST and the MCP API together (see server.py) keeps one set of HTTP
+clients, caches and token budgets rather than one per front-end. Both run
+their reviews through review_pipeline.
+"""
+
+import os
+from dotenv import load_dotenv
+
+from github_service import GithubService
+from llm_service import LLMService
+from review_pipeline import ReviewPipeline
+
+# Load environment variables
+load_dotenv()
+
+github_service = GithubService(os.getenv("GITHUB_TOKEN"))
+llm_service = LLMService()
+review_pipeline = ReviewPipeline(github_service, llm_service)
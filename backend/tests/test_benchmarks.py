@@ -0,0 +1,82 @@
+import unittest
+import sys
+import os
+import logging
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from run import SCENARIOS, BenchmarkConfig, compare, percentile, run_scenario
+import prompt_size
+import pipeline_stages
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_every_scenario_runs_on_a_small_repo(self):
+        """Test the harness runs each scenario end to end against the local stand-ins"""
+        config = BenchmarkConfig(iterations=2, concurrency=2)
+        for name in SCENARIOS:
+            result = run_scenario(name, 5, config)
+            self.assertEqual(result["scenario"], name)
+            self.assertEqual(result["iterations"], 2)
+            self.assertGreater(result["requests_per_second"], 0)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            if name not in ("analyze", "rank_issues"):
+                self.assertGreater(result["github_requests_per_run"], 0)
+
+    def test_percentile_nearest_rank(self):
+        """Test percentiles pick observed values"""
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(percentile(values, 0.50), 50.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile([3.0], 0.95), 3.0)
+
+    def test_compare_flags_slowdowns_over_threshold(self):
+        """Test only scenarios slower than the threshold are reported"""
+        baseline = {"results": [
+            {"scenario": "pr_fetch", "files": 10, "p50_ms": 10.0, "p95_ms": 20.0},
+            {"scenario": "repo_fetch", "files": 10, "p50_ms": 10.0, "p95_ms": 20.0},
+        ]}
+        results = [
+            {"scenario": "pr_fetch", "files": 10, "p50_ms": 11.0, "p95_ms": 21.0},
+            {"scenario": "repo_fetch", "files": 10, "p50_ms": 15.0, "p95_ms": 20.0},
+            {"scenario": "analyze", "files": 10, "p50_ms": 99.0, "p95_ms": 99.0},
+        ]
+        regressions = compare(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("repo_fetch", regressions[0])
+
+    def test_prompt_size_reports_savings(self):
+        """Test the prompt size comparison covers every review and saves tokens on pull requests"""
+        results = prompt_size.run(pr_files=10)
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertEqual(result["tokens_saved"], result["legacy_tokens"] - result["compact_tokens"])
+        # Whole files pay for a line number on every line, which outweighs the escaping the JSON dump adds,
+        # so only pull request reviews, where most code is sent as excerpts and diffs, get smaller
+        self.assertEqual(results[0]["review"], "backend sources (repository)")
+        for result in results[1:]:
+            self.assertGreater(result["tokens_saved"], 0, result["review"])
+
+    def test_pipeline_stages_are_timed_together_and_alone(self):
+        """Test every stage of a review is reported, and a single stage can be timed on its own"""
+        results = pipeline_stages.run(files=10, iterations=2)
+        self.assertEqual([result["stage"] for result in results], list(pipeline_stages.STAGES))
+        self.assertGreater(results[3]["p50_ms"], 0)
+
+        for stage in ("fetch", "parse"):
+            alone = pipeline_stages.run(files=10, iterations=2, stage=stage)
+            self.assertEqual(alone[0]["stage"], stage)
+            self.assertEqual(alone[0]["runs"], 2)
+            self.assertGreater(alone[0]["p50_ms"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
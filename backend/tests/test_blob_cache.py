@@ -0,0 +1,63 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_cache import BlobCache
+
+class TestBlobCache(unittest.TestCase):
+    
+    def test_memory_hit_and_miss(self):
+        """Test counters for hits and misses in the memory tier"""
+        cache = BlobCache()
+        self.assertIsNone(cache.get("abc"))
+        cache.put("abc", "print('hi')")
+        
+        self.assertEqual(cache.get("abc"), "print('hi')")
+        stats = cache.stats()
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["memory_entries"], 1)
+    
+    def test_memory_tier_evicts_least_recently_used(self):
+        """Test the memory tier stays under its byte limit"""
+        cache = BlobCache(max_memory_bytes=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        cache.get("a")
+        cache.put("c", "cccc")
+        
+        self.assertEqual(cache.get("a"), "aaaa")
+        self.assertIsNone(cache.get("b"))
+        self.assertLessEqual(cache.stats()["memory_bytes"], 10)
+    
+    def test_disk_tier_survives_new_instance(self):
+        """Test blobs written to disk are served to a fresh cache"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            BlobCache(disk_dir=disk_dir).put("abcdef", "content")
+            cache = BlobCache(disk_dir=disk_dir)
+            
+            self.assertEqual(cache.get("abcdef"), "content")
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            # The disk hit is promoted to memory
+            cache.get("abcdef")
+            self.assertEqual(cache.stats()["memory_hits"], 1)
+    
+    def test_disk_tier_evicts_by_size(self):
+        """Test the disk tier deletes old blobs when over its size limit"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = BlobCache(max_memory_bytes=0, disk_dir=disk_dir, max_disk_bytes=10)
+            cache.put("aa11", "123456")
+            os.utime(os.path.join(disk_dir, "aa", "aa11"), (0, 0))
+            cache.put("bb22", "654321")
+            
+            self.assertIsNone(cache.get("aa11"))
+            self.assertEqual(cache.get("bb22"), "654321")
+            self.assertLessEqual(cache.stats()["disk_bytes"], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import estimate_tokens, pack_files, merge_reviews
+from llm_service import LLMService
+from models import ReviewResponse, ReviewSettings, CodeChange, Issue, IssueLabel
+
+def measure(path, entry):
+    return estimate_tokens(path + entry.get("content", "") + entry.get("diff", ""))
+
+class TestChunking(unittest.TestCase):
+    
+    def test_pack_files_respects_budget_and_order(self):
+        """Test files are packed in order without exceeding the budget"""
+        files = {f"file{i}.py": {"content": "x" * 70, "is_new": False} for i in range(6)}
+        
+        batches = pack_files(files, 50, measure)
+        
+        self.assertEqual([path for batch in batches for path in batch], list(files))
+        for batch in batches:
+            self.assertLessEqual(sum(measure(path, entry) for path, entry in batch.items()), 50)
+        self.assertEqual(len(batches), 3)
+    
+    def test_pack_files_splits_oversized_file(self):
+        """Test a file larger than the budget is split into line ranges"""
+        content = "".join(f"line {i}\n" for i in range(100))
+        files = {"big.py": {"content": content, "diff": "@@ -1 +1 @@", "is_new": False}}
+        
+        batches = pack_files(files, 60, measure)
+        parts = [batch["big.py"] for batch in batches]
+        
+        self.assertGreater(len(parts), 1)
+        self.assertEqual("".join(part["content"] for part in parts), content)
+        self.assertEqual(parts[0]["first_line"], 1)
+        self.assertIn("diff", parts[0])
+        self.assertNotIn("diff", parts[1])
+    
+    def test_merge_reviews_caps_issues_across_batches(self):
+        """Test merging keeps issues from every batch within max_issues"""
+        def review(name, count, label):
+            return ReviewResponse(
+                issues=[Issue(title=f"{name}{i}", description="", file_path=f"{name}.py") for i in range(count)],
+                summary=f"{name} summary",
+                suggested_labels=[label],
+                total_files_analyzed=1,
+                analysis_time_seconds=0.0
+            )
+        
+        merged = merge_reviews([review("a", 5, IssueLabel.BUG), review("b", 5, IssueLabel.BUG)], max_issues=4)
+        
+        self.assertEqual([issue.title for issue in merged.issues], ["a0", "b0", "a1", "b1"])
+        self.assertEqual(merged.suggested_labels, [IssueLabel.BUG])
+        self.assertEqual(merged.summary, "a summary\n\nb summary")
+    
+    @patch('llm_service.LLMService._call_llm')
+    def test_analyze_code_calls_llm_per_batch(self, mock_call_llm):
+        """Test a review larger than the context window is split into several LLM calls"""
+        # Each batch reports its own issue, so deduplication keeps them all
+        mock_call_llm.side_effect = lambda prompt, *args: json.dumps({
+            "issues": [{"title": f"Issue {mock_call_llm.call_count}", "file_path": f"f{mock_call_llm.call_count}.py",
+                        "description": "d", "labels": ["bug"]}],
+            "test_suggestions": [],
+            "summary": "batch",
+            "suggested_labels": ["bug"]
+        })
+        llm_service = LLMService()
+        llm_service.review_cache = None
+        llm_service.context_tokens = llm_service.max_output_tokens + estimate_tokens(
+            llm_service._create_analysis_prompt({}, ReviewSettings())) + 400
+        changes = [CodeChange(file_path=f"f{i}.py", content="x = 1\n" * 200) for i in range(4)]
+        
+        result = llm_service.analyze_code(changes, ReviewSettings(max_issues=3))
+        
+        self.assertGreater(mock_call_llm.call_count, 1)
+        self.assertEqual(len(result.issues), 3)
+        self.assertEqual(result.total_files_analyzed, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import code_index
+from code_index import CodeIndex, index_python, symbol_context
+from llm_service import LLMService
+from models import ReviewSettings, ReviewMode, CodeChange
+
+MODULE = "\n".join([
+    "import os",                            # 1
+    "import json",                          # 2
+    "from typing import List",              # 3
+    "",                                     # 4
+    "def load(path):",                      # 5
+    "    with open(path) as f:",            # 6
+    "        return json.load(f)",          # 7
+    "",                                     # 8
+    "class Store:",                         # 9
+    "    def __init__(self, root):",        # 10
+    "        self.root = root",             # 11
+    "",                                     # 12
+    "    def items(self) -> List[str]:",    # 13
+    "        data = load(self.root)",       # 14
+    "        return sorted(data)",          # 15
+    "",                                     # 16
+    "def unrelated():",                     # 17
+    "    return os.getcwd()",               # 18
+])
+
+class TestCodeIndex(unittest.TestCase):
+
+    def test_index_python_symbols_imports_and_calls(self):
+        """Test functions, methods, classes, imports and call edges are indexed"""
+        index = index_python(MODULE)
+
+        self.assertEqual([(s.name, s.kind, s.start_line, s.end_line) for s in index.symbols], [
+            ("load", "function", 5, 7),
+            ("Store", "class", 9, 15),
+            ("Store.__init__", "function", 10, 11),
+            ("Store.items", "function", 13, 15),
+            ("unrelated", "function", 17, 18),
+        ])
+        self.assertEqual([imp.names for imp in index.imports], [("os",), ("json",), ("List",)])
+        self.assertIn(("Store.items", "load"), [(call.caller, call.callee) for call in index.calls])
+        self.assertIsNone(index_python("def broken(:\n"))
+
+    def test_symbol_context_includes_changed_symbol_dependencies_and_imports(self):
+        """Test a change inside a method sends that method, the function it calls and the imports used"""
+        diff = "@@ -15 +15 @@\n-        return data\n+        return sorted(data)"
+
+        context = symbol_context(index_python(MODULE), MODULE, diff)
+
+        self.assertEqual([s["name"] for s in context["symbols"]], ["Store.items"])
+        self.assertEqual((context["symbols"][0]["start_line"], context["symbols"][0]["end_line"]), (13, 15))
+        self.assertEqual([d["name"] for d in context["dependencies"]], ["load"])
+        self.assertEqual(context["imports"], "import json\nfrom typing import List")
+        self.assertNotIn("context", context)
+
+    def test_symbol_context_module_level_change(self):
+        """Test changed lines outside any symbol are sent with surrounding lines"""
+        diff = "@@ -2 +2 @@\n-import yaml\n+import json"
+
+        context = symbol_context(index_python(MODULE), MODULE, diff, context_lines=1)
+
+        self.assertEqual(context["symbols"], [])
+        self.assertEqual([(c["start_line"], c["end_line"]) for c in context["context"]], [(1, 3)])
+
+    def test_index_is_cached_per_blob_sha(self):
+        """Test a blob is parsed once and files without a supported extension are not indexed"""
+        parser = MagicMock(side_effect=index_python)
+        cache = CodeIndex(max_entries=10)
+
+        with patch.dict(code_index.INDEXERS, {".py": parser}):
+            first = cache.get("store.py", MODULE, sha="abc")
+            second = cache.get("renamed.py", MODULE, sha="abc")
+            cache.get("store.py", MODULE)
+
+        self.assertIs(first, second)
+        self.assertEqual(parser.call_count, 2)
+        self.assertIsNone(cache.get("notes.md", "# Notes", sha="def"))
+
+    def test_prepare_code_content_symbols_mode(self):
+        """Test symbols mode replaces whole Python files and falls back to hunk context for other languages"""
+        llm_service = LLMService()
+        diff = "@@ -15 +15 @@\n-        return data\n+        return sorted(data)"
+        code_changes = [
+            CodeChange(file_path="store.py", content=MODULE, diff=diff, sha="abc"),
+            CodeChange(file_path="app.js", content="const a = 1;\nconst b = 2;\n", diff="@@ -2 +2 @@\n-x\n+const b = 2;"),
+        ]
+
+        prepared = llm_service._prepare_code_content(code_changes, ReviewSettings(review_mode=ReviewMode.SYMBOLS))
+
+        self.assertNotIn("content", prepared["store.py"])
+        self.assertEqual([s["name"] for s in prepared["store.py"]["symbols"]], ["Store.items"])
+        self.assertNotIn("unrelated", str(prepared["store.py"]))
+        self.assertIn("context", prepared["app.js"])
+
+if __name__ == "__main__":
+    unittest.main()
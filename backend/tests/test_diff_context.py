@@ -0,0 +1,85 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_context import parse_hunks, extract_hunk_context
+from llm_service import LLMService
+from models import ReviewSettings, ReviewMode, CodeChange
+
+PYTHON_FILE = "\n".join([
+    "import os",                    # 1
+    "",                             # 2
+    "def first():",                 # 3
+    "    a = 1",                    # 4
+    "    b = 2",                    # 5
+    "    return a + b",             # 6
+    "",                             # 7
+    "",                             # 8
+    "def second():",                # 9
+    "    return os.getcwd()",       # 10
+])
+
+class TestDiffContext(unittest.TestCase):
+    
+    def test_parse_hunks(self):
+        """Test new-file line ranges are read from hunk headers"""
+        diff = "@@ -1,3 +1,4 @@\n import os\n+x\n@@ -10 +12 @@\n-a\n+b"
+        self.assertEqual(parse_hunks(diff), [(1, 4), (12, 12)])
+    
+    def test_python_hunk_widened_to_enclosing_function(self):
+        """Test a hunk inside a Python function includes the whole function"""
+        diff = "@@ -5 +5 @@\n-    b = 3\n+    b = 2"
+        
+        excerpts = extract_hunk_context("module.py", PYTHON_FILE, diff, context_lines=0)
+        
+        self.assertEqual(len(excerpts), 1)
+        self.assertEqual((excerpts[0]["start_line"], excerpts[0]["end_line"]), (3, 6))
+        self.assertNotIn("second", excerpts[0]["code"])
+    
+    def test_context_lines_and_merging(self):
+        """Test context lines are added and overlapping excerpts are merged"""
+        content = "\n".join(f"line {i}" for i in range(1, 21))
+        diff = "@@ -5 +5 @@\n-x\n+line 5\n@@ -8 +8 @@\n-y\n+line 8"
+        
+        excerpts = extract_hunk_context("notes.txt", content, diff, context_lines=2)
+        
+        self.assertEqual([(e["start_line"], e["end_line"]) for e in excerpts], [(3, 10)])
+    
+    def test_header_heuristic_for_other_languages(self):
+        """Test the enclosing function header is found in non-Python files"""
+        content = "\n".join([
+            "const a = 1;",
+            "function handler(req) {",
+            "  const b = 2;",
+            "  return b;",
+            "}",
+        ])
+        diff = "@@ -4 +4 @@\n-  return a;\n+  return b;"
+        
+        excerpts = extract_hunk_context("app.js", content, diff, context_lines=0)
+        
+        self.assertEqual(excerpts[0]["start_line"], 2)
+    
+    def test_prepare_code_content_in_diff_mode(self):
+        """Test diff mode sends hunks and context instead of full contents"""
+        changes = [
+            CodeChange(file_path="module.py", content=PYTHON_FILE, diff="@@ -5 +5 @@\n-    b = 3\n+    b = 2"),
+            CodeChange(file_path="new.py", content="x = 1", diff="@@ -0,0 +1 @@\n+x = 1", is_new=True),
+            CodeChange(file_path="repo.py", content="y = 2"),
+        ]
+        settings = ReviewSettings(review_mode=ReviewMode.DIFF, context_lines=0)
+        
+        prepared = LLMService()._prepare_code_content(changes, settings)
+        
+        self.assertNotIn("content", prepared["module.py"])
+        self.assertEqual(prepared["module.py"]["context"][0]["start_line"], 3)
+        self.assertNotIn("content", prepared["new.py"])
+        self.assertNotIn("context", prepared["new.py"])
+        self.assertEqual(prepared["repo.py"]["content"], "y = 2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+import time
+import asyncio
+import httpx
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from github_http import ObjectCache, RateLimitScheduler, RateLimitExceeded
+from github_service import GithubService
+
+class TestConditionalRequests(unittest.TestCase):
+    
+    def test_not_modified_replays_cached_body(self):
+        """Test a repeated GET is sent with If-None-Match and a 304 reuses the cached body"""
+        seen = []
+        
+        def handler(request):
+            seen.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304, headers={"ETag": '"v1"'})
+            return httpx.Response(200, headers={"ETag": '"v1"'}, json={"default_branch": "main"})
+        
+        github_service = GithubService("dummy_token", transport=httpx.MockTransport(handler))
+        
+        async def fetch_twice():
+            async with github_service.api_client() as client:
+                first = await github_service._get_json(client, "/repos/username/repo")
+                second = await github_service._get_json(client, "/repos/username/repo")
+            return first, second
+        
+        first, second = asyncio.run(fetch_twice())
+        
+        self.assertEqual(first, second)
+        self.assertEqual(seen, [None, '"v1"'])
+        self.assertEqual(github_service.etag_cache.not_modified, 1)
+    
+    def test_secondary_rate_limit_is_retried(self):
+        """Test a secondary rate limit response is waited out and retried"""
+        responses = [
+            httpx.Response(403, headers={"Retry-After": "0"}, json={"message": "You have exceeded a secondary rate limit"}),
+            httpx.Response(200, json={"default_branch": "main"}),
+        ]
+        github_service = GithubService("dummy_token", transport=httpx.MockTransport(lambda request: responses.pop(0)))
+        
+        async def fetch():
+            async with github_service.api_client() as client:
+                return await github_service._get_json(client, "/repos/username/repo")
+        
+        self.assertEqual(asyncio.run(fetch()), {"default_branch": "main"})
+        self.assertFalse(responses)
+
+class TestRateLimitScheduler(unittest.TestCase):
+    
+    def _response(self, remaining, reset, status=200):
+        return httpx.Response(status, headers={
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(reset),
+        })
+    
+    def test_no_delay_with_plenty_of_quota(self):
+        """Test requests are not paced while the quota is healthy"""
+        scheduler = RateLimitScheduler(reserve=10)
+        scheduler.update(self._response(4000, time.time() + 3600))
+        self.assertEqual(scheduler._delay(), 0.0)
+    
+    def test_paces_evenly_when_quota_is_low(self):
+        """Test concurrent requests get successive slots across the window"""
+        scheduler = RateLimitScheduler(reserve=10)
+        scheduler.update(self._response(5, time.time() + 10))
+        
+        delays = [scheduler._delay() for _ in range(3)]
+        
+        self.assertAlmostEqual(delays[0], 0.0, places=1)
+        self.assertAlmostEqual(delays[1], 2.0, places=1)
+        self.assertAlmostEqual(delays[2], 4.0, places=1)
+    
+    def test_gives_up_when_reset_is_too_far(self):
+        """Test an exhausted quota with a distant reset raises instead of hanging"""
+        scheduler = RateLimitScheduler(max_wait=5)
+        scheduler.update(self._response(0, time.time() + 600))
+        
+        with self.assertRaises(RateLimitExceeded):
+            asyncio.run(scheduler.acquire())
+    
+    def test_backoff_ignores_plain_forbidden(self):
+        """Test a 403 that is not a rate limit is not retried"""
+        scheduler = RateLimitScheduler()
+        response = httpx.Response(403, json={"message": "Resource not accessible by integration"})
+        self.assertIsNone(scheduler.backoff(response))
+
+class TestObjectCache(unittest.TestCase):
+    
+    def test_entries_expire_and_can_be_forgotten(self):
+        """Test cached objects expire after the TTL, are evicted oldest first and can be dropped"""
+        cache = ObjectCache(ttl=60, max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        cache.forget("c")
+        self.assertIsNone(cache.get("c"))
+        
+        cache.ttl = 0
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,12 +2,18 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import io
+import base64
+import asyncio
+import tarfile
+import httpx
 
 # Add the parent directory to sys.path to import the modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from github_service import GithubService
-from models import CodeChange
+from path_filter import PathFilter
+from models import CodeChange, Issue, IssueLabel
 
 class TestGithubService(unittest.TestCase):
     
@@ -40,28 +46,40 @@ class TestGithubService(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.github_service.parse_github_url(url)
     
-    @patch('github_service.Github')
-    def test_get_pr_changes(self, mock_github):
+    def _mock_transport(self, routes, delays=None, requests=None):
+        """Build an httpx transport that serves canned GitHub API responses"""
+        delays = delays or {}
+        
+        async def handler(request):
+            path = request.url.path
+            if requests is not None:
+                requests.append(path)
+            if path in delays:
+                await asyncio.sleep(delays[path])
+            if path not in routes:
+                return httpx.Response(404, json={"message": "Not Found"})
+            if isinstance(routes[path], bytes):
+                return httpx.Response(200, content=routes[path])
+            return httpx.Response(200, json=routes[path])
+        
+        return httpx.MockTransport(handler)
+    
+    def _content(self, text):
+        return {"size": len(text), "encoding": "base64",
+                "content": base64.b64encode(text.encode()).decode()}
+    
+    def test_get_pr_changes(self):
         """Test fetching PR changes"""
-        # Set up mocks
-        mock_repo = MagicMock()
-        mock_pr = MagicMock()
-        mock_file = MagicMock()
-        
-        # Configure mock behavior
-        mock_github.return_value.get_repo.return_value = mock_repo
-        mock_repo.get_pull.return_value = mock_pr
-        mock_pr.get_files.return_value = [mock_file]
-        mock_file.filename = "test.py"
-        mock_file.patch = "test diff"
-        mock_file.status = "modified"
-        
-        # Mock _get_file_content and _is_reviewable_file
-        self.github_service._get_file_content = MagicMock(return_value="file content")
-        self.github_service._is_reviewable_file = MagicMock(return_value=True)
+        transport = self._mock_transport({
+            "/repos/username/repo/pulls/123/files": [
+                {"filename": "test.py", "patch": "test diff", "status": "modified", "sha": "blob1"}
+            ],
+            "/repos/username/repo/git/blobs/blob1": self._content("file content"),
+        })
+        github_service = GithubService("dummy_token", transport=transport)
         
         # Call the method
-        changes = self.github_service.get_pr_changes("username", "repo", 123)
+        changes = github_service.get_pr_changes("username", "repo", 123)
         
         # Assertions
         self.assertEqual(len(changes), 1)
@@ -70,6 +88,289 @@ class TestGithubService(unittest.TestCase):
         self.assertEqual(changes[0].diff, "test diff")
         self.assertFalse(changes[0].is_new)
     
+    def _tree_routes(self, files):
+        """Routes for a repository whose default branch contains the given files"""
+        routes = {
+            "/repos/username/repo": {"default_branch": "main"},
+            "/repos/username/repo/commits/main": b"commit123",
+            "/repos/username/repo/git/trees/commit123": {
+                "sha": "tree123",
+                "truncated": False,
+                "tree": [{"path": "src", "type": "tree", "sha": "dir1"}] + [
+                    {"path": path, "type": "blob", "sha": f"sha-{i}", "size": len(text)}
+                    for i, (path, text) in enumerate(files.items())
+                ],
+            },
+        }
+        for i, (path, text) in enumerate(files.items()):
+            routes[f"/repos/username/repo/git/blobs/sha-{i}"] = self._content(text)
+            routes[f"/repos/username/repo/contents/{path}"] = dict(self._content(text), type="file", path=path,
+                                                                   sha=f"sha-{i}")
+        return routes
+    
+    def test_get_repo_files_preserves_order(self):
+        """Test concurrent fetching keeps the requested file order"""
+        paths = ["a.py", "b.py", "c.py", "d.py"]
+        routes = self._tree_routes({path: f"# {path}" for path in paths})
+        # Earlier files respond more slowly so completion order is reversed
+        delays = {f"/repos/username/repo/contents/{path}": 0.04 - i * 0.01 for i, path in enumerate(paths)}
+        github_service = GithubService("dummy_token", max_concurrency=4,
+                                       transport=self._mock_transport(routes, delays))
+        
+        changes = github_service.get_repo_files("username", "repo", paths + ["logo.png"])
+        
+        self.assertEqual([change.file_path for change in changes], paths)
+        self.assertEqual([change.content for change in changes], [f"# {path}" for path in paths])
+        self.assertEqual([change.sha for change in changes], ["sha-0", "sha-1", "sha-2", "sha-3"])
+    
+    def test_explicit_paths_are_looked_up_without_listing_the_tree(self):
+        """Test a review of a few paths fetches them directly, once, and reports a missing one"""
+        routes = self._tree_routes({"a.py": "a = 1", "b.py": "b = 2"})
+        requests = []
+        github_service = GithubService("dummy_token", transport=self._mock_transport(routes, requests=requests))
+        
+        changes = github_service.get_repo_files("username", "repo", ["b.py", "gone.py"])
+        
+        self.assertEqual([(change.file_path, change.content, change.skip_reason) for change in changes],
+                         [("b.py", "b = 2", None), ("gone.py", "", "not_found")])
+        self.assertEqual(changes[0].sha, "sha-1")
+        self.assertNotIn("/repos/username/repo/git/trees/commit123", requests)
+        self.assertNotIn("/repos/username/repo/git/blobs/sha-1", requests)
+    
+    def _truncating_transport(self, trees, requests):
+        """Serve trees by SHA, answering recursive listings of the SHAs in `trees["truncated"]` as truncated"""
+        async def handler(request):
+            path = request.url.path
+            requests.append((path, request.url.params.get("recursive")))
+            if path == "/repos/username/repo":
+                return httpx.Response(200, json={"default_branch": "main"})
+            if path == "/repos/username/repo/commits/main":
+                return httpx.Response(200, content=b"root")
+            sha = path.rsplit("/", 1)[-1]
+            recursive = request.url.params.get("recursive") == "1"
+            if recursive and sha in trees["truncated"]:
+                return httpx.Response(200, json={"sha": sha, "truncated": True, "tree": trees[sha][:1]})
+            tree = trees["recursive"][sha] if recursive else trees[sha]
+            return httpx.Response(200, json={"sha": sha, "truncated": sha in trees.get("too_large", ()), "tree": tree})
+        return httpx.MockTransport(handler)
+    
+    def test_truncated_tree_is_listed_by_directory(self):
+        """Test a repository too large for one recursive listing is listed directory by directory"""
+        blob = lambda path, sha: {"path": path, "type": "blob", "sha": sha, "size": 1}
+        trees = {
+            "truncated": {"root"},
+            "root": [blob("README.md", "r"), {"path": "src", "type": "tree", "sha": "src"}],
+            "recursive": {"src": [blob("app.py", "a"), {"path": "lib", "type": "tree", "sha": "lib"},
+                                  blob("lib/util.py", "u")]},
+        }
+        requests = []
+        github_service = GithubService("dummy_token", transport=self._truncating_transport(trees, requests))
+        
+        async def listing():
+            async with github_service.api_client() as client:
+                return await github_service.list_files(client, "username", "repo")
+        
+        result = asyncio.run(listing())
+        
+        self.assertEqual([entry["path"] for entry in result["entries"]], ["README.md", "src/app.py", "src/lib/util.py"])
+        self.assertEqual(result["sha"], "root")
+        self.assertIn(("/repos/username/repo/git/trees/root", None), requests)
+        
+        # A single directory too large to list fails instead of dropping files
+        trees["too_large"] = {"root"}
+        with self.assertRaisesRegex(ValueError, "too many entries"):
+            asyncio.run(listing())
+    
+    def test_repeat_reviews_reuse_cached_blobs(self):
+        """Test unchanged blobs are not downloaded again by a later review"""
+        files = {"src/a.py": "a = 1", "src/b.py": "b = 2"}
+        requests = []
+        github_service = GithubService("dummy_token",
+                                       transport=self._mock_transport(self._tree_routes(files), requests=requests))
+        
+        github_service.get_repo_files("username", "repo")
+        requests.clear()
+        changes = github_service.get_repo_files("username", "repo")
+        
+        self.assertEqual([change.content for change in changes], ["a = 1", "b = 2"])
+        self.assertFalse([path for path in requests if "/git/blobs/" in path])
+        self.assertEqual(github_service.blob_cache.stats()["memory_hits"], 2)
+    
+    def test_get_repo_files_uses_tree_listing(self):
+        """Test whole-repo reviews list files with one tree call and honour the file cap"""
+        files = {"src/a.py": "a = 1", "src/b.py": "b = 2", "logo.png": "", "src/c.py": "c = 3"}
+        requests = []
+        github_service = GithubService("dummy_token", max_repo_files=2,
+                                       transport=self._mock_transport(self._tree_routes(files), requests=requests))
+        
+        changes = github_service.get_repo_files("username", "repo")
+        
+        self.assertEqual([change.file_path for change in changes], ["src/a.py", "src/b.py"])
+        self.assertEqual([change.content for change in changes], ["a = 1", "b = 2"])
+        self.assertEqual(len(requests), 5)
+    
+    def test_get_repo_files_from_tarball(self):
+        """Test large file sets are unpacked from one tarball download"""
+        files = {"src/a.py": "a = 1", "src/b.py": "b = 2", "README.md": "# Repo"}
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            for path, text in files.items():
+                data = text.encode()
+                info = tarfile.TarInfo(f"username-repo-commit123/{path}")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        routes = self._tree_routes(files)
+        routes["/repos/username/repo/tarball/commit123"] = archive.getvalue()
+        requests = []
+        github_service = GithubService("dummy_token", tarball_threshold=2,
+                                       transport=self._mock_transport(routes, requests=requests))
+        
+        changes = github_service.get_repo_files("username", "repo")
+        
+        self.assertEqual([change.content for change in changes], list(files.values()))
+        self.assertNotIn("/repos/username/repo/git/blobs/sha-0", requests)
+    
+    def test_repo_rules_skip_before_fetching(self):
+        """Test .gitattributes markers, lockfiles and oversized files are skipped without downloading them"""
+        files = {
+            ".gitattributes": "src/gen/** linguist-generated\n",
+            "src/app.py": "app = 1",
+            "src/gen/client.py": "client = 1",
+            "package-lock.json": "{}",
+            "mybuild/tool.py": "tool = 1",
+        }
+        routes = self._tree_routes(files)
+        routes["/repos/username/repo/git/trees/commit123"]["tree"].append(
+            {"path": "data/huge.py", "type": "blob", "sha": "sha-huge", "size": 10 ** 7}
+        )
+        requests = []
+        github_service = GithubService("dummy_token",
+                                       transport=self._mock_transport(routes, requests=requests))
+        
+        changes = github_service.get_repo_files("username", "repo")
+        
+        self.assertEqual([change.file_path for change in changes],
+                         [".gitattributes", "src/app.py", "mybuild/tool.py", "data/huge.py"])
+        self.assertEqual(changes[-1].skip_reason, "too_large")
+        self.assertEqual(changes[-1].size, 10 ** 7)
+        # Known from the listing, so the review can still be cached
+        self.assertEqual(changes[-1].sha, "sha-huge")
+        self.assertNotIn("/repos/username/repo/git/blobs/sha-2", requests)
+        self.assertNotIn("/repos/username/repo/git/blobs/sha-huge", requests)
+    
+    def test_pr_rules_come_from_default_branch_gitattributes(self):
+        """Test pull request files marked generated in .gitattributes are not fetched"""
+        requests = []
+        transport = self._mock_transport({
+            "/repos/username/repo/pulls/123/files": [
+                {"filename": "api.py", "patch": "diff", "status": "modified", "sha": "blob1"},
+                {"filename": "api_pb2.py", "patch": "diff", "status": "modified", "sha": "blob2"},
+            ],
+            "/repos/username/repo/contents/.gitattributes": self._content("*_pb2.py linguist-generated\n"),
+            "/repos/username/repo/git/blobs/blob1": self._content("api = 1"),
+        }, requests=requests)
+        github_service = GithubService("dummy_token", transport=transport)
+        
+        changes = github_service.get_pr_changes("username", "repo", 123)
+        github_service.get_pr_changes("username", "repo", 123)
+        
+        self.assertEqual([change.file_path for change in changes], ["api.py"])
+        self.assertNotIn("/repos/username/repo/git/blobs/blob2", requests)
+        self.assertEqual(requests.count("/repos/username/repo/contents/.gitattributes"), 1)
+    
+    def test_oversized_pr_files_are_skipped_before_fetching(self):
+        """Test PR files whose patch already exceeds the size limit are reported as skipped, not downloaded"""
+        requests = []
+        huge = "+" + "x" * 99 + "\n"
+        transport = self._mock_transport({
+            "/repos/username/repo/pulls/123/files": [
+                {"filename": "data.py", "patch": "@@ -0,0 +1,20 @@\n" + huge * 20, "status": "added",
+                 "sha": "blob1", "changes": 20},
+                {"filename": "app.py", "patch": "@@ -1 +1 @@\n-a = 1\n+a = 2", "status": "modified",
+                 "sha": "blob2", "changes": 2},
+            ],
+            "/repos/username/repo/git/blobs/blob2": self._content("a = 2"),
+        }, requests=requests)
+        github_service = GithubService("dummy_token", transport=transport,
+                                       path_filter=PathFilter(max_file_size=1000))
+        
+        changes = github_service.get_pr_changes("username", "repo", 123)
+        
+        self.assertEqual([(change.file_path, change.skip_reason) for change in changes],
+                         [("app.py", None), ("data.py", "too_large")])
+        self.assertEqual(changes[1].size, 2000)
+        self.assertEqual(changes[1].sha, "blob1")
+        self.assertNotIn("/repos/username/repo/git/blobs/blob1", requests)
+    
+    def test_binary_files_are_reported_not_embedded(self):
+        """Test binary PR files are recognised from the listing or by sniffing, and never reach the content"""
+        requests = []
+        png = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+        transport = self._mock_transport({
+            "/repos/username/repo/pulls/123/files": [
+                {"filename": "logo.dat", "status": "added", "sha": "blob1", "changes": 0},
+                {"filename": "model.bin2", "status": "modified", "sha": "blob2", "patch": "@@ -1 +1 @@", "changes": 2},
+                {"filename": "notes.txt", "status": "modified", "sha": "blob3", "patch": "@@ -1 +1 @@", "changes": 2},
+            ],
+            "/repos/username/repo/git/blobs/blob2": {"size": len(png), "encoding": "base64",
+                                                     "content": base64.b64encode(png).decode()},
+            "/repos/username/repo/git/blobs/blob3": {"size": 6, "encoding": "base64",
+                                                     "content": base64.b64encode("caf\xe9\n".encode("latin-1")).decode()},
+        }, requests=requests)
+        github_service = GithubService("dummy_token", transport=transport)
+        
+        changes = github_service.get_pr_changes("username", "repo", 123)
+        
+        self.assertEqual([(change.file_path, change.skip_reason) for change in changes],
+                         [("logo.dat", "binary"), ("model.bin2", "binary"), ("notes.txt", None)])
+        self.assertEqual([change.content for change in changes[:2]], ["", ""])
+        self.assertTrue(changes[2].content.startswith("caf"))
+        self.assertNotIn("/repos/username/repo/git/blobs/blob1", requests)
+    
+    def test_head_sha_reuses_cached_repo_and_pull_request(self):
+        """Test repository metadata and PR heads are fetched once until the PR is forgotten"""
+        requests = []
+        transport = self._mock_transport({
+            "/repos/username/repo": {"default_branch": "main"},
+            "/repos/username/repo/pulls/123": {"head": {"sha": "head-sha"}},
+            "/repos/username/repo/commits/main": b"main-sha",
+        }, requests=requests)
+        github_service = GithubService("dummy_token", transport=transport)
+        
+        for _ in range(2):
+            self.assertEqual(asyncio.run(github_service.get_head_sha_async("username", "repo", 123)), "head-sha")
+            self.assertEqual(asyncio.run(github_service.get_head_sha_async("username", "repo")), "main-sha")
+        github_service.forget_pull_request("username", "repo", 123)
+        asyncio.run(github_service.get_head_sha_async("username", "repo", 123))
+        
+        self.assertEqual(requests.count("/repos/username/repo"), 1)
+        self.assertEqual(requests.count("/repos/username/repo/pulls/123"), 2)
+        self.assertEqual(requests.count("/repos/username/repo/commits/main"), 2)
+    
+    def test_apply_labels_batches_requests(self):
+        """Test labels are checked against one label listing and added to the PR in a single call"""
+        repo = MagicMock()
+        existing = MagicMock()
+        existing.name = "Security"
+        repo.get_labels.return_value = [existing]
+        self.github_service.github = MagicMock()
+        self.github_service.github.get_repo.return_value = repo
+        issues = [
+            Issue(title="a", file_path="a.py", description="", suggestion="", labels=[IssueLabel.SECURITY, IssueLabel.BUG]),
+            Issue(title="b", file_path="b.py", description="", suggestion="", labels=[IssueLabel.BUG]),
+        ]
+        
+        with patch.object(self.github_service, "_create_label") as create_label:
+            self.github_service.apply_labels("username", "repo", 123, issues)
+            self.github_service.apply_labels("username", "repo", 123, issues)
+        
+        create_label.assert_called_once_with(repo, IssueLabel.BUG)
+        repo.get_labels.assert_called_once()
+        repo.get_pull.assert_called_once_with(123)
+        repo.get_label.assert_not_called()
+        repo.get_pull.return_value.add_to_labels.assert_called_with("bug", "security")
+        self.assertEqual(repo.get_pull.return_value.add_to_labels.call_count, 2)
+    
     def test_is_reviewable_file(self):
         """Test file filtering for review"""
         # Files that should be included
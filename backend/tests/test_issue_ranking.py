@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+import time
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from issue_ranking import IssueClusters, rank_issues, title_words
+from models import Issue, IssueLabel
+from review_parser import build_issue, parse_severity
+
+def make_issue(title, file_path="app.py", lines=(), labels=(IssueLabel.BUG,), severity=None):
+    return Issue(title=title, file_path=file_path, line_numbers=list(lines), description="d",
+                 labels=list(labels), severity=severity)
+
+class TestIssueRanking(unittest.TestCase):
+
+    def test_near_duplicates_on_nearby_lines_are_merged(self):
+        """Test rewordings of one finding a line apart become one issue with the lines and labels of both"""
+        issues = rank_issues([
+            make_issue("SQL injection in query builder", lines=[12]),
+            make_issue("Possible SQL injection in the query", lines=[13], labels=[IssueLabel.SECURITY]),
+        ])
+
+        self.assertEqual(len(issues), 1)
+        self.assertEqual(issues[0].line_numbers, [12, 13])
+        self.assertEqual(set(issues[0].labels), {IssueLabel.BUG, IssueLabel.SECURITY})
+
+    def test_same_title_at_different_places_is_kept(self):
+        """Test one kind of problem reported at two places, or in two files, stays two issues"""
+        issues = rank_issues([
+            make_issue("Missing null check", lines=[10]),
+            make_issue("Missing null check", lines=[80]),
+            make_issue("Missing null check", file_path="other.py", lines=[10]),
+        ])
+
+        self.assertEqual(len(issues), 3)
+
+    def test_issues_without_lines_match_on_title(self):
+        """Test issues without line numbers are merged only when their titles are nearly the same"""
+        issues = rank_issues([
+            make_issue("Missing docstrings for public functions"),
+            make_issue("Missing docstring for public function"),
+            make_issue("Unused import"),
+        ])
+
+        self.assertEqual([issue.title for issue in issues],
+                         ["Missing docstrings for public functions", "Unused import"])
+
+    def test_ranked_by_severity_then_label_then_repeats(self):
+        """Test severity outranks label weight, which outranks how often a finding was reported"""
+        issues = rank_issues([
+            make_issue("Style nit", lines=[1], labels=[IssueLabel.STYLE], severity="low"),
+            make_issue("Reported twice", lines=[20], labels=[IssueLabel.STYLE]),
+            make_issue("Reported twice", lines=[20], labels=[IssueLabel.STYLE]),
+            make_issue("Security hole", lines=[40], labels=[IssueLabel.SECURITY]),
+            make_issue("Crash on empty input", lines=[60], severity="critical"),
+            make_issue("Style once", lines=[80], labels=[IssueLabel.STYLE]),
+        ])
+
+        self.assertEqual([issue.title for issue in issues],
+                         ["Crash on empty input", "Security hole", "Reported twice", "Style once", "Style nit"])
+
+    def test_max_issues_is_a_hard_cap(self):
+        """Test no more than max_issues issues are returned, best first"""
+        issues = [make_issue(f"Problem {number}", lines=[number * 10]) for number in range(20)]
+        issues.append(make_issue("Worst problem", lines=[500], severity="critical"))
+
+        ranked = rank_issues(issues, 5)
+
+        self.assertEqual(len(ranked), 5)
+        self.assertEqual(ranked[0].title, "Worst problem")
+        self.assertEqual(rank_issues(issues, 0), [])
+
+    def test_add_reports_new_findings(self):
+        """Test streamed issues can be filtered by whether add found them new"""
+        clusters = IssueClusters()
+
+        self.assertTrue(clusters.add(make_issue("Unclosed file handle", lines=[5])))
+        self.assertFalse(clusters.add(make_issue("File handle not closed", lines=[6])))
+        self.assertTrue(clusters.add(make_issue("Unclosed file handle", lines=[50])))
+
+    def test_title_words_ignore_case_stopwords_and_plurals(self):
+        self.assertEqual(title_words("The Loops in handlers"), title_words("loop handler"))
+
+    def test_thousand_candidates_rank_quickly(self):
+        """Test a thousand candidates are ranked well within a streamed batch's time"""
+        issues = [make_issue(f"Problem kind {number % 7}", file_path=f"f{number % 50}.py", lines=[number])
+                  for number in range(1000)]
+        rank_issues(issues, 10)
+
+        start = time.perf_counter()
+        rank_issues(issues, 10)
+        # Generous bound so slow CI machines pass; benchmarks/run.py measures the real figure
+        self.assertLess(time.perf_counter() - start, 0.25)
+
+    def test_severity_is_read_leniently(self):
+        self.assertEqual(parse_severity("HIGH"), "high")
+        self.assertEqual(parse_severity("minor"), "low")
+        self.assertIsNone(parse_severity("urgent-ish"))
+        self.assertIsNone(parse_severity(3))
+        self.assertEqual(build_issue({"title": "t", "severity": "Critical"}).severity, "critical")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+import unittest
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+from unittest.mock import patch
+
+import httpx
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import JobQueue, MemoryJobStore, SQLiteJobStore, check_callback_url
+from models import JobStatus, ReviewJob, ReviewJobRequest, ReviewResponse, ReviewSettings, ReviewTone
+
+def _request(url="https://github.com/owner/repo/pull/1", **kwargs):
+    return ReviewJobRequest(url=url, **kwargs)
+
+async def _wait_for(queue, job_id):
+    for _ in range(200):
+        job = queue.get(job_id)
+        if job.status in (JobStatus.COMPLETED, JobStatus.FAILED):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+class TestJobQueue(unittest.TestCase):
+
+    def test_runs_jobs_by_priority(self):
+        """Test higher priority jobs start first and equal priorities run in submission order"""
+        order = []
+
+        async def runner(job):
+            order.append(str(job.request.url))
+            return ReviewResponse(total_files_analyzed=1, analysis_time_seconds=0.0)
+
+        async def run():
+            queue = JobQueue(runner, concurrency=1)
+            jobs = [
+                queue.submit(_request("https://github.com/owner/repo/pull/1")),
+                queue.submit(_request("https://github.com/owner/repo/pull/2", priority=5)),
+                queue.submit(_request("https://github.com/owner/repo/pull/3")),
+            ]
+            for job in jobs:
+                await _wait_for(queue, job.id)
+            await queue.stop()
+            return [queue.get(job.id) for job in jobs]
+
+        jobs = asyncio.run(run())
+
+        self.assertEqual(order, [
+            "https://github.com/owner/repo/pull/2",
+            "https://github.com/owner/repo/pull/1",
+            "https://github.com/owner/repo/pull/3",
+        ])
+        self.assertTrue(all(job.status == JobStatus.COMPLETED for job in jobs))
+        self.assertEqual(jobs[0].result.total_files_analyzed, 1)
+
+    def test_deduplicates_same_commit_and_settings(self):
+        """Test a second submission for the same PR and commit returns the first job"""
+        calls = []
+
+        async def runner(job):
+            calls.append(job.id)
+            return ReviewResponse(total_files_analyzed=1, analysis_time_seconds=0.0)
+
+        async def run():
+            queue = JobQueue(runner)
+            first = queue.submit(_request(), head_sha="abc")
+            second = queue.submit(_request(), head_sha="abc")
+            other_commit = queue.submit(_request(), head_sha="def")
+            other_settings = queue.submit(_request(settings=ReviewSettings(tone=ReviewTone.STRICT)), head_sha="abc")
+            await _wait_for(queue, first.id)
+            await _wait_for(queue, other_commit.id)
+            await _wait_for(queue, other_settings.id)
+            after_completion = queue.submit(_request(), head_sha="abc")
+            await queue.stop()
+            return first, second, other_commit, other_settings, after_completion
+
+        first, second, other_commit, other_settings, after_completion = asyncio.run(run())
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(first.id, after_completion.id)
+        self.assertNotEqual(first.id, other_commit.id)
+        self.assertNotEqual(first.id, other_settings.id)
+        self.assertEqual(len(calls), 3)
+
+    def test_failed_job_records_error_and_notifies_callback(self):
+        """Test a failing review marks the job failed and POSTs it to the callback URL"""
+        callbacks = []
+
+        def handler(request):
+            callbacks.append(json.loads(request.content))
+            return httpx.Response(200)
+
+        async def runner(job):
+            raise RuntimeError("GitHub is down")
+
+        async def resolve(host, port):
+            return ["93.184.216.34"]
+
+        async def run():
+            queue = JobQueue(runner, transport=httpx.MockTransport(handler))
+            job = queue.submit(_request(callback_url="https://example.com/hook"), head_sha="abc")
+            job = await _wait_for(queue, job.id)
+            await queue.stop()
+            return job
+
+        with patch("job_queue.resolve_host", resolve):
+            job = asyncio.run(run())
+
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.error, "GitHub is down")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(callbacks[0]["id"], job.id)
+        self.assertEqual(callbacks[0]["status"], "failed")
+
+    def test_callback_url_must_be_https_and_public(self):
+        """Test callbacks to plain http, local or private hosts are refused when the job is submitted"""
+        for url in ("http://example.com/hook", "https://localhost/hook", "https://127.0.0.1/hook",
+                    "https://10.0.0.5/hook", "https://169.254.169.254/latest/meta-data", "https://[::1]/hook"):
+            with self.subTest(url=url):
+                with self.assertRaises(ValueError):
+                    check_callback_url(url)
+        self.assertEqual(check_callback_url("https://hooks.example.com/review"), "hooks.example.com")
+
+        async def runner(job):
+            raise AssertionError("refused jobs are not queued")
+
+        async def run():
+            queue = JobQueue(runner)
+            with self.assertRaises(ValueError):
+                queue.submit(_request(callback_url="https://192.168.1.10/hook"), head_sha="abc")
+            await queue.stop()
+
+        asyncio.run(run())
+
+    def test_callback_is_not_sent_to_a_host_resolving_to_a_private_address(self):
+        """Test a public-looking callback host that resolves into the local network is not POSTed to"""
+        callbacks = []
+
+        def handler(request):
+            callbacks.append(request)
+            return httpx.Response(200)
+
+        async def runner(job):
+            return ReviewResponse(total_files_analyzed=1, analysis_time_seconds=0.0)
+
+        async def resolve(host, port):
+            return ["93.184.216.34", "10.0.0.7"]
+
+        async def run():
+            queue = JobQueue(runner, transport=httpx.MockTransport(handler))
+            job = queue.submit(_request(callback_url="https://rebound.example.com/hook"), head_sha="abc")
+            job = await _wait_for(queue, job.id)
+            await queue.stop()
+            return job
+
+        with patch("job_queue.resolve_host", resolve):
+            job = asyncio.run(run())
+
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual(callbacks, [])
+
+    def test_jobs_queued_by_another_process_are_picked_up(self):
+        """Test a running queue claims jobs another process added to the shared store"""
+        async def runner(job):
+            return ReviewResponse(total_files_analyzed=4, analysis_time_seconds=0.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite3")
+
+            async def run():
+                queue = JobQueue(runner, store=SQLiteJobStore(path), poll_seconds=0.05)
+                queue.start()
+                await asyncio.sleep(0.01)
+                # Submitted through another process's store after this queue started
+                SQLiteJobStore(path).save(ReviewJob(id="elsewhere", request=_request(), created_at=time.time()))
+                job = await _wait_for(queue, "elsewhere")
+                await queue.stop()
+                return job
+
+            job = asyncio.run(run())
+
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual(job.result.total_files_analyzed, 4)
+
+    def test_sqlite_store_requeues_unfinished_jobs(self):
+        """Test jobs queued before a restart are run when the queue starts again"""
+        async def never_runs(job):
+            raise AssertionError("worker should not run before the restart")
+
+        async def runner(job):
+            return ReviewResponse(total_files_analyzed=2, analysis_time_seconds=0.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite3")
+
+            async def before_restart():
+                queue = JobQueue(never_runs, store=SQLiteJobStore(path))
+                job = queue.submit(_request(), head_sha="abc")
+                # Stop before the workers get a chance to pick the job up
+                await queue.stop()
+                return job
+
+            async def after_restart(job_id):
+                queue = JobQueue(runner, store=SQLiteJobStore(path))
+                queue.start()
+                job = await _wait_for(queue, job_id)
+                await queue.stop()
+                return job
+
+            queued = asyncio.run(before_restart())
+            finished = asyncio.run(after_restart(queued.id))
+
+        self.assertEqual(finished.status, JobStatus.COMPLETED)
+        self.assertEqual(finished.result.total_files_analyzed, 2)
+
+    def test_stop_lets_running_jobs_finish(self):
+        """Test a draining queue finishes the running job and leaves queued ones for the next start"""
+        started = []
+
+        async def runner(job):
+            started.append(job.id)
+            await asyncio.sleep(0.05)
+            return ReviewResponse(total_files_analyzed=1, analysis_time_seconds=0.0)
+
+        async def run():
+            queue = JobQueue(runner, concurrency=1)
+            running = queue.submit(_request("https://github.com/owner/repo/pull/1"))
+            waiting = queue.submit(_request("https://github.com/owner/repo/pull/2"))
+            await asyncio.sleep(0.01)
+            await queue.stop(timeout=5)
+            return queue.get(running.id), queue.get(waiting.id)
+
+        running, waiting = asyncio.run(run())
+
+        self.assertEqual(running.status, JobStatus.COMPLETED)
+        self.assertEqual(waiting.status, JobStatus.QUEUED)
+        self.assertEqual(started, [running.id])
+
+    def test_sqlite_job_is_claimed_once(self):
+        """Test two workers sharing a store cannot both start the same job"""
+        with tempfile.TemporaryDirectory() as tmp:
+            first = SQLiteJobStore(os.path.join(tmp, "jobs.sqlite3"))
+            second = SQLiteJobStore(os.path.join(tmp, "jobs.sqlite3"))
+            first.save(ReviewJob(id="job", request=_request(), created_at=1))
+
+            claimed = first.claim("job", "worker-1", 2.0)
+
+            self.assertEqual(claimed.status, JobStatus.RUNNING)
+            self.assertIsNone(second.claim("job", "worker-2", 3.0))
+            self.assertEqual(second.get("job").started_at, 2.0)
+            self.assertEqual(second.get("job").worker_id, "worker-1")
+
+    def test_queues_sharing_a_store_do_not_rerun_claimed_jobs(self):
+        """Test a queue starting while another one runs a job, and outlasting several leases, leaves it alone"""
+        runs = []
+
+        async def runner(job):
+            runs.append(job.id)
+            # Longer than the lease, so the claim must be renewed to be kept
+            await asyncio.sleep(0.35)
+            return ReviewResponse(total_files_analyzed=1, analysis_time_seconds=0.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "jobs.sqlite3")
+
+            async def run():
+                first = JobQueue(runner, store=SQLiteJobStore(path), lease_seconds=0.1)
+                second = JobQueue(runner, store=SQLiteJobStore(path), lease_seconds=0.1)
+                job = first.submit(_request(), head_sha="abc")
+                await asyncio.sleep(0.05)
+                second.start()
+                finished = await _wait_for(second, job.id)
+                await asyncio.gather(first.stop(), second.stop())
+                return finished
+
+            finished = asyncio.run(run())
+
+        self.assertEqual(finished.status, JobStatus.COMPLETED)
+        self.assertEqual(len(runs), 1)
+
+    def test_expired_claim_is_taken_back(self):
+        """Test a job left running by a worker that stopped renewing its claim is run again"""
+        async def runner(job):
+            return ReviewResponse(total_files_analyzed=3, analysis_time_seconds=0.0)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SQLiteJobStore(os.path.join(tmp, "jobs.sqlite3"))
+            store.save(ReviewJob(id="orphan", request=_request(), created_at=1))
+            store.claim("orphan", "dead-worker", time.time())
+
+            async def run():
+                queue = JobQueue(runner, store=store, lease_seconds=0.1)
+                queue.start()
+                job = await _wait_for(queue, "orphan")
+                await queue.stop()
+                return job
+
+            job = asyncio.run(run())
+
+        self.assertEqual(job.status, JobStatus.COMPLETED)
+        self.assertEqual(job.result.total_files_analyzed, 3)
+        self.assertNotEqual(job.worker_id, "dead-worker")
+
+    def test_memory_store_evicts_oldest_finished_jobs(self):
+        """Test the memory store stays bounded without dropping unfinished jobs"""
+        store = MemoryJobStore(max_entries=2)
+        request = ReviewJobRequest(url="https://github.com/owner/repo")
+        jobs = [
+            ReviewJob(id="queued", request=request, created_at=1),
+            ReviewJob(id="done-1", request=request, status=JobStatus.COMPLETED, created_at=2),
+            ReviewJob(id="done-2", request=request, status=JobStatus.COMPLETED, created_at=3),
+        ]
+        for job in jobs:
+            store.save(job)
+
+        self.assertIsNotNone(store.get("queued"))
+        self.assertIsNone(store.get("done-1"))
+        self.assertIsNotNone(store.get("done-2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
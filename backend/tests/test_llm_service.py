@@ -1,14 +1,22 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import sys
 import os
 import json
+import asyncio
+import httpx
+import openai
+from prometheus_client import REGISTRY
 
 # Add the parent directory to sys.path to import the modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from llm_service import LLMService
-from models import ReviewSettings, ReviewTone, CodeChange, ReviewResponse, Issue, IssueLabel, TestSuggestion
+from llm_service import LLMService, LLMUnavailableError
+from llm_backends import LLMCompletion, OfflineBackend, OpenAIBackend, UnavailableBackend, llm_backend_from_env
+from review_parser import ReviewStreamParser
+from chunking import estimate_tokens
+from token_budget import TenantBudgets, TokenBudgetExceeded
+from models import ReviewSettings, ReviewTone, CodeChange, ReviewResponse, Issue, IssueLabel, TestSuggestion, TokenUsage
 
 class TestLLMService(unittest.TestCase):
     
@@ -122,6 +130,231 @@ class TestLLMService(unittest.TestCase):
         self.assertEqual(result.test_suggestions[0].file_path, "test.py")
         self.assertEqual(result.summary, "The code has minor style issues")
         
+    @patch('llm_service.LLMService._call_llm')
+    def test_analyze_code_stream(self, mock_call_llm):
+        """Test that issues and batches are streamed before the final result"""
+        mock_call_llm.return_value = json.dumps({
+            "issues": [
+                {
+                    "title": "Unused import",
+                    "file_path": "test.py",
+                    "line_numbers": [1],
+                    "description": "Import is not used in the code",
+                    "suggestion": "Remove the unused import",
+                    "labels": ["style"]
+                }
+            ],
+            "test_suggestions": [],
+            "summary": "Minor style issues",
+            "suggested_labels": ["style"]
+        })
+        self.llm_service.review_cache = None
+        code_changes = [CodeChange(file_path="test.py", content="import os\n", is_new=False)]
+        
+        async def collect():
+            return [event async for event in self.llm_service.analyze_code_stream(code_changes, ReviewSettings())]
+        
+        events = asyncio.run(collect())
+        
+        self.assertEqual([name for name, _ in events], ["issue", "batch", "result"])
+        self.assertEqual(events[0][1].title, "Unused import")
+        self.assertEqual(events[1][1], {"batch": 1, "total_batches": 1, "issues": 1})
+        self.assertIsInstance(events[2][1], ReviewResponse)
+        self.assertEqual(len(events[2][1].issues), 1)
+        
+    def _api_error(self, error_class, status_code, headers=None):
+        response = httpx.Response(status_code, headers=headers,
+                                  request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+        return error_class("error", response=response, body=None)
+    
+    def test_call_llm_retries_rate_limits(self):
+        """Test 429s are retried with the Retry-After delay instead of returning mock data"""
+        self.llm_service.backend = MagicMock()
+        self.llm_service.backend.complete = AsyncMock(side_effect=[
+            self._api_error(openai.RateLimitError, 429, {"Retry-After": "0"}),
+            self._api_error(openai.InternalServerError, 503, {"Retry-After": "0"}),
+            LLMCompletion('{"issues": []}', 10, 2),
+        ])
+        
+        result = asyncio.run(self.llm_service._call_llm("prompt"))
+        
+        self.assertEqual(result, '{"issues": []}')
+        self.assertEqual(self.llm_service.backend.complete.call_count, 3)
+    
+    def test_call_llm_falls_back_to_next_model(self):
+        """Test a model that keeps failing hands over to the next model in the chain"""
+        self.llm_service.model = "primary"
+        self.llm_service.fallback_models = ["secondary"]
+        self.llm_service.max_retries = 1
+        self.llm_service.retry_base_delay = 0
+        
+        async def complete(model, messages, **kwargs):
+            if model == "primary":
+                raise self._api_error(openai.RateLimitError, 429)
+            return LLMCompletion("from secondary", 10, 2)
+        
+        self.llm_service.backend = MagicMock()
+        self.llm_service.backend.complete = AsyncMock(side_effect=complete)
+        
+        result = asyncio.run(self.llm_service._call_llm("prompt"))
+        
+        models = [call.args[0] for call in self.llm_service.backend.complete.call_args_list]
+        self.assertEqual(result, "from secondary")
+        self.assertEqual(models, ["primary", "primary", "secondary"])
+    
+    def test_streamed_usage_is_marked_estimated(self):
+        """Test token counts estimated for a streamed answer are flagged in the usage and the metrics"""
+        chunk = {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                 "choices": [{"index": 0, "delta": {"content": '{"issues": []}'}, "finish_reason": None}]}
+        body = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n"
+        transport = httpx.MockTransport(lambda request: httpx.Response(
+            200, headers={"Content-Type": "text/event-stream"}, content=body.encode()))
+        backend = OpenAIBackend("key")
+        backend.client = openai.AsyncOpenAI(api_key="key", http_client=httpx.AsyncClient(transport=transport),
+                                            max_retries=0)
+        self.llm_service.backend = backend
+        self.llm_service.model = "stream-model"
+        usage = TokenUsage()
+        
+        asyncio.run(self.llm_service._call_llm("prompt", usage, ReviewStreamParser()))
+        
+        self.assertTrue(usage.usage_estimated)
+        self.assertGreater(usage.completion_tokens, 0)
+        self.assertGreater(REGISTRY.get_sample_value(
+            "llm_tokens_total", {"model": "stream-model", "kind": "completion", "source": "estimated"}), 0)
+        
+        reported = TokenUsage()
+        self.llm_service.backend = MagicMock()
+        self.llm_service.backend.complete = AsyncMock(return_value=LLMCompletion("{}", 10, 1))
+        asyncio.run(self.llm_service._call_llm("prompt", reported))
+        self.assertFalse(reported.usage_estimated)
+    
+    def test_small_prompts_try_fast_model_first(self):
+        """Test prompts under the fast-model threshold are routed to the fast model"""
+        self.llm_service.model = "primary"
+        self.llm_service.fast_model = "fast"
+        self.llm_service.fast_model_max_prompt_tokens = 100
+        self.llm_service.backend = MagicMock()
+        self.llm_service.backend.complete = AsyncMock(return_value=LLMCompletion("{}", 10, 1))
+        
+        asyncio.run(self.llm_service._call_llm("short prompt"))
+        asyncio.run(self.llm_service._call_llm("long prompt " * 100))
+        
+        models = [call.args[0] for call in self.llm_service.backend.complete.call_args_list]
+        self.assertEqual(models, ["fast", "primary"])
+    
+    def test_offline_backend_reviews_prompt_files(self):
+        """Test the offline backend answers deterministically about the files in the prompt"""
+        llm_service = LLMService(backend=OfflineBackend(issues_per_file=2))
+        llm_service.review_cache = None
+        code_changes = [
+            CodeChange(file_path="app.py", content="def main():\n    return 1\n"),
+            CodeChange(file_path="utils/helpers.js", content="export const x = 1;\n"),
+        ]
+        
+        first = llm_service.analyze_code(code_changes, ReviewSettings(max_issues=3))
+        second = llm_service.analyze_code(code_changes, ReviewSettings(max_issues=3))
+        
+        self.assertEqual(len(first.issues), 3)
+        self.assertEqual({issue.file_path for issue in first.issues}, {"app.py", "utils/helpers.js"})
+        self.assertEqual([issue.title for issue in first.issues], [issue.title for issue in second.issues])
+        self.assertTrue(first.test_suggestions)
+        # Marked so clients cannot take it for a model's review
+        self.assertEqual(first.llm_backend, "offline")
+        self.assertTrue(first.summary.startswith(OfflineBackend.SUMMARY_PREFIX))
+    
+    def test_offline_backend_needs_opt_in(self):
+        """Test a missing OpenAI key fails reviews instead of serving mock ones, unless offline is asked for"""
+        with patch.dict(os.environ, {"LLM_BACKEND": "openai"}):
+            backend = llm_backend_from_env(None, mock_mode=False)
+            self.assertIsInstance(backend, UnavailableBackend)
+            self.assertIsInstance(llm_backend_from_env(None, mock_mode=True), OfflineBackend)
+        with patch.dict(os.environ, {"LLM_BACKEND": "offline"}):
+            self.assertIsInstance(llm_backend_from_env(None, mock_mode=False), OfflineBackend)
+        
+        llm_service = LLMService(backend=backend)
+        llm_service.review_cache = None
+        llm_service.max_retries = 0
+        with self.assertRaises(LLMUnavailableError):
+            llm_service.analyze_code([CodeChange(file_path="app.py", content="x = 1\n")], ReviewSettings())
+        
+    def test_streamed_answers_yield_issues_before_their_batch(self):
+        """Test issues from a streamed answer are yielded while the batch is still running"""
+        llm_service = LLMService(backend=OfflineBackend(issues_per_file=2))
+        llm_service.review_cache = None
+        code_changes = [CodeChange(file_path="app.py", content="def main():\n    return 1\n")]
+        
+        async def collect():
+            return [event async for event in llm_service.analyze_code_stream(code_changes, ReviewSettings())]
+        
+        events = asyncio.run(collect())
+        
+        self.assertEqual([name for name, _ in events], ["issue", "issue", "batch", "result"])
+        # The final review lists the same issues, ranked
+        self.assertCountEqual([payload.title for name, payload in events if name == "issue"],
+                              [issue.title for issue in events[-1][1].issues])
+        
+    def test_analyze_code_reports_token_usage(self):
+        """Test the tokens of every batch are added up in the response"""
+        llm_service = LLMService(backend=OfflineBackend(), tenant_budgets=TenantBudgets())
+        llm_service.review_cache = None
+        llm_service.context_tokens = 3000
+        code_changes = [CodeChange(file_path=f"module_{i}.py", content="x = 1\n" * 400) for i in range(3)]
+        
+        result = llm_service.analyze_code(code_changes, ReviewSettings())
+        
+        self.assertGreater(result.token_usage.prompt_tokens, 3000)
+        self.assertGreater(result.token_usage.completion_tokens, 0)
+        self.assertGreaterEqual(result.token_usage.estimated_tokens, result.token_usage.prompt_tokens)
+        self.assertEqual(result.token_usage.trimmed_files, [])
+    
+    def test_analyze_code_trims_files_over_budget(self):
+        """Test files past the per-review budget are left out and reported"""
+        llm_service = LLMService(backend=OfflineBackend(), tenant_budgets=TenantBudgets())
+        llm_service.review_cache = None
+        llm_service.max_output_tokens = 1500
+        code_changes = [CodeChange(file_path=f"module_{i}.py", content="x = 1\n" * 200) for i in range(4)]
+        prepared = llm_service._prepare_code_content(code_changes)
+        overhead = estimate_tokens(llm_service._create_analysis_prompt({}, ReviewSettings())) + 1500
+        budget = overhead + sum(llm_service._measure_file_tokens(path, prepared[path]) for path in ["module_0.py", "module_1.py"])
+        
+        result = llm_service.analyze_code(code_changes, ReviewSettings(token_budget=budget))
+        
+        self.assertEqual(result.token_usage.budget, budget)
+        self.assertLessEqual(result.token_usage.estimated_tokens, budget)
+        self.assertEqual(result.token_usage.trimmed_files, ["module_3.py", "module_2.py"])
+        self.assertEqual(result.total_files_analyzed, 2)
+        self.assertEqual({issue.file_path for issue in result.issues}, {"module_0.py", "module_1.py"})
+        with self.assertRaises(TokenBudgetExceeded):
+            llm_service.analyze_code(code_changes, ReviewSettings(token_budget=100))
+    
+    def test_tenant_budget_is_charged_and_enforced(self):
+        """Test a tenant's spent tokens count against later reviews until the budget runs out"""
+        budgets = TenantBudgets(tokens_per_window=10000)
+        llm_service = LLMService(backend=OfflineBackend(), tenant_budgets=budgets)
+        llm_service.review_cache = None
+        code_changes = [CodeChange(file_path="app.py", content="def main():\n    return 1\n" * 50)]
+        
+        result = llm_service.analyze_code(code_changes, ReviewSettings(), tenant="acme")
+        spent = result.token_usage.prompt_tokens + result.token_usage.completion_tokens
+        
+        self.assertEqual(budgets.remaining("acme"), 10000 - spent)
+        self.assertEqual(budgets.remaining("other"), 10000)
+        self.assertIsNone(budgets.remaining(None))
+        budgets.tokens_per_window = spent + 100
+        with self.assertRaises(TokenBudgetExceeded):
+            llm_service.analyze_code(code_changes, ReviewSettings(), tenant="acme")
+        
+    def test_call_llm_raises_when_chain_exhausted(self):
+        """Test exhausting every model raises instead of inventing a review"""
+        self.llm_service.fallback_models = []
+        self.llm_service.max_retries = 0
+        self.llm_service.backend = MagicMock()
+        self.llm_service.backend.complete = AsyncMock(side_effect=self._api_error(openai.RateLimitError, 429))
+        
+        with self.assertRaises(LLMUnavailableError):
+            asyncio.run(self.llm_service._call_llm("prompt"))
+        
     def test_generate_markdown_report(self):
         """Test generating markdown report from review response"""
         # Create a sample review response
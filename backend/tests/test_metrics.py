@@ -0,0 +1,43 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prometheus_client import REGISTRY
+from metrics import github_endpoint, metrics_response, record_cache_lookup, stage
+
+class TestMetrics(unittest.TestCase):
+
+    def test_github_endpoint_labels(self):
+        """Test API paths collapse to endpoint labels without owners, numbers or SHAs"""
+        sha = "a" * 40
+        self.assertEqual(github_endpoint("/repos/owner/repo"), "repo")
+        self.assertEqual(github_endpoint("/repos/owner/repo/pulls/12"), "pulls")
+        self.assertEqual(github_endpoint("/repos/owner/repo/pulls/12/files"), "pulls/files")
+        self.assertEqual(github_endpoint(f"/repos/owner/repo/git/blobs/{sha}"), "git/blobs")
+        self.assertEqual(github_endpoint(f"/repos/owner/repo/git/trees/{sha}"), "git/trees")
+        self.assertEqual(github_endpoint("/repos/owner/repo/commits/feature%2Fx"), "commits")
+        self.assertEqual(github_endpoint("/repos/owner/repo/tarball/main"), "tarball")
+
+    def test_stage_records_duration(self):
+        """Test a timed stage adds one observation to its histogram"""
+        before = REGISTRY.get_sample_value("review_stage_seconds_count", {"stage": "test_stage"}) or 0
+        with stage("test_stage"):
+            pass
+        after = REGISTRY.get_sample_value("review_stage_seconds_count", {"stage": "test_stage"})
+        self.assertEqual(after, before + 1)
+
+    def test_metrics_response_renders_prometheus_text(self):
+        """Test the /metrics body is in the Prometheus text format"""
+        record_cache_lookup("blob", True)
+        response = metrics_response()
+        body = response.body.decode()
+        self.assertTrue(response.media_type.startswith("text/plain"))
+        self.assertIn('cache_lookups_total{cache="blob",result="hit"}', body)
+        self.assertIn("review_stage_seconds_bucket", body)
+
+
+if __name__ == '__main__':
+    unittest.main()
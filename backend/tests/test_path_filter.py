@@ -0,0 +1,80 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from path_filter import PathFilter, glob_to_regex, looks_binary, parse_gitattributes
+
+class TestPathFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.path_filter = PathFilter()
+
+    def test_directories_match_whole_segments(self):
+        """Test skipped directories do not match directories that merely end with their name"""
+        self.assertEqual(self.path_filter.skip_reason("build/out.js"), "directory")
+        self.assertEqual(self.path_filter.skip_reason("web/node_modules/lib/index.js"), "directory")
+        self.assertIsNone(self.path_filter.skip_reason("mybuild/main.py"))
+        self.assertIsNone(self.path_filter.skip_reason("src/build.py"))
+
+    def test_suffixes_lockfiles_and_size(self):
+        """Test multi-part suffixes, lockfiles and the size threshold"""
+        self.assertEqual(self.path_filter.skip_reason("dist2/bundle.min.js"), "file_type")
+        self.assertEqual(self.path_filter.skip_reason("assets/Logo.PNG"), "file_type")
+        self.assertEqual(self.path_filter.skip_reason("frontend/package-lock.json"), "lockfile")
+        self.assertEqual(self.path_filter.skip_reason("src/data.py", size=600000), "too_large")
+        self.assertIsNone(self.path_filter.skip_reason("src/data.py", size=1000))
+
+    def test_glob_patterns(self):
+        """Test unanchored, anchored, recursive and directory globs plus raw regexes"""
+        path_filter = PathFilter(skip_patterns=["*.pb.go", "/generated/**", "docs/", "re:.*_test\\.snap"])
+
+        self.assertEqual(path_filter.skip_reason("api/v1/service.pb.go"), "pattern")
+        self.assertEqual(path_filter.skip_reason("generated/client/api.ts"), "pattern")
+        self.assertIsNone(path_filter.skip_reason("src/generated/api.ts"))
+        self.assertEqual(path_filter.skip_reason("site/docs/index.md"), "pattern")
+        self.assertEqual(path_filter.skip_reason("tests/render_test.snap"), "pattern")
+        self.assertIsNone(path_filter.skip_reason("api/v1/service.go"))
+        self.assertEqual(glob_to_regex("src/[!a]?.py"), "(?:src/[^a][^/]\\.py)")
+
+    def test_gitattributes_markers(self):
+        """Test linguist-generated and linguist-vendored paths are skipped and unset markers re-include paths"""
+        text = "\n".join([
+            "# generated code",
+            "*.generated.cs linguist-generated=true",
+            "third_party/** linguist-vendored",
+            "build/keep.py -linguist-generated",
+            "*.py text eol=lf",
+        ])
+        self.assertEqual(parse_gitattributes(text),
+                         (["*.generated.cs", "third_party/**"], ["build/keep.py"]))
+
+        path_filter = self.path_filter.with_gitattributes(text)
+
+        self.assertFalse(path_filter.is_reviewable("Models/User.generated.cs"))
+        self.assertFalse(path_filter.is_reviewable("third_party/lib/util.c"))
+        self.assertTrue(path_filter.is_reviewable("build/keep.py"))
+        self.assertTrue(path_filter.is_reviewable("src/app.py"))
+        self.assertIs(self.path_filter.with_gitattributes("*.py text"), self.path_filter)
+
+    def test_root_anchored_directory(self):
+        """Test a directory pattern with a leading slash only matches that directory at the repository root"""
+        path_filter = PathFilter().with_gitattributes("/vendor/ linguist-vendored")
+
+        self.assertFalse(path_filter.is_reviewable("vendor/lib/util.py"))
+        self.assertTrue(path_filter.is_reviewable("src/vendor/a.py"))
+        self.assertEqual(glob_to_regex("/vendor/"), "(?:vendor/.*)")
+        self.assertEqual(glob_to_regex("vendor/"), "(?:(?:.*/)?vendor/.*)")
+
+    def test_looks_binary(self):
+        """Test binary content is told apart from text in any encoding"""
+        self.assertTrue(looks_binary(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"))
+        self.assertTrue(looks_binary(bytes(range(1, 32)) * 10))
+        self.assertFalse(looks_binary(b"def main():\n\treturn 0\r\n"))
+        self.assertFalse(looks_binary("caf\xe9\n".encode("latin-1")))
+        self.assertFalse(looks_binary(b""))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_backends import OfflineBackend
+from models import ReviewMode, ReviewSettings, ReviewTone
+from prompt_format import _static_sections, build_prompt, fence, format_file, number_lines
+
+class TestPromptFormat(unittest.TestCase):
+
+    def test_number_lines_from_first_line(self):
+        """Test code lines are numbered from the given line and blank lines stay unnumbered"""
+        self.assertEqual(number_lines("a = 1\n\nb = 2\n", 10), "10|a = 1\n\n12|b = 2")
+
+    def test_fence_outgrows_backticks_in_content(self):
+        """Test a fence is longer than any backtick run inside the text"""
+        self.assertEqual(fence("x = 1\n"), "```\nx = 1\n```")
+        self.assertTrue(fence("doc = '''\n````\n'''", "py").startswith("`````py\n"))
+
+    def test_format_file_sections(self):
+        """Test contents, diffs and excerpts are embedded verbatim with line numbers"""
+        entry = {
+            "diff": "@@ -4 +4 @@\n-x = 'a'\n+x = \"b\"",
+            "is_new": False,
+            "symbols": [{"name": "load", "kind": "function", "start_line": 3, "end_line": 4,
+                         "code": "def load():\n    x = \"b\""}],
+            "imports": "import os",
+        }
+        text = format_file("src/app.py", entry)
+
+        self.assertTrue(text.startswith("### src/app.py\n"))
+        self.assertIn("Diff:\n```diff\n@@ -4 +4 @@\n-x = 'a'\n+x = \"b\"\n```", text)
+        self.assertIn("Changed function load:\n```\n3|def load():\n4|    x = \"b\"\n```", text)
+        self.assertIn("Imports:\n```\nimport os\n```", text)
+
+        new_file = format_file("new.py", {"content": "x = 1\n", "diff": "@@ -0,0 +1 @@\n+x = 1", "is_new": True})
+        self.assertEqual(new_file, "### new.py (new file)\n```\n1|x = 1\n```")
+
+    def test_static_sections_are_cached_per_settings(self):
+        """Test the instructions are rendered once per settings and follow them"""
+        _static_sections.cache_clear()
+        build_prompt({}, ReviewSettings())
+        build_prompt({"a.py": {"content": "x = 1"}}, ReviewSettings())
+        self.assertEqual(_static_sections.cache_info().hits, 1)
+
+        prompt = build_prompt({}, ReviewSettings(tone=ReviewTone.STRICT, review_mode=ReviewMode.DIFF,
+                                                 max_issues=3, include_summary=False))
+        self.assertIn("REVIEW TONE (strict)", prompt)
+        self.assertIn("under 'Context'", prompt)
+        self.assertIn("up to 3 issues", prompt)
+        self.assertNotIn("non-technical stakeholders.", prompt)
+        self.assertFalse(prompt.startswith(" "))
+
+    def test_offline_backend_reads_file_headings(self):
+        """Test the offline backend finds the files of a compact prompt"""
+        prompt = build_prompt({"a.py": {"content": "x = 1", "is_new": True}, "b/c.js": {"content": "y"}},
+                              ReviewSettings(max_issues=4))
+        review = OfflineBackend(issues_per_file=2).review_for(prompt, 10000)
+        self.assertEqual([issue["file_path"] for issue in review["issues"]], ["a.py", "a.py", "b/c.js", "b/c.js"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import json
+import time
+import tempfile
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_service import LLMService
+from models import ReviewSettings, ReviewTone, CodeChange
+from review_cache import MemoryReviewCache, SQLiteReviewCache, review_cache_key
+
+class TestReviewCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.changes = [
+            CodeChange(file_path="b.py", content="b = 2", diff="+b = 2", sha="sha-b"),
+            CodeChange(file_path="a.py", content="a = 1", sha="sha-a"),
+        ]
+    
+    def test_key_ignores_file_order(self):
+        """Test the key depends on the set of files, not their order"""
+        settings = ReviewSettings()
+        self.assertEqual(
+            review_cache_key(self.changes, settings, "gpt-3.5-turbo", "head1"),
+            review_cache_key(list(reversed(self.changes)), settings, "gpt-3.5-turbo", "head1")
+        )
+    
+    def test_key_changes_with_settings_model_and_commit(self):
+        """Test every input that affects the review changes the key"""
+        base = review_cache_key(self.changes, ReviewSettings(), "gpt-3.5-turbo", "head1")
+        self.assertNotEqual(base, review_cache_key(self.changes, ReviewSettings(tone=ReviewTone.STRICT), "gpt-3.5-turbo", "head1"))
+        self.assertNotEqual(base, review_cache_key(self.changes, ReviewSettings(max_issues=5), "gpt-3.5-turbo", "head1"))
+        self.assertNotEqual(base, review_cache_key(self.changes, ReviewSettings(), "gpt-4", "head1"))
+        self.assertNotEqual(base, review_cache_key(self.changes, ReviewSettings(), "gpt-3.5-turbo", "head2"))
+    
+    def test_key_requires_blob_shas(self):
+        """Test files without a blob SHA disable caching"""
+        changes = [CodeChange(file_path="a.py", content="a = 1")]
+        self.assertIsNone(review_cache_key(changes, ReviewSettings(), "gpt-3.5-turbo"))
+    
+    def test_key_covers_skipped_files_without_shas(self):
+        """Test skipped files, which are never sent to the model, do not need a blob SHA but still change the key"""
+        missing = CodeChange(file_path="link.py", content="", skip_reason="symlink")
+        base = review_cache_key(self.changes, ReviewSettings(), "gpt-3.5-turbo", "head1")
+        with_skipped = review_cache_key(self.changes + [missing], ReviewSettings(), "gpt-3.5-turbo", "head1")
+        
+        self.assertIsNotNone(with_skipped)
+        self.assertNotEqual(base, with_skipped)
+    
+    def test_memory_cache_expires_and_evicts(self):
+        """Test TTL expiry and size-based eviction in the memory backend"""
+        cache = MemoryReviewCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")
+        cache.set("c", "3")
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+        
+        with patch("review_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("a"))
+    
+    def test_sqlite_cache_round_trip(self):
+        """Test the SQLite backend persists entries across instances and evicts by size"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "reviews.sqlite3")
+            SQLiteReviewCache(path, max_entries=2).set("a", "1")
+            cache = SQLiteReviewCache(path, max_entries=2)
+            self.assertEqual(cache.get("a"), "1")
+            cache.set("b", "2")
+            cache.set("c", "3")
+            self.assertEqual(len([key for key in "abc" if cache.get(key) is not None]), 2)
+    
+    @patch('llm_service.LLMService._call_llm')
+    def test_analyze_code_serves_repeat_review_from_cache(self, mock_call_llm):
+        """Test an identical second review skips the LLM and is flagged as cached"""
+        mock_call_llm.return_value = json.dumps({"issues": [], "test_suggestions": [], "summary": "ok", "suggested_labels": []})
+        llm_service = LLMService(review_cache=MemoryReviewCache())
+        
+        first = llm_service.analyze_code(self.changes, ReviewSettings(), head_sha="head1")
+        second = llm_service.analyze_code(self.changes, ReviewSettings(), head_sha="head1")
+        
+        self.assertEqual(mock_call_llm.call_count, 1)
+        self.assertFalse(first.cached)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.summary, "ok")
+    
+    @patch('llm_service.LLMService._call_llm')
+    def test_repo_with_skipped_files_is_cached(self, mock_call_llm):
+        """Test a repository review that skipped an oversized file and a symlink is served from cache the second time"""
+        mock_call_llm.return_value = json.dumps({"issues": [], "test_suggestions": [], "summary": "ok", "suggested_labels": []})
+        llm_service = LLMService(review_cache=MemoryReviewCache())
+        changes = self.changes + [
+            CodeChange(file_path="data/huge.py", content="", skip_reason="too_large", size=10 ** 7, sha="sha-huge"),
+            CodeChange(file_path="link.py", content="", skip_reason="symlink"),
+        ]
+        
+        llm_service.analyze_code(changes, ReviewSettings(), head_sha="head1")
+        second = llm_service.analyze_code(changes, ReviewSettings(), head_sha="head1")
+        
+        self.assertEqual(mock_call_llm.call_count, 1)
+        self.assertTrue(second.cached)
+        self.assertEqual([skipped.file_path for skipped in second.skipped_files], ["data/huge.py", "link.py"])
+    
+    @patch('llm_service.LLMService._call_llm')
+    def test_repo_with_failed_downloads_is_not_cached(self, mock_call_llm):
+        """Test a review that skipped files whose download failed is made again on retry"""
+        mock_call_llm.return_value = json.dumps({"issues": [], "test_suggestions": [], "summary": "ok", "suggested_labels": []})
+        llm_service = LLMService(review_cache=MemoryReviewCache())
+        changes = self.changes + [
+            CodeChange(file_path="flaky.py", content="", skip_reason="unavailable", sha="sha-flaky"),
+            CodeChange(file_path="gone.py", content="", skip_reason="not_found", sha="sha-gone"),
+        ]
+        
+        self.assertIsNone(review_cache_key(changes[:3], ReviewSettings(), "gpt-3.5-turbo", "head1"))
+        self.assertIsNone(review_cache_key(changes[:2] + changes[3:], ReviewSettings(), "gpt-3.5-turbo", "head1"))
+        llm_service.analyze_code(changes, ReviewSettings(), head_sha="head1")
+        second = llm_service.analyze_code(changes, ReviewSettings(), head_sha="head1")
+        
+        self.assertEqual(mock_call_llm.call_count, 2)
+        self.assertFalse(second.cached)
+    
+    @patch('llm_service.LLMService._call_llm')
+    def test_unparseable_answer_is_not_cached(self, mock_call_llm):
+        """Test a review whose answer held no JSON review is asked for again instead of served from cache"""
+        mock_call_llm.side_effect = [
+            "Sorry, I cannot help with that.",
+            json.dumps({"issues": [], "test_suggestions": [], "summary": "ok", "suggested_labels": []}),
+        ]
+        llm_service = LLMService(review_cache=MemoryReviewCache())
+        
+        first = llm_service.analyze_code(self.changes, ReviewSettings(), head_sha="head1")
+        second = llm_service.analyze_code(self.changes, ReviewSettings(), head_sha="head1")
+        third = llm_service.analyze_code(self.changes, ReviewSettings(), head_sha="head1")
+        
+        self.assertEqual(first.issues[0].title, "Error in Response Parsing")
+        self.assertFalse(second.cached)
+        self.assertEqual(second.summary, "ok")
+        self.assertTrue(third.cached)
+        self.assertEqual(mock_call_llm.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
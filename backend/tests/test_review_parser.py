@@ -0,0 +1,76 @@
+import unittest
+import sys
+import os
+import json
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Issue, IssueLabel, TestSuggestion
+from review_parser import ReviewStreamParser, parse_labels, parse_line_numbers, parse_review
+
+ANSWER = json.dumps({
+    "issues": [
+        {"title": "SQL injection", "file_path": "db.py", "line_numbers": [12], "labels": ["security"]},
+        {"title": "Slow loop", "file_path": "app.py", "line_numbers": ["3-5"], "labels": ["Perf", "made-up"]},
+    ],
+    "test_suggestions": [{"file_path": "db.py", "test_description": "Quote user input"}],
+    "summary": "Two issues",
+    "suggested_labels": ["security", "ERROR"],
+}, indent=2)
+
+class TestReviewParser(unittest.TestCase):
+
+    def test_entries_are_reported_as_they_complete(self):
+        """Test each issue and test suggestion is reported once its object is closed"""
+        seen = []
+        parser = ReviewStreamParser(seen.append)
+        first_issue_end = ANSWER.index("},") + 1
+
+        parser.feed("Here is the review:\n```json\n" + ANSWER[:first_issue_end - 1])
+        self.assertEqual(seen, [])
+        parser.feed(ANSWER[first_issue_end - 1:first_issue_end])
+        self.assertEqual([issue.title for issue in seen], ["SQL injection"])
+        for start in range(first_issue_end, len(ANSWER), 5):
+            parser.feed(ANSWER[start:start + 5])
+        review = parser.close()
+
+        self.assertTrue(parser.complete)
+        self.assertEqual([type(item) for item in seen], [Issue, Issue, TestSuggestion])
+        self.assertEqual(review.summary, "Two issues")
+        self.assertEqual(review.suggested_labels, [IssueLabel.SECURITY])
+        self.assertEqual(review.issues[1].line_numbers, [3, 4, 5])
+        self.assertEqual(review.issues[1].labels, [IssueLabel.PERFORMANCE])
+
+    def test_truncated_and_malformed_answers_keep_complete_entries(self):
+        """Test a cut-off answer keeps finished issues and a malformed issue costs only itself"""
+        truncated = parse_review(ANSWER[:ANSWER.index('"Slow loop"')])
+        self.assertEqual([issue.title for issue in truncated.issues], ["SQL injection"])
+        self.assertEqual(truncated.summary, "")
+
+        malformed = ANSWER.replace('"SQL injection",', '"SQL injection" oops,')
+        review = parse_review(malformed)
+        self.assertEqual([issue.title for issue in review.issues], ["Slow loop"])
+        self.assertEqual(len(review.test_suggestions), 1)
+
+    def test_restart_does_not_report_entries_twice(self):
+        """Test a retried answer only reports entries beyond those already reported"""
+        seen = []
+        parser = ReviewStreamParser(seen.append)
+        parser.feed(ANSWER[:ANSWER.index('"Slow loop"')])
+        parser.restart()
+        review = parser.close(ANSWER)
+
+        self.assertEqual([item.title for item in seen if isinstance(item, Issue)], ["SQL injection", "Slow loop"])
+        self.assertEqual(len(review.issues), 2)
+
+    def test_lenient_fields(self):
+        """Test labels and line numbers are read leniently"""
+        self.assertEqual(parse_labels(["Security", "test coverage", "docs", "error", 3]),
+                         [IssueLabel.SECURITY, IssueLabel.TEST_COVERAGE, IssueLabel.DOCUMENTATION])
+        self.assertEqual(parse_labels("bug"), [IssueLabel.BUG])
+        self.assertEqual(parse_line_numbers([1, "7", "9 - 10", "x", True]), [1, 7, 9, 10])
+        self.assertEqual(parse_line_numbers(4), [4])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,225 @@
+import unittest
+import sys
+import os
+import json
+import asyncio
+import logging
+from unittest.mock import patch
+
+import httpx
+from prometheus_client import REGISTRY
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_github import FakeGitHub, OWNER, REPO, PR_NUMBER
+import main
+import mcp_server
+from github_service import GithubService
+from llm_backends import OfflineBackend
+from llm_service import LLMService
+from review_cache import MemoryReviewCache
+from review_pipeline import ReviewPipeline, ReviewRun, STAGES
+from concurrency import MAX_CONCURRENT_REVIEWS
+from models import CodeChange, Issue, IssueLabel, ReviewResponse, ReviewSettings
+
+PR_URL = f"https://github.com/{OWNER}/{REPO}/pull/{PR_NUMBER}"
+
+class TestReviewPipeline(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.INFO)
+        self.fake = FakeGitHub(20)
+        github_service = GithubService("dummy_token", transport=self.fake.transport())
+        self.llm_service = LLMService(review_cache=MemoryReviewCache(), backend=OfflineBackend())
+        self.pipeline = ReviewPipeline(github_service, self.llm_service)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _review(self, run):
+        return asyncio.run(self.pipeline.review(run))
+
+    def test_stages_run_in_order_and_are_timed(self):
+        """Test a review passes through every stage once, in order, and records how long each took"""
+        order = []
+        for name, stage in list(self.pipeline.stages.items()):
+            def recorded(run, *args, name=name, stage=stage):
+                order.append(name)
+                return stage(run, *args)
+            self.pipeline.stages[name] = recorded
+
+        run = ReviewRun(PR_URL, ReviewSettings())
+        review = self._review(run)
+
+        self.assertEqual([name for name in order if name != "parse"],
+                         ["resolve", "list", "filter", "fetch", "index", "prompt", "call", "postprocess"])
+        self.assertIn("parse", order)
+        self.assertEqual(set(run.timings), set(STAGES))
+        self.assertEqual(run.head_sha, self.fake.head_sha)
+        self.assertGreater(len(review.issues), 0)
+        self.assertEqual(review.total_files_analyzed, len(self.fake.pr_files))
+
+    def test_review_observes_prompt_build_once(self):
+        """Test a review adds one prompt_build observation, however many steps build its prompts"""
+        def count():
+            return REGISTRY.get_sample_value("review_stage_seconds_count", {"stage": "prompt_build"}) or 0
+
+        before = count()
+        self._review(ReviewRun(PR_URL, ReviewSettings()))
+        self.assertEqual(count(), before + 1)
+
+    def test_stage_can_be_replaced(self):
+        """Test a stage given to the pipeline is used instead of the default one"""
+        def parse(run, response, batch, parser):
+            return ReviewResponse(issues=[Issue(title="Stubbed", description="d", file_path=next(iter(batch)),
+                                                labels=[IssueLabel.BUG])],
+                                  total_files_analyzed=len(batch), analysis_time_seconds=0.0)
+        self.pipeline = ReviewPipeline(self.pipeline.github_service, self.llm_service, stages={"parse": parse})
+
+        review = self._review(ReviewRun(PR_URL, ReviewSettings()))
+
+        self.assertEqual({issue.title for issue in review.issues}, {"Stubbed"})
+        with self.assertRaises(ValueError):
+            ReviewPipeline(self.pipeline.github_service, self.llm_service, stages={"lint": parse})
+
+    def test_cached_review_skips_the_llm(self):
+        """Test a second review of the same commit stops after fetching and is served from the cache"""
+        first = self._review(ReviewRun(PR_URL, ReviewSettings()))
+        run = ReviewRun(PR_URL, ReviewSettings())
+        second = self._review(run)
+
+        self.assertTrue(second.cached)
+        self.assertEqual(second.issues, first.issues)
+        self.assertIn("fetch", run.timings)
+        self.assertNotIn("call", run.timings)
+
+    def test_concurrency_limit_works_in_every_event_loop(self):
+        """Test reviews beyond the limit wait for a slot, in each of two event loops one after the other"""
+        active = []
+        peaks = []
+        list_stage = self.pipeline.stages["list"]
+
+        async def slow_list(run):
+            active.append(run)
+            peaks.append(len(active))
+            await asyncio.sleep(0.01)
+            try:
+                return await list_stage(run)
+            finally:
+                active.remove(run)
+
+        self.pipeline.stages["list"] = slow_list
+        self.llm_service.review_cache = None
+
+        async def reviews():
+            return await asyncio.gather(*(self.pipeline.review(ReviewRun(PR_URL, ReviewSettings()))
+                                          for _ in range(MAX_CONCURRENT_REVIEWS + 2)))
+
+        for _ in range(2):
+            self.assertEqual(len(asyncio.run(reviews())), MAX_CONCURRENT_REVIEWS + 2)
+        self.assertEqual(max(peaks), MAX_CONCURRENT_REVIEWS)
+
+    def test_fetched_files_start_at_the_cache_check(self):
+        """Test a run given its files skips the GitHub stages and is cached like any other review"""
+        changes = [CodeChange(file_path="app.py", content="def main():\n    return 1\n", sha="sha-app")]
+        run = ReviewRun(None, ReviewSettings(), code_changes=changes, head_sha="head1")
+        review = self._review(run)
+        again = self._review(ReviewRun(None, ReviewSettings(), code_changes=changes, head_sha="head1"))
+
+        self.assertEqual(set(run.timings), {"index", "prompt", "call", "parse", "postprocess"})
+        self.assertEqual(review.total_files_analyzed, 1)
+        self.assertTrue(again.cached)
+        self.assertEqual(self.fake.requests, 0)
+
+    def test_llm_service_and_webhook_reviews_use_the_pipeline(self):
+        """Test direct LLMService reviews and webhook re-reviews run the pipeline's stages"""
+        changes = [CodeChange(file_path="app.py", content="x = 1\n", sha="sha-app")]
+        prompted = []
+        build_prompts = self.llm_service.build_prompts
+
+        def recorded(batches, settings):
+            prompted.append(len(batches))
+            return build_prompts(batches, settings)
+
+        self.llm_service.build_prompts = recorded
+        self.llm_service.review_cache = None
+        with patch.object(main, "review_pipeline", self.pipeline):
+            webhook = asyncio.run(main._review_webhook_changes(changes, ReviewSettings(), "head1"))
+        events = asyncio.run(self._collect(self.llm_service.analyze_code_stream(changes, ReviewSettings())))
+
+        self.assertEqual(prompted, [1, 1])
+        self.assertEqual(webhook.total_files_analyzed, 1)
+        self.assertEqual(events[-1][0], "result")
+        self.assertNotIn("progress", [event for event, _ in events])
+
+    @staticmethod
+    async def _collect(stream):
+        return [event async for event in stream]
+
+    def test_stream_emits_events_while_stages_run(self):
+        """Test a streamed review reports progress, issues and batches before its result"""
+        async def collect():
+            run = ReviewRun(PR_URL, ReviewSettings(), stream_tokens=True)
+            return [event async for event in self.pipeline.stream(run)]
+
+        events = asyncio.run(collect())
+        kinds = [event for event, _ in events]
+
+        self.assertEqual(events[0], ("progress", {"stage": "fetching"}))
+        self.assertEqual(events[1], ("progress", {"stage": "fetched", "files": len(self.fake.pr_files)}))
+        self.assertIn("issue", kinds)
+        self.assertIn("batch", kinds)
+        self.assertEqual(kinds[-1], "result")
+        self.assertEqual(kinds.count("issue"), len(events[-1][1].issues))
+
+    def test_stream_raises_stage_errors(self):
+        """Test an error in a stage ends the stream with that error"""
+        def fail(run):
+            raise RuntimeError("listing failed")
+        self.pipeline.stages["list"] = fail
+
+        async def collect():
+            return [event async for event in self.pipeline.stream(ReviewRun(PR_URL, ReviewSettings()))]
+
+        with self.assertRaisesRegex(RuntimeError, "listing failed"):
+            asyncio.run(collect())
+
+    def test_rest_and_mcp_front_ends_share_the_pipeline(self):
+        """Test both APIs review through the pipeline they are given and report the same findings"""
+        async def request(app, path, body):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post(path, json=body)
+
+        with patch.object(main, "review_pipeline", self.pipeline), \
+                patch.object(mcp_server, "review_pipeline", self.pipeline):
+            rest = asyncio.run(request(main.app, "/review", {"url": PR_URL}))
+            mcp = asyncio.run(request(mcp_server.mcp_app, "/v1/chat/completions", {
+                "model": "code-review", "messages": [{"role": "user", "content": f"Please review {PR_URL}"}]
+            }))
+
+        self.assertEqual(rest.status_code, 200)
+        self.assertFalse(rest.json()["cached"])
+        content = mcp.json()["choices"][0]["message"]["content"]
+        self.assertIn(f"Issues found: {len(rest.json()['issues'])}", content)
+
+    def test_rest_stream_renders_server_sent_events(self):
+        """Test the streaming endpoint renders every pipeline event as a Server-Sent Event"""
+        async def request():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.post("/review/stream", json={"url": PR_URL})
+
+        with patch.object(main, "review_pipeline", self.pipeline):
+            response = asyncio.run(request())
+
+        events = [block.split("\n")[0][len("event: "):] for block in response.text.strip().split("\n\n")]
+        self.assertEqual(events[0], "progress")
+        self.assertEqual(events[-1], "result")
+        result = json.loads(response.text.strip().split("\n\n")[-1].split("data: ", 1)[1])
+        self.assertEqual(events.count("issue"), len(result["issues"]))
+
+if __name__ == '__main__':
+    unittest.main()
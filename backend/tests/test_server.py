@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+import httpx
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mcp_server
+import server
+import services
+
+class TestServer(unittest.TestCase):
+
+    def _request(self, method, url, **kwargs):
+        async def send():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, url, **kwargs)
+        return asyncio.run(send())
+
+    def test_serves_rest_and_mcp_apis(self):
+        """Test one app answers REST requests at the root and MCP requests under /mcp"""
+        root = self._request("GET", "/")
+        completion = self._request("POST", "/mcp/v1/chat/completions", json={
+            "model": "code-review", "messages": [{"role": "user", "content": "What can you do?"}]
+        })
+
+        self.assertEqual(root.json()["message"], "Code Review Assistant API is running")
+        self.assertEqual(completion.status_code, 200)
+        self.assertEqual(completion.json()["object"], "chat.completion")
+
+    def test_front_ends_share_services(self):
+        """Test the MCP front-end reviews through the process-wide pipeline, GitHub and LLM clients"""
+        self.assertIs(mcp_server.review_pipeline, services.review_pipeline)
+        self.assertIs(mcp_server.review_pipeline.github_service, services.github_service)
+        self.assertIs(mcp_server.llm_service, services.llm_service)
+
+    def test_mcp_app_is_mounted_once(self):
+        """Test importing the server again, as every worker process does, adds no second mount"""
+        server.create_app()
+
+        mounts = [route for route in server.app.routes if getattr(route, "path", None) == server.MCP_PREFIX]
+        self.assertEqual(len(mounts), 1)
+
+    def test_workers_share_the_job_store(self):
+        """Test one worker is started by default with the memory job store, and several workers switch to sqlite"""
+        with patch.object(server.uvicorn, "run") as run, patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("SERVER_WORKERS", None)
+            os.environ.pop("REVIEW_JOB_STORE", None)
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = "unused"
+            server.main([])
+            self.assertEqual(run.call_args.kwargs["workers"], 1)
+            self.assertNotIn("REVIEW_JOB_STORE", os.environ)
+
+            server.main(["--workers", "3"])
+            self.assertEqual(run.call_args.kwargs["workers"], 3)
+            self.assertEqual(os.environ["REVIEW_JOB_STORE"], "sqlite")
+
+            with patch.object(server.os, "cpu_count", return_value=6):
+                server.main([])
+            self.assertEqual(run.call_args.kwargs["workers"], 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_budget import TenantBudgets, fit_batches
+
+def cost(batch):
+    return 10 + sum(entry["tokens"] for entry in batch.values())
+
+class TestTokenBudget(unittest.TestCase):
+
+    def test_fit_batches_without_budget_keeps_everything(self):
+        """Test an unlimited budget keeps every batch and reports the estimate"""
+        batches = [{"a.py": {"tokens": 5}}, {"b.py": {"tokens": 5}}]
+
+        kept, trimmed, estimated = fit_batches(batches, None, cost)
+
+        self.assertEqual(kept, batches)
+        self.assertEqual(trimmed, [])
+        self.assertEqual(estimated, 30)
+
+    def test_fit_batches_cuts_first_batch_over_budget(self):
+        """Test the batch that crosses the budget is cut down and later batches are dropped"""
+        batches = [
+            {"a.py": {"tokens": 20}},
+            {"b.py": {"tokens": 10}, "c.py": {"tokens": 10}},
+            {"d.py": {"tokens": 5}},
+        ]
+
+        kept, trimmed, estimated = fit_batches(batches, 55, cost)
+
+        self.assertEqual(kept, [{"a.py": {"tokens": 20}}, {"b.py": {"tokens": 10}}])
+        self.assertEqual(trimmed, ["c.py", "d.py"])
+        self.assertEqual(estimated, 50)
+
+    def test_fit_batches_with_nothing_fitting(self):
+        """Test a budget below the cheapest batch keeps nothing"""
+        kept, trimmed, estimated = fit_batches([{"a.py": {"tokens": 20}}], 15, cost)
+
+        self.assertEqual(kept, [])
+        self.assertEqual(trimmed, ["a.py"])
+        self.assertEqual(estimated, 0)
+
+    def test_tenant_budget_reserve_settle_and_window(self):
+        """Test reservations are replaced by actual usage and the window resets"""
+        budgets = TenantBudgets(tokens_per_window=1000, window_seconds=60)
+
+        with patch("token_budget.time.time", return_value=100.0):
+            budgets.reserve("acme", 400)
+            self.assertEqual(budgets.remaining("acme"), 600)
+            budgets.settle("acme", 400, 250)
+            self.assertEqual(budgets.remaining("acme"), 750)
+        with patch("token_budget.time.time", return_value=161.0):
+            self.assertEqual(budgets.remaining("acme"), 1000)
+
+    def test_unlimited_budgets_track_nothing(self):
+        """Test a zero limit or a missing tenant means no budget"""
+        budgets = TenantBudgets()
+        budgets.reserve("acme", 10 ** 9)
+
+        self.assertIsNone(budgets.remaining("acme"))
+        self.assertIsNone(TenantBudgets(1000).remaining(None))
+
+if __name__ == "__main__":
+    unittest.main()
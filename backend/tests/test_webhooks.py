@@ -0,0 +1,151 @@
+import unittest
+import sys
+import os
+import hmac
+import asyncio
+import hashlib
+
+# Add the parent directory to sys.path to import the modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import CodeChange, Issue, IssueLabel, ReviewResponse, SkippedFile, TestSuggestion
+from webhooks import WebhookReviewer, verify_signature
+
+def _change(path, sha):
+    return CodeChange(file_path=path, content=f"# {sha}", diff="+x", sha=sha)
+
+def _review_of(changes):
+    """Fake LLM review with one issue and one test suggestion per file"""
+    return ReviewResponse(
+        issues=[Issue(title=f"Issue in {change.file_path}@{change.sha}", file_path=change.file_path,
+                      description="d", labels=[IssueLabel.STYLE]) for change in changes],
+        test_suggestions=[TestSuggestion(file_path=change.file_path, test_description="t") for change in changes],
+        summary=f"Reviewed {len(changes)} files",
+        suggested_labels=[IssueLabel.STYLE],
+        total_files_analyzed=len(changes),
+        analysis_time_seconds=0.0
+    )
+
+class TestWebhooks(unittest.TestCase):
+
+    def setUp(self):
+        self.pr_files = {}
+        self.reviewed = []
+
+        async def fetch_changes(owner, repo, pr_number):
+            return list(self.pr_files.values())
+
+        async def review(changes, settings, head_sha, tenant):
+            self.reviewed.append((head_sha, sorted(change.file_path for change in changes)))
+            return _review_of(changes)
+
+        self.reviewer = WebhookReviewer(fetch_changes, review, debounce_seconds=0.05)
+
+    def test_verify_signature(self):
+        """Test only deliveries signed with the shared secret are accepted"""
+        body = b'{"action": "opened"}'
+        signature = "sha256=" + hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        self.assertTrue(verify_signature("secret", body, signature))
+        self.assertFalse(verify_signature("other", body, signature))
+        self.assertFalse(verify_signature("secret", body + b" ", signature))
+        self.assertFalse(verify_signature("secret", body, None))
+        self.assertFalse(verify_signature(None, body, signature))
+
+    def test_rereview_only_sends_changed_files(self):
+        """Test a second push re-analyzes changed files and carries over the rest"""
+        self.pr_files = {path: _change(path, "v1") for path in ("a.py", "b.py", "c.py")}
+        asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head1"))
+
+        self.pr_files["b.py"] = _change("b.py", "v2")
+        del self.pr_files["c.py"]
+        self.pr_files["d.py"] = _change("d.py", "v1")
+        result = asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head2"))
+
+        self.assertEqual(self.reviewed[1], ("head2", ["b.py", "d.py"]))
+        titles = sorted(issue.title for issue in result.issues)
+        self.assertEqual(titles, ["Issue in a.py@v1", "Issue in b.py@v2", "Issue in d.py@v1"])
+        self.assertEqual(sorted(s.file_path for s in result.test_suggestions), ["a.py", "b.py", "d.py"])
+        self.assertEqual(result.total_files_analyzed, 3)
+        self.assertEqual(self.reviewer.last_review("owner", "repo", 1).head_sha, "head2")
+
+    def test_unchanged_push_skips_llm(self):
+        """Test a push that changes no file contents reuses the previous review"""
+        self.pr_files = {"a.py": _change("a.py", "v1")}
+        first = asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head1"))
+        second = asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head2"))
+
+        self.assertEqual(len(self.reviewed), 1)
+        self.assertEqual(second.issues, first.issues)
+        self.assertEqual(second.summary, first.summary)
+
+    def test_trimmed_and_skipped_files_are_sent_again(self):
+        """Test files the budget left out or the review skipped are not remembered as reviewed"""
+        async def review(changes, settings, head_sha, tenant):
+            self.reviewed.append((head_sha, sorted(change.file_path for change in changes)))
+            response = _review_of([change for change in changes if change.file_path == "a.py"])
+            # As LLMService reports them
+            response.skipped_files = [SkippedFile(file_path=change.file_path, reason=change.skip_reason)
+                                      for change in changes if change.skip_reason]
+            if head_sha == "head1":
+                response.token_usage.trimmed_files = ["b.py"]
+            return response
+
+        self.reviewer.review = review
+        self.pr_files = {
+            "a.py": _change("a.py", "v1"),
+            "b.py": _change("b.py", "v1"),
+            "logo.png": CodeChange(file_path="logo.png", content="", skip_reason="binary", sha="png1"),
+        }
+        asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head1"))
+        second = asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head2"))
+        asyncio.run(self.reviewer.review_pull_request("owner", "repo", 1, "head3"))
+
+        self.assertEqual(self.reviewed[1], ("head2", ["b.py", "logo.png"]))
+        self.assertEqual(self.reviewer.last_review("owner", "repo", 1).file_shas, {"a.py": "v1", "b.py": "v1"})
+        self.assertEqual([skipped.file_path for skipped in second.skipped_files], ["logo.png"])
+        # Only the skipped file differs from what was reviewed, so the model is not asked again
+        self.assertEqual(len(self.reviewed), 2)
+        self.assertEqual([skipped.file_path for skipped in self.reviewer.last_review("owner", "repo", 1)
+                          .response.skipped_files], ["logo.png"])
+
+    def test_rapid_pushes_review_latest_sha_once(self):
+        """Test pushes inside the debounce window collapse into one review of the newest commit"""
+        self.pr_files = {"a.py": _change("a.py", "v1")}
+
+        async def run():
+            for head_sha in ("head1", "head2", "head3"):
+                self.reviewer.schedule("owner", "repo", 1, head_sha)
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.2)
+
+        asyncio.run(run())
+
+        self.assertEqual(self.reviewed, [("head3", ["a.py"])])
+
+    def test_stop_waits_for_running_reviews_and_drops_waiting_ones(self):
+        """Test shutting down finishes a review in progress and cancels one still in its debounce"""
+        self.pr_files = {"a.py": _change("a.py", "v1")}
+        review = self.reviewer.review
+
+        async def slow_review(*args):
+            await asyncio.sleep(0.1)
+            return await review(*args)
+
+        self.reviewer.review = slow_review
+
+        async def run():
+            self.reviewer.schedule("owner", "repo", 1, "head1")
+            await asyncio.sleep(0.08)
+            self.reviewer.debounce_seconds = 10
+            self.reviewer.schedule("owner", "repo", 2, "head1")
+            await self.reviewer.stop(timeout=5)
+
+        asyncio.run(run())
+
+        self.assertEqual(self.reviewed, [("head1", ["a.py"])])
+        self.assertIsNotNone(self.reviewer.last_review("owner", "repo", 1))
+        self.assertIsNone(self.reviewer.last_review("owner", "repo", 2))
+
+if __name__ == '__main__':
+    unittest.main()
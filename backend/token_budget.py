@@ -0,0 +1,101 @@
+"""
+Token budgets for reviews.
+
+Before any LLM call, the cost of every batch is estimated from its prompt
+size plus the output tokens reserved for the answer. A review may spend at
+most its per-request budget (ReviewSettings.token_budget, defaulting to
+REVIEW_TOKEN_BUDGET) and whatever its tenant has left in the current window
+(TENANT_TOKEN_BUDGET per TENANT_BUDGET_WINDOW_SECONDS). When the estimate is
+over budget, files are dropped from the end of the review until it fits and
+are reported back as trimmed.
+
+Tenant usage is kept in-process; each server worker enforces its own share.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+class TokenBudgetExceeded(Exception):
+    """Raised when not even one file of a review fits in the remaining budget"""
+
+class TenantBudgets:
+    def __init__(self, tokens_per_window: int = 0, window_seconds: float = 86400):
+        """Allow each tenant tokens_per_window tokens per window_seconds; 0 means unlimited"""
+        self.tokens_per_window = tokens_per_window
+        self.window_seconds = window_seconds
+        self._usage: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def remaining(self, tenant: Optional[str]) -> Optional[int]:
+        """Tokens the tenant may still spend in this window, or None when unlimited"""
+        if not self.tokens_per_window or tenant is None:
+            return None
+        with self._lock:
+            return max(self.tokens_per_window - self._used(tenant), 0)
+
+    def reserve(self, tenant: Optional[str], tokens: int):
+        """Count an estimated spend up front so concurrent reviews cannot overshoot together"""
+        self._add(tenant, tokens)
+
+    def settle(self, tenant: Optional[str], reserved: int, actual: int):
+        """Replace a reservation with what the review really used"""
+        self._add(tenant, actual - reserved)
+
+    def _add(self, tenant: Optional[str], tokens: int):
+        if not self.tokens_per_window or tenant is None:
+            return
+        with self._lock:
+            self._used(tenant)
+            started, used = self._usage[tenant]
+            self._usage[tenant] = (started, max(used + tokens, 0))
+
+    def _used(self, tenant: str) -> int:
+        """Tokens used in the tenant's current window, starting a new one when it has expired; caller holds the lock"""
+        now = time.time()
+        started, used = self._usage.get(tenant, (now, 0))
+        if now - started >= self.window_seconds:
+            started, used = now, 0
+        self._usage[tenant] = (started, used)
+        return used
+
+def fit_batches(batches: List[Dict[str, Dict[str, Any]]], budget: Optional[int],
+                batch_cost: Callable[[Dict[str, Dict[str, Any]]], int]) -> Tuple[List[Dict[str, Dict[str, Any]]], List[str], int]:
+    """
+    Keep batches, in order, while their estimated cost fits the budget; the
+    first batch that does not fit is cut down file by file and everything after
+    it is dropped. Returns (kept batches, trimmed file paths, estimated cost).
+    """
+    kept: List[Dict[str, Dict[str, Any]]] = []
+    trimmed: List[str] = []
+    used = 0
+    for batch in batches:
+        if trimmed:
+            trimmed.extend(path for path in batch if path not in trimmed)
+            continue
+        cost = batch_cost(batch)
+        if budget is None or used + cost <= budget:
+            kept.append(batch)
+            used += cost
+            continue
+
+        files = list(batch.items())
+        while files:
+            path, _ = files.pop()
+            if path not in trimmed:
+                trimmed.append(path)
+            if files and used + batch_cost(dict(files)) <= budget:
+                kept.append(dict(files))
+                used += batch_cost(kept[-1])
+                break
+
+    # Parts of a split file can land in kept and trimmed batches; it was only partly reviewed
+    return kept, trimmed, used
+
+def tenant_budgets_from_env() -> TenantBudgets:
+    """Build tenant budgets from TENANT_TOKEN_BUDGET and TENANT_BUDGET_WINDOW_SECONDS"""
+    return TenantBudgets(
+        int(os.getenv("TENANT_TOKEN_BUDGET", 0)),
+        float(os.getenv("TENANT_BUDGET_WINDOW_SECONDS", 86400))
+    )
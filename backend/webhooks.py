@@ -0,0 +1,211 @@
+"""
+GitHub webhook handling for automatic pull request reviews.
+
+Deliveries are authenticated with the X-Hub-Signature-256 HMAC. Pushes to a
+pull request are debounced: each event restarts a short timer and only the
+newest head SHA is reviewed once the PR has been quiet for that long.
+
+Re-reviews are incremental. The reviewer remembers the blob SHA of every file
+the LLM reviewed at the last reviewed commit; on the next push only files
+whose blob SHA changed, or that were skipped or left out for the token
+budget last time, are sent to the LLM, and issues and test suggestions for
+the other files are carried over from the previous ReviewResponse.
+"""
+
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from issue_ranking import rank_issues
+from models import CodeChange, IssueLabel, ReviewResponse, ReviewSettings, SkippedFile
+
+logger = logging.getLogger(__name__)
+
+PullRequestKey = Tuple[str, str, int]
+
+def verify_signature(secret: Optional[str], body: bytes, signature: Optional[str]) -> bool:
+    """Check a delivery's X-Hub-Signature-256 header against the shared webhook secret"""
+    if not secret or not signature or not signature.startswith("sha256="):
+        return False
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+class PullRequestReview(BaseModel):
+    """The last review of a pull request and the file versions it covered"""
+    head_sha: str
+    file_shas: Dict[str, Optional[str]]
+    response: ReviewResponse
+
+def carry_over_review(previous: ReviewResponse, unchanged_paths: List[str],
+                      fresh: Optional[ReviewResponse], max_issues: int, total_files: int) -> ReviewResponse:
+    """
+    Combine a fresh review of the changed files with what the previous review
+    found in files that did not change
+    """
+    kept = set(unchanged_paths)
+    issues = [issue for issue in previous.issues if issue.file_path in kept]
+    test_suggestions = [suggestion for suggestion in previous.test_suggestions if suggestion.file_path in kept]
+    summary = previous.summary
+    analysis_time = 0.0
+    if fresh is not None:
+        issues = fresh.issues + issues
+        test_suggestions = fresh.test_suggestions + test_suggestions
+        summary = fresh.summary
+        analysis_time = fresh.analysis_time_seconds
+
+    suggested_labels: List[IssueLabel] = list(fresh.suggested_labels) if fresh is not None else []
+    for issue in issues:
+        for label in issue.labels:
+            if label not in suggested_labels:
+                suggested_labels.append(label)
+
+    return ReviewResponse(
+        # A finding in the fresh review and the one carried over count once
+        issues=rank_issues(issues, max_issues),
+        test_suggestions=test_suggestions,
+        summary=summary,
+        suggested_labels=suggested_labels,
+        total_files_analyzed=total_files,
+        analysis_time_seconds=analysis_time,
+        skipped_files=(fresh.skipped_files if fresh is not None else [])
+                      + [skipped for skipped in previous.skipped_files if skipped.file_path in kept]
+    )
+
+class WebhookReviewer:
+    def __init__(self,
+                 fetch_changes: Callable[[str, str, int], Awaitable[List[CodeChange]]],
+                 review: Callable[[List[CodeChange], ReviewSettings, str, str], Awaitable[ReviewResponse]],
+                 settings: Optional[ReviewSettings] = None,
+                 debounce_seconds: float = 30.0,
+                 max_tracked_prs: int = 500,
+                 on_review: Optional[Callable[[str, str, int, ReviewResponse], Awaitable[None]]] = None):
+        """
+        Review pull requests `debounce_seconds` after their last push, remembering
+        the latest review of up to max_tracked_prs pull requests. Reviews are
+        charged to the repository owner's token budget.
+        """
+        self.fetch_changes = fetch_changes
+        self.review = review
+        self.settings = settings or ReviewSettings()
+        self.debounce_seconds = debounce_seconds
+        self.max_tracked_prs = max_tracked_prs
+        self.on_review = on_review
+        self._reviews: "OrderedDict[PullRequestKey, PullRequestReview]" = OrderedDict()
+        self._latest: Dict[PullRequestKey, str] = {}
+        self._pending: Dict[PullRequestKey, asyncio.Task] = {}
+        self._locks: Dict[PullRequestKey, asyncio.Lock] = {}
+        # Debounced tasks that are past their wait and reviewing
+        self._reviewing: Set[asyncio.Task] = set()
+
+    def schedule(self, owner: str, repo: str, pr_number: int, head_sha: str):
+        """Review the PR once no newer push has arrived for debounce_seconds"""
+        key = (owner, repo, pr_number)
+        self._latest[key] = head_sha
+        pending = self._pending.get(key)
+        if pending is not None and not pending.done():
+            # A newer push supersedes the waiting (or still running) review of an older commit
+            pending.cancel()
+        self._pending[key] = asyncio.create_task(self._debounced(key, head_sha))
+        logger.info(f"Scheduled review of {owner}/{repo}#{pr_number} at {head_sha} in {self.debounce_seconds}s")
+
+    def last_review(self, owner: str, repo: str, pr_number: int) -> Optional[PullRequestReview]:
+        return self._reviews.get((owner, repo, pr_number))
+
+    async def stop(self, timeout: float = 0.0):
+        """
+        Give reviews already running up to timeout seconds to finish and cancel
+        the rest, including those still waiting out their debounce
+        """
+        waiting = [task for task in self._pending.values() if not task.done() and task not in self._reviewing]
+        if waiting:
+            logger.warning(f"Dropping {len(waiting)} webhook reviews still waiting for their debounce")
+        for task in waiting:
+            task.cancel()
+        if timeout > 0 and self._reviewing:
+            logger.info(f"Waiting up to {timeout:.0f}s for {len(self._reviewing)} running webhook reviews")
+            await asyncio.wait(set(self._reviewing), timeout=timeout)
+        tasks = [task for task in self._pending.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _debounced(self, key: PullRequestKey, head_sha: str):
+        await asyncio.sleep(self.debounce_seconds)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            if self._latest.get(key) != head_sha:
+                return
+            task = asyncio.current_task()
+            self._reviewing.add(task)
+            try:
+                await self.review_pull_request(*key, head_sha)
+            except Exception as e:
+                logger.error(f"Webhook review of {key[0]}/{key[1]}#{key[2]} failed: {str(e)}")
+            finally:
+                self._reviewing.discard(task)
+                if self._latest.get(key) == head_sha:
+                    del self._latest[key]
+                    self._pending.pop(key, None)
+                    self._locks.pop(key, None)
+
+    async def review_pull_request(self, owner: str, repo: str, pr_number: int, head_sha: str) -> ReviewResponse:
+        """Review the PR at head_sha, sending only files changed since the last reviewed commit"""
+        start_time = time.time()
+        key = (owner, repo, pr_number)
+        changes = await self.fetch_changes(owner, repo, pr_number)
+        previous = self._reviews.get(key)
+
+        if previous is None:
+            changed = changes
+        else:
+            changed = [change for change in changes
+                       if not change.sha or previous.file_shas.get(change.file_path) != change.sha]
+        changed_paths = {change.file_path for change in changed}
+        unchanged_paths = [change.file_path for change in changes if change.file_path not in changed_paths]
+        logger.info(f"Re-analyzing {len(changed)} of {len(changes)} files in {owner}/{repo}#{pr_number}")
+
+        # Skipped files reach no model, so only ask for a review when something can be sent
+        sent = [change for change in changed if not change.skip_reason]
+        fresh = await self.review(changed, self.settings, head_sha, owner) if sent else None
+        if previous is None:
+            response = fresh or ReviewResponse(total_files_analyzed=0, analysis_time_seconds=0.0)
+        else:
+            response = carry_over_review(previous.response, unchanged_paths, fresh, self.settings.max_issues,
+                                         len([change for change in changes if not change.skip_reason]))
+        if fresh is None:
+            response.skipped_files += [
+                SkippedFile(file_path=change.file_path, reason=change.skip_reason, size=change.size)
+                for change in changed if change.skip_reason
+            ]
+        response.analysis_time_seconds = time.time() - start_time
+
+        # Only files the model saw count as reviewed; trimmed and skipped ones are sent again on the next push
+        trimmed = set(fresh.token_usage.trimmed_files) if fresh is not None else set()
+        file_shas = {path: previous.file_shas[path] for path in unchanged_paths} if previous is not None else {}
+        file_shas.update({change.file_path: change.sha for change in sent if change.file_path not in trimmed})
+        self._reviews[key] = PullRequestReview(head_sha=head_sha, file_shas=file_shas, response=response)
+        self._reviews.move_to_end(key)
+        while len(self._reviews) > self.max_tracked_prs:
+            self._reviews.popitem(last=False)
+
+        if self.on_review is not None:
+            await self.on_review(owner, repo, pr_number, response)
+        return response
+
+def webhook_reviewer_from_env(fetch_changes, review, on_review=None) -> WebhookReviewer:
+    """Build the webhook reviewer configured by WEBHOOK_DEBOUNCE_SECONDS and WEBHOOK_APPLY_LABELS"""
+    settings = ReviewSettings(apply_labels=os.getenv("WEBHOOK_APPLY_LABELS", "false").lower() == "true")
+    return WebhookReviewer(
+        fetch_changes,
+        review,
+        settings=settings,
+        debounce_seconds=float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", 30)),
+        on_review=on_review
+    )